@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+import copy
+import json
+import os
+import sys
+import time
+
+# Benchmarks run from the repository root or the benchmarks directory
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from thoughtspot_rest_api_v1 import TSRestApiV1
+from connection_catalog import ConnectionCatalog, TableSelection
+from endpoint_method_classes import ConnectionMethods
+
+#
+# Compares building the connection update payload with TSRestApiV1.get_selected_tables_from_connection /
+# add_new_tables_to_connection and with ConnectionMethods.add_new_tables_to_connection (TableSelection), on a
+# synthetic catalog. Both paths build the whole payload, including the columns of every new table, and the
+# payloads are checked to be the same before the times are compared.
+# No ThoughtSpot server is needed: connection_fetch_live_columns is replaced with a stub that returns one column,
+# so only the local work is timed. ConnectionMethods runs the stub calls on one thread (max_workers=1), so
+# the thread pool's overlap of real requests is not counted in its favour.
+#
+# Usage: python benchmarks/connection_table_selection_benchmark.py [total_tables] [tables_to_add]
+#
+
+
+def build_synthetic_catalog(total_tables: int, databases: int = 10, schemas_per_database: int = 10):
+    tables_per_schema = max(1, total_tables // (databases * schemas_per_database))
+    external_databases = []
+    for d in range(databases):
+        db = {'name': 'DB_{}'.format(d), 'schemas': []}
+        for s in range(schemas_per_database):
+            schema = {'name': 'SCHEMA_{}'.format(s), 'tables': []}
+            for t in range(tables_per_schema):
+                # A few tables already imported, so the update must keep their databases
+                schema['tables'].append({'name': 'TABLE_{}'.format(t), 'type': 'TABLE',
+                                         'selected': (t % 1000 == 0), 'linked': (t % 1000 == 0)})
+            db['schemas'].append(schema)
+        external_databases.append(db)
+    return external_databases
+
+
+def build_tables_to_add_map(tables_to_add: int, databases: int = 10, schemas_per_database: int = 10):
+    per_schema = max(1, tables_to_add // (databases * schemas_per_database))
+    tables_to_add_map = {}
+    for d in range(databases):
+        tables_to_add_map['DB_{}'.format(d)] = {}
+        for s in range(schemas_per_database):
+            # Every other table, so the list lookups have to scan deep into the list
+            tables_to_add_map['DB_{}'.format(d)]['SCHEMA_{}'.format(s)] = ['TABLE_{}'.format(t * 2)
+                                                                            for t in range(per_schema)]
+    return tables_to_add_map
+
+
+def time_call(label, func):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    print('{:<45} {:>10.3f} s'.format(label, elapsed))
+    return result, elapsed
+
+
+def main():
+    total_tables = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    tables_to_add = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+
+    print('Synthetic catalog: {} tables, adding {}'.format(total_tables, tables_to_add))
+    catalog = build_synthetic_catalog(total_tables)
+    tables_to_add_map = build_tables_to_add_map(tables_to_add)
+
+    # Stub out the per-table REST API call so only the local work is measured
+    ts = TSRestApiV1(server_url='http://benchmark.invalid')
+    ts.connection_fetch_live_columns = lambda **kwargs: {kwargs['table_name']: [{'name': 'ID', 'type': 'INT64'}]}
+    connection_methods = ConnectionMethods(ts)
+
+    # The list-based path changes the catalog it is given, so both paths get their own copy
+    def list_based():
+        external_databases = copy.deepcopy(catalog)
+        selected = TSRestApiV1.get_selected_tables_from_connection(external_databases, tables_to_add_map)
+        return ts.add_new_tables_to_connection(selected, tables_to_add_map, connection_guid='benchmark',
+                                               config_json={})
+
+    def indexed():
+        external_databases = copy.deepcopy(catalog)
+        return connection_methods.add_new_tables_to_connection(external_databases, tables_to_add_map,
+                                                               connection_guid='benchmark', config_json={},
+                                                               max_workers=1)
+
+    # deepcopy is included in both, time it on its own to subtract
+    _, copy_time = time_call('deepcopy of catalog (baseline)', lambda: copy.deepcopy(catalog))
+    list_payload, list_time = time_call('TSRestApiV1 payload', list_based)
+    indexed_payload, indexed_time = time_call('ConnectionMethods payload', indexed)
+    _, select_time = time_call('  of which TableSelection.select',
+                               lambda: TableSelection(tables_to_add_map).select(catalog))
+    _, index_time = time_call('ConnectionCatalog index build', lambda: ConnectionCatalog(catalog))
+
+    if json.dumps(list_payload, sort_keys=True) != json.dumps(indexed_payload, sort_keys=True):
+        print('The payloads differ, so the times are not comparable')
+        sys.exit(1)
+    new_tables = sum([len(t.get('columns', [])) > 0 for db in indexed_payload['externalDatabases']
+                      for schema in db['schemas'] for t in schema['tables']])
+    print('Same payload from both, {} tables with new columns'.format(new_tables))
+    list_only = max(list_time - copy_time, 1e-9)
+    indexed_only = max(indexed_time - copy_time, 1e-9)
+    print('Speed-up excluding deepcopy: {:.1f}x'.format(list_only / indexed_only))
+    # With stubbed calls, the rest of the ConnectionMethods time is the thread pool's overhead per table, which
+    # real connection_fetch_live_columns requests (run concurrently) more than make up for
+    print('ConnectionMethods time outside selection: {:.3f} s'.format(max(indexed_time - copy_time - select_time, 0)))
+
+
+if __name__ == '__main__':
+    main()
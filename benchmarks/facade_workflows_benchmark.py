@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+# Benchmarks run from the repository root or the benchmarks directory
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from thoughtspot import ThoughtSpot
+from endpoint_method_classes import run_concurrently
+from mock_thoughtspot_server import MockThoughtSpotServer, SyntheticPopulation
+
+#
+# Times common workflows through the ThoughtSpot facade against the local mock server
+# (mock_thoughtspot_server.py), so client-side changes can be measured without a cluster:
+#   inventory         list every object type, then metadata/details in batches
+#   bulk_export       TML export of every Liveboard and Answer, concurrently
+#   permission_audit  load all principals, then security/metadata/permissions in batches per type
+#   release_import    TML import of the exported Liveboards and Answers in batches
+#   search_paging     page through searchdata rows with DataMethods
+#
+# Each workflow is run --repeat times and the median is reported, with the number of requests it made.
+# --history appends the results to a JSON file under a --label (default: git describe), and the run is compared
+# with the previous entry in that file (or --baseline). Any workflow slower than --threshold percent is reported
+# as a regression and the script exits with status 1, so it can gate CI.
+#
+# Usage: python benchmarks/facade_workflows_benchmark.py [--latency_ms 5] [--repeat 3] [--history results.json]
+#
+
+WORKFLOWS = ['inventory', 'bulk_export', 'permission_audit', 'release_import', 'search_paging']
+
+
+def batches(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def inventory(ts: ThoughtSpot, context: dict):
+    object_lists = {'answer': ts.answer.list(), 'liveboard': ts.liveboard.list(),
+                    'worksheet': ts.worksheet.list(), 'table': ts.table.list()}
+    for name, headers in object_lists.items():
+        object_type = getattr(ts, name).metadata_name
+        for batch in batches([h['id'] for h in headers], 100):
+            ts.tsrest.metadata_details(object_type=object_type, object_guids=batch)
+    context['liveboard_guids'] = [h['id'] for h in object_lists['liveboard']]
+    context['answer_guids'] = [h['id'] for h in object_lists['answer']]
+    context['worksheet_guids'] = [h['id'] for h in object_lists['worksheet']]
+
+
+def bulk_export(ts: ThoughtSpot, context: dict, max_workers: int):
+    guids = context['liveboard_guids'] + context['answer_guids']
+    results = run_concurrently(ts.tml.export_tml, guids, max_workers=max_workers)
+    context['exported_tml'] = [r['response'] for r in results.succeeded]
+
+
+def permission_audit(ts: ThoughtSpot, context: dict):
+    ts.principals.load()
+    for object_type, guids in [(ts.liveboard.metadata_name, context['liveboard_guids']),
+                               (ts.answer.metadata_name, context['answer_guids'])]:
+        for batch in batches(guids, 50):
+            ts.tsrest.security_metadata_permissions(object_type=object_type, object_guids=batch)
+
+
+def release_import(ts: ThoughtSpot, context: dict):
+    for batch in batches(context['exported_tml'], 20):
+        ts.tml.import_tml(batch)
+
+
+def search_paging(ts: ThoughtSpot, context: dict):
+    worksheet_guid = context['worksheet_guids'][0]
+    for row in ts.data.iter_searchdata_rows(query_string='[Region] [Sales]', data_source_guid=worksheet_guid,
+                                            batch_size=1000):
+        pass
+
+
+def run_workflows(server: MockThoughtSpotServer, repeat: int, max_workers: int) -> dict:
+    timings = {w: [] for w in WORKFLOWS}
+    requests_made = {}
+    for i in range(repeat):
+        # A new facade every repeat, so no client state carries over between runs
+        ts = ThoughtSpot(server_url=server.url)
+        ts.login(username='tsadmin', password='admin')
+        context = {}
+        steps = [('inventory', lambda: inventory(ts, context)),
+                 ('bulk_export', lambda: bulk_export(ts, context, max_workers)),
+                 ('permission_audit', lambda: permission_audit(ts, context)),
+                 ('release_import', lambda: release_import(ts, context)),
+                 ('search_paging', lambda: search_paging(ts, context))]
+        for name, step in steps:
+            server.reset_counts()
+            start = time.perf_counter()
+            step()
+            timings[name].append(time.perf_counter() - start)
+            requests_made[name] = server.total_requests()
+
+    results = {}
+    for name in WORKFLOWS:
+        results[name] = {'median_seconds': statistics.median(timings[name]),
+                         'min_seconds': min(timings[name]),
+                         'requests': requests_made[name]}
+    return results
+
+
+def default_label() -> str:
+    try:
+        return subprocess.check_output(['git', 'describe', '--always', '--dirty'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return datetime.datetime.now().strftime('%Y%m%d%H%M%S')
+
+
+def compare(results: dict, baseline: dict, threshold_percent: float) -> list:
+    regressions = []
+    for name, r in results.items():
+        if name not in baseline['results']:
+            continue
+        before = baseline['results'][name]['median_seconds']
+        after = r['median_seconds']
+        change = (after - before) / before * 100 if before > 0 else 0.0
+        flag = ''
+        if change > threshold_percent:
+            flag = 'REGRESSION'
+            regressions.append(name)
+        print('{:<20} {:>10.3f} s -> {:>10.3f} s  {:>+7.1f}%  {}'.format(name, before, after, change, flag))
+    return regressions
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description='Benchmark ThoughtSpot facade workflows against a mock server')
+    parser.add_argument("--latency_ms", type=float, default=5, help="mock server latency per request.")
+    parser.add_argument("--jitter_ms", type=float, default=0)
+    parser.add_argument("--per_object_latency_ms", type=float, default=0.5)
+    parser.add_argument("--answers", type=int, default=500)
+    parser.add_argument("--liveboards", type=int, default=200)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--groups", type=int, default=50)
+    parser.add_argument("--search_rows", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max_workers", type=int, default=8)
+    parser.add_argument("--history", type=str, required=False, help="JSON file of results to append to.")
+    parser.add_argument("--label", type=str, required=False, help="name for this run, default git describe.")
+    parser.add_argument("--baseline", type=str, required=False,
+                        help="label in --history to compare with, default the previous run.")
+    parser.add_argument("--threshold", type=float, default=10, help="percent slower that counts as a regression.")
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+    population = SyntheticPopulation(answers=args.answers, liveboards=args.liveboards, users=args.users,
+                                     groups=args.groups, search_rows=args.search_rows)
+    with MockThoughtSpotServer(population=population, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                               per_object_latency_ms=args.per_object_latency_ms) as server:
+        results = run_workflows(server, repeat=args.repeat, max_workers=args.max_workers)
+
+    print('{:<20} {:>12} {:>12} {:>10}'.format('workflow', 'median (s)', 'min (s)', 'requests'))
+    for name, r in results.items():
+        print('{:<20} {:>12.3f} {:>12.3f} {:>10}'.format(name, r['median_seconds'], r['min_seconds'], r['requests']))
+
+    if args.history is None:
+        return 0
+
+    history = []
+    if os.path.exists(args.history):
+        with open(args.history, 'r', encoding='utf-8') as fh:
+            history = json.load(fh)
+
+    baseline = None
+    if args.baseline is not None:
+        matches = [h for h in history if h['label'] == args.baseline]
+        if len(matches) == 0:
+            print('No run labelled {} in {}'.format(args.baseline, args.history), file=sys.stderr)
+            return 2
+        baseline = matches[-1]
+    elif len(history) > 0:
+        baseline = history[-1]
+
+    # Only comparable when the mock configuration is the same
+    config = {k: v for k, v in vars(args).items() if k not in ['history', 'label', 'baseline', 'threshold']}
+    regressions = []
+    if baseline is not None:
+        if baseline.get('config') != config:
+            print('Baseline {} used a different configuration, not comparing'.format(baseline['label']))
+        else:
+            print('\nCompared with {}'.format(baseline['label']))
+            regressions = compare(results, baseline, args.threshold)
+
+    history.append({'label': args.label if args.label else default_label(),
+                    'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+                    'python': platform.python_version(),
+                    'config': config,
+                    'results': results})
+    with open(args.history, 'w', encoding='utf-8') as fh:
+        json.dump(history, fh, indent=2)
+    return 1 if len(regressions) > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
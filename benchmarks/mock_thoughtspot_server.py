@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Optional, Dict, List
+from urllib.parse import urlparse, parse_qs
+
+#
+# Local stand-in for a ThoughtSpot cluster, for benchmarking the library without network or server variance.
+# Emulates the callosum/v1/tspublic/v1 endpoints used by the benchmarked workflows, with the response shapes
+# TSRestApiV1 expects, over a synthetic population of objects generated from a seed:
+#   session/login, session/logout
+#   metadata/listobjectheaders, metadata/details, metadata/tml/export, metadata/tml/import
+#   dependency/listdependents
+#   security/metadata/permissions, security/effectivepermissionbulk
+#   searchdata
+#   user, group (GET)
+# Every request sleeps latency_ms plus up to jitter_ms (per_object_latency_ms more for each object requested),
+# to model server time. The same seed always produces the same population.
+#
+# Use from a script:
+#   with MockThoughtSpotServer(latency_ms=20) as server:
+#       ts = ThoughtSpot(server_url=server.url)
+# or standalone:
+#   python benchmarks/mock_thoughtspot_server.py --port 8088 --latency_ms 20
+#
+
+# Headers are grouped by the 'type' used in metadata/listobjectheaders. Tables and Worksheets are both
+# LOGICAL_TABLE with a 'subtype'
+TYPE_ALIASES = {
+    'WORKSHEET': 'LOGICAL_TABLE',
+    'ONE_TO_ONE_LOGICAL': 'LOGICAL_TABLE',
+    'AGGR_WORKSHEET': 'LOGICAL_TABLE',
+    'SQL_VIEW': 'LOGICAL_TABLE'
+}
+
+
+class SyntheticPopulation:
+    def __init__(self, answers: int = 500, liveboards: int = 200, worksheets: int = 50, tables: int = 200,
+                 users: int = 500, groups: int = 50, search_rows: int = 10000, seed: int = 1):
+        rng = random.Random(seed)
+
+        def new_guid():
+            return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+        # type : List of headers
+        self.headers = {'QUESTION_ANSWER_BOOK': [], 'PINBOARD_ANSWER_BOOK': [], 'LOGICAL_TABLE': [],
+                        'USER': [], 'USER_GROUP': []}
+        self.by_guid = {}
+        base_modified = 1600000000000
+
+        def add(object_type, name, subtype=None):
+            header = {'id': new_guid(), 'name': name, 'type': object_type, 'author': 'tsadmin',
+                      'created': base_modified, 'modified': base_modified + rng.randint(0, 10 ** 9),
+                      'isExternal': False, 'tags': []}
+            if subtype is not None:
+                header['subtype'] = subtype
+            self.headers[object_type].append(header)
+            self.by_guid[header['id']] = header
+            return header
+
+        self.tables = [add('LOGICAL_TABLE', 'TABLE_{}'.format(i), 'ONE_TO_ONE_LOGICAL') for i in range(tables)]
+        self.worksheets = [add('LOGICAL_TABLE', 'Worksheet {}'.format(i), 'WORKSHEET') for i in range(worksheets)]
+        self.answers = [add('QUESTION_ANSWER_BOOK', 'Answer {}'.format(i)) for i in range(answers)]
+        self.liveboards = [add('PINBOARD_ANSWER_BOOK', 'Liveboard {}'.format(i)) for i in range(liveboards)]
+        self.users = [add('USER', 'user_{}'.format(i)) for i in range(users)]
+        self.groups = [add('USER_GROUP', 'group_{}'.format(i)) for i in range(groups)]
+
+        # Worksheets sit on tables, answers on worksheets, liveboards hold answers
+        self.sources = {}
+        self.dependents = {}
+        for ws in self.worksheets:
+            self.sources[ws['id']] = [t['id'] for t in rng.sample(self.tables, min(3, len(self.tables)))]
+        for a in self.answers:
+            if len(self.worksheets) > 0:
+                self.sources[a['id']] = [rng.choice(self.worksheets)['id']]
+        for lb in self.liveboards:
+            self.sources[lb['id']] = [a['id'] for a in rng.sample(self.answers, min(5, len(self.answers)))]
+        for guid, source_guids in self.sources.items():
+            for s in source_guids:
+                self.dependents.setdefault(s, []).append(guid)
+
+        # Each object shared with a few groups
+        self.permissions = {}
+        for guid in self.by_guid:
+            shared = rng.sample(self.groups, min(3, len(self.groups)))
+            self.permissions[guid] = {g['id']: rng.choice(['READ_ONLY', 'MODIFY']) for g in shared}
+        self.group_members = {g['id']: [u['id'] for u in rng.sample(self.users, min(20, len(self.users)))]
+                              for g in self.groups}
+
+        self.search_column_names = ['Region', 'Product', 'Date', 'Quantity', 'Sales']
+        regions = ['East', 'West', 'North', 'South']
+        self.search_rows = [[regions[i % 4], 'Product {}'.format(i % 97), 1600000000 + i * 86400, i % 13,
+                             round((i * 7.31) % 1000, 2)] for i in range(search_rows)]
+
+    def tml(self, header: Dict) -> Dict:
+        source_names = [self.by_guid[g]['name'] for g in self.sources.get(header['id'], [])]
+        if header['type'] == 'PINBOARD_ANSWER_BOOK':
+            return {'guid': header['id'], 'liveboard': {
+                'name': header['name'],
+                'visualizations': [{'id': 'Viz_{}'.format(i + 1), 'answer': {'name': n, 'tables': []}}
+                                   for i, n in enumerate(source_names)]}}
+        if header['type'] == 'QUESTION_ANSWER_BOOK':
+            return {'guid': header['id'], 'answer': {
+                'name': header['name'],
+                'tables': [{'id': n, 'name': n} for n in source_names],
+                'search_query': '[Region] [Sales]'}}
+        if header.get('subtype') == 'WORKSHEET':
+            return {'guid': header['id'], 'worksheet': {
+                'name': header['name'],
+                'tables': [{'name': n} for n in source_names],
+                'worksheet_columns': [{'name': c, 'column_id': '{}::{}'.format(source_names[0], c)}
+                                      for c in self.search_column_names] if len(source_names) > 0 else []}}
+        return {'guid': header['id'], 'table': {
+            'name': header['name'], 'db': 'DB', 'schema': 'PUBLIC', 'db_table': header['name'],
+            'columns': [{'name': c} for c in self.search_column_names]}}
+
+
+class MockThoughtSpotServer:
+    def __init__(self, population: Optional[SyntheticPopulation] = None, latency_ms: float = 0,
+                 jitter_ms: float = 0, per_object_latency_ms: float = 0, host: str = '127.0.0.1', port: int = 0):
+        self.population = population if population is not None else SyntheticPopulation()
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.per_object_latency_ms = per_object_latency_ms
+        # endpoint : count of requests received
+        self.request_counts = {}
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[0], self._httpd.server_address[1]
+        return 'http://{}:{}'.format(host, port)
+
+    def start(self) -> "MockThoughtSpotServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def total_requests(self) -> int:
+        with self._lock:
+            return sum(self.request_counts.values())
+
+    def reset_counts(self):
+        with self._lock:
+            self.request_counts = {}
+
+    def _simulate_latency(self, object_count: int = 1):
+        delay_ms = self.latency_ms + self.per_object_latency_ms * max(0, object_count - 1)
+        if self.jitter_ms > 0:
+            delay_ms += random.uniform(0, self.jitter_ms)
+        if delay_ms > 0:
+            time.sleep(delay_ms / 1000)
+
+    #
+    # Endpoint implementations: (params Dict of single values) -> (status, response object)
+    #
+    @staticmethod
+    def _json_list(params: Dict, key: str) -> Optional[List]:
+        if key not in params:
+            return None
+        return json.loads(params[key])
+
+    def _headers_of_type(self, object_type: str) -> List[Dict]:
+        return self.population.headers.get(TYPE_ALIASES.get(object_type, object_type), [])
+
+    def listobjectheaders(self, params: Dict):
+        headers = self._headers_of_type(params.get('type', ''))
+        subtypes = self._json_list(params, 'subtypes')
+        if subtypes is not None:
+            headers = [h for h in headers if h.get('subtype') in subtypes]
+        fetchids = self._json_list(params, 'fetchids')
+        if fetchids is not None:
+            wanted = set(fetchids)
+            headers = [h for h in headers if h['id'] in wanted]
+        if params.get('pattern'):
+            pattern = params['pattern'].replace('%', '').lower()
+            headers = [h for h in headers if pattern in h['name'].lower()]
+        offset = max(0, int(params.get('offset', -1)))
+        batchsize = int(params.get('batchsize', -1))
+        if batchsize > 0:
+            headers = headers[offset:offset + batchsize]
+        elif offset > 0:
+            headers = headers[offset:]
+        self._simulate_latency(len(headers) // 100 + 1)
+        return 200, headers
+
+    def details(self, params: Dict):
+        guids = self._json_list(params, 'id') or []
+        self._simulate_latency(len(guids))
+        storables = []
+        for g in guids:
+            if g not in self.population.by_guid:
+                return 400, {'debug': 'Object {} not found'.format(g)}
+            header = self.population.by_guid[g]
+            storables.append({'header': header,
+                              'reportContent': {'sheets': []},
+                              'dependents': self.population.dependents.get(g, [])})
+        return 200, {'storables': storables}
+
+    def tml_export(self, params: Dict):
+        guids = self._json_list(params, 'export_ids') or []
+        self._simulate_latency(len(guids))
+        objects = []
+        for g in guids:
+            header = self.population.by_guid.get(g)
+            if header is None:
+                objects.append({'info': {'id': g, 'status': {'status_code': 'ERROR',
+                                                              'error_message': 'Object not found'}}})
+                continue
+            # JSON is valid YAML, so the same edoc serves both formattypes
+            objects.append({'info': {'id': g, 'name': header['name'], 'type': header['type'],
+                                     'status': {'status_code': 'OK'}},
+                            'edoc': json.dumps(self.population.tml(header))})
+        return 200, {'object': objects}
+
+    def tml_import(self, params: Dict):
+        tml_list = json.loads(params.get('import_objects', '[]'))
+        self._simulate_latency(len(tml_list))
+        objects = []
+        for tml in tml_list:
+            if isinstance(tml, str):
+                tml = json.loads(tml)
+            object_type = [k for k in tml.keys() if k != 'guid']
+            if len(object_type) == 0:
+                objects.append({'response': {'status': {'status_code': 'ERROR', 'error_message': 'Invalid TML'}}})
+                continue
+            guid = tml.get('guid') if params.get('force_create') != 'true' else None
+            objects.append({'response': {'status': {'status_code': 'OK'},
+                                         'header': {'id_guid': guid if guid else str(uuid.uuid4()),
+                                                    'name': tml[object_type[0]].get('name'),
+                                                    'metadata_type': object_type[0]}}})
+        return 200, {'object': objects}
+
+    def listdependents(self, params: Dict):
+        guids = self._json_list(params, 'id') or []
+        self._simulate_latency(len(guids))
+        response = {}
+        for g in guids:
+            by_type = {}
+            for d in self.population.dependents.get(g, []):
+                header = self.population.by_guid[d]
+                by_type.setdefault(header['type'], []).append(header)
+            response[g] = by_type
+        return 200, response
+
+    def _permissions_for(self, guid: str) -> Dict:
+        return {'permissions': {p: {'shareMode': mode} for p, mode in self.population.permissions.get(guid, {}).items()}}
+
+    def metadata_permissions(self, params: Dict):
+        guids = self._json_list(params, 'id') or []
+        self._simulate_latency(len(guids))
+        return 200, {g: self._permissions_for(g) for g in guids}
+
+    def effectivepermissionbulk(self, params: Dict):
+        ids_by_type = self._json_list(params, 'idsbytype') or {}
+        guids = [g for type_guids in ids_by_type.values() for g in type_guids]
+        self._simulate_latency(len(guids))
+        return 200, {g: self._permissions_for(g) for g in guids}
+
+    def searchdata(self, params: Dict):
+        rows = self.population.search_rows
+        batchsize = int(params.get('batchsize', -1))
+        offset = max(0, int(params.get('offset', -1)))
+        page = rows[offset:offset + batchsize] if batchsize > 0 else rows[offset:]
+        self._simulate_latency(len(page) // 1000 + 1)
+        return 200, {'columnNames': self.population.search_column_names, 'data': page,
+                     'rowCount': len(page), 'pageSize': batchsize, 'pageNumber': -1, 'sampleRatio': 1}
+
+    def principals(self, params: Dict, object_type: str, guid: Optional[str]):
+        self._simulate_latency()
+        headers = self.population.headers[object_type]
+        if guid is not None:
+            for h in headers:
+                if h['id'] == guid:
+                    return 200, self._principal(h)
+            return 404, {'debug': 'Not found'}
+        if params.get('name'):
+            for h in headers:
+                if h['name'] == params['name']:
+                    return 200, self._principal(h)
+            return 404, {'debug': 'Not found'}
+        return 200, [self._principal(h) for h in headers]
+
+    def _principal(self, header: Dict) -> Dict:
+        groups = [g for g, members in self.population.group_members.items() if header['id'] in members]
+        return {'header': {'id': header['id'], 'name': header['name'], 'displayName': header['name'],
+                           'type': 'LOCAL_' + ('USER' if header['type'] == 'USER' else 'GROUP')},
+                'assignedGroups': groups, 'inheritedGroups': groups, 'privileges': []}
+
+    def route(self, method: str, endpoint: str, params: Dict):
+        if endpoint in ['session/login', 'session/logout']:
+            self._simulate_latency()
+            return 204, None
+        if endpoint == 'metadata/listobjectheaders':
+            return self.listobjectheaders(params)
+        if endpoint == 'metadata/details':
+            return self.details(params)
+        if endpoint == 'metadata/tml/export':
+            return self.tml_export(params)
+        if endpoint == 'metadata/tml/import':
+            return self.tml_import(params)
+        if endpoint == 'dependency/listdependents':
+            return self.listdependents(params)
+        if endpoint == 'security/metadata/permissions':
+            return self.metadata_permissions(params)
+        if endpoint == 'security/effectivepermissionbulk':
+            return self.effectivepermissionbulk(params)
+        if endpoint == 'searchdata':
+            return self.searchdata(params)
+        if method == 'GET' and endpoint == 'user':
+            return self.principals(params, 'USER', params.get('userid'))
+        if method == 'GET' and endpoint == 'group':
+            return self.principals(params, 'USER_GROUP', params.get('groupid'))
+        return 404, {'debug': 'Endpoint {} is not emulated'.format(endpoint)}
+
+    def _handler_class(self):
+        server = self
+        prefix = '/callosum/v1/tspublic/v1/'
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Keep-alive responses are written in pieces; with Nagle's algorithm on, each one waits ~40ms for an ACK
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def _handle(self, method: str):
+                parsed = urlparse(self.path)
+                params = {k: v[-1] for k, v in parse_qs(parsed.query).items()}
+                length = int(self.headers.get('Content-Length', 0))
+                if length > 0:
+                    body = self.rfile.read(length).decode('utf-8')
+                    if self.headers.get('Content-Type', '').startswith('application/json'):
+                        params.update(json.loads(body))
+                    else:
+                        params.update({k: v[-1] for k, v in parse_qs(body, keep_blank_values=True).items()})
+
+                endpoint = parsed.path[len(prefix):] if parsed.path.startswith(prefix) else parsed.path
+                endpoint = endpoint.rstrip('/')
+                with server._lock:
+                    server.request_counts[endpoint] = server.request_counts.get(endpoint, 0) + 1
+
+                status, response = server.route(method, endpoint, params)
+                payload = b'' if response is None else json.dumps(response).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                self._handle('GET')
+
+            def do_POST(self):
+                self._handle('POST')
+
+            def do_PUT(self):
+                self._handle('PUT')
+
+            def do_DELETE(self):
+                self._handle('DELETE')
+
+        return Handler
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description='Run a local mock ThoughtSpot server for benchmarks')
+    parser.add_argument("--port", type=int, default=8088)
+    parser.add_argument("--latency_ms", type=float, default=0, help="base latency added to every request.")
+    parser.add_argument("--jitter_ms", type=float, default=0, help="random extra latency, up to this much.")
+    parser.add_argument("--per_object_latency_ms", type=float, default=0,
+                        help="extra latency per object in multi-object requests.")
+    parser.add_argument("--answers", type=int, default=500)
+    parser.add_argument("--liveboards", type=int, default=200)
+    parser.add_argument("--worksheets", type=int, default=50)
+    parser.add_argument("--tables", type=int, default=200)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--groups", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = get_args()
+    population = SyntheticPopulation(answers=args.answers, liveboards=args.liveboards, worksheets=args.worksheets,
+                                     tables=args.tables, users=args.users, groups=args.groups, seed=args.seed)
+    mock_server = MockThoughtSpotServer(population=population, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                                        per_object_latency_ms=args.per_object_latency_ms, port=args.port)
+    print('Mock ThoughtSpot server at {}'.format(mock_server.url))
+    try:
+        mock_server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        mock_server._httpd.server_close()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+#
+# Measures process startup cost of the ThoughtSpot facade, for short-lived scripts run from cron or CI.
+# Each scenario runs in a fresh interpreter [runs] times and the median wall time is reported, both in total
+# and over a bare interpreter ('python -c pass').
+# 'eager imports' repeats the imports thoughtspot.py used to do unconditionally, for comparison.
+#
+# The lazy facade only saves the import time in a process that never touches the REST API (--help, argument
+# errors, a result already on disk): first access to .tsrest or any sub-API imports thoughtspot_rest_api_v1
+# and requests, which is nearly all of the eager cost. The 'login + first call' scenarios sign in to the mock
+# server in benchmarks/mock_thoughtspot_server.py and list the worksheets, lazily and with the eager imports,
+# so that the saving for a script that does real work can be read off directly.
+#
+# Usage: python benchmarks/startup_benchmark.py [runs]
+#
+
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+SCENARIOS = [
+    ('interpreter only', 'pass'),
+    ('import thoughtspot', 'from thoughtspot import ThoughtSpot'),
+    ('ThoughtSpot() object', "from thoughtspot import ThoughtSpot; ts = ThoughtSpot('https://example.com')"),
+    ('ThoughtSpot() + .tsrest', "from thoughtspot import ThoughtSpot; ts = ThoughtSpot('https://example.com'); "
+                                "ts.tsrest"),
+    ('ThoughtSpot() + .tml', "from thoughtspot import ThoughtSpot; ts = ThoughtSpot('https://example.com'); ts.tml"),
+    ('eager imports', 'from thoughtspot_rest_api_v1 import *; from endpoint_method_classes import *; '
+                      'from principals import *; from instrumentation import *; from cassettes import *'),
+    ('login + first call', "import os; from thoughtspot import ThoughtSpot; "
+                           "ts = ThoughtSpot(os.environ['MOCK_TS_URL']); ts.login('u', 'p'); "
+                           "ts.worksheet.list()"),
+    ('eager login + first call', "import os; from thoughtspot_rest_api_v1 import *; "
+                                 "from endpoint_method_classes import *; from principals import *; "
+                                 "from instrumentation import *; from cassettes import *; "
+                                 "from thoughtspot import ThoughtSpot; "
+                                 "ts = ThoughtSpot(os.environ['MOCK_TS_URL']); ts.login('u', 'p'); "
+                                 "ts.worksheet.list()")
+]
+
+
+def run_once(code: str, env: dict) -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', code], env=env, check=True)
+    return time.perf_counter() - start
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 15
+    env = dict(os.environ)
+    env['PYTHONPATH'] = REPO_ROOT + os.pathsep + env.get('PYTHONPATH', '')
+
+    # The mock server runs in this process, with no added latency, for the login scenarios
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from mock_thoughtspot_server import MockThoughtSpotServer, SyntheticPopulation
+    with MockThoughtSpotServer(SyntheticPopulation(answers=10, liveboards=10, worksheets=10, tables=10)) as server:
+        env['MOCK_TS_URL'] = server.url
+        # One untimed run of everything, so bytecode caches are written before timing
+        for label, code in SCENARIOS:
+            run_once(code, env)
+        # Scenarios are interleaved in each round, so that machine noise affects all of them alike
+        timings = {label: [] for label, code in SCENARIOS}
+        for i in range(runs):
+            for label, code in SCENARIOS:
+                timings[label].append(run_once(code, env))
+
+    baseline = statistics.median(timings[SCENARIOS[0][0]])
+    print('{:<28} {:>12} {:>16}'.format('scenario', 'median (ms)', 'over python (ms)'))
+    for label, code in SCENARIOS:
+        elapsed = statistics.median(timings[label])
+        print('{:<28} {:>12.1f} {:>16.1f}'.format(label, elapsed * 1000, (elapsed - baseline) * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+# Benchmarks run from the repository root or the benchmarks directory
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import yaml
+from lazy_tml import tml_header
+
+#
+# Compares reading guid / type / name from a directory of TML files by fully parsing each file (as
+# tml_details_from_directory.py does, with yaml.Loader, and with the faster C loader) against lazy_tml.tml_header.
+# Synthetic Worksheet TML files with many columns are written to a temporary directory first.
+#
+# Usage: python benchmarks/tml_header_scan_benchmark.py [files] [columns_per_worksheet]
+#
+
+
+def synthetic_worksheet_tml(i: int, columns: int) -> str:
+    lines = ['guid: 00000000-0000-4000-8000-{:012d}'.format(i),
+             'worksheet:',
+             '  name: Worksheet {}'.format(i),
+             '  tables:',
+             '  - name: FACT_SALES_{}'.format(i),
+             '  table_paths:',
+             '  - id: FACT_SALES_{}_1'.format(i),
+             '    table: FACT_SALES_{}'.format(i),
+             '  worksheet_columns:']
+    for c in range(columns):
+        lines.extend(['  - name: Column {}'.format(c),
+                      '    column_id: FACT_SALES_{}_1::COLUMN_{}'.format(i, c),
+                      '    properties:',
+                      '      column_type: ATTRIBUTE',
+                      '      index_type: DONT_INDEX'])
+    lines.extend(['  properties:', '    is_bypass_rls: false', '    join_progressive: true'])
+    return '\n'.join(lines) + '\n'
+
+
+def scan(directory: str, header_func) -> list:
+    headers = []
+    for filename in sorted(os.listdir(directory)):
+        with open(os.path.join(directory, filename), 'r', encoding='utf-8') as fh:
+            headers.append(header_func(fh.read()))
+    return headers
+
+
+def full_parse_header(loader):
+    def header_func(text: str):
+        tml_dict = yaml.load(text, Loader=loader)
+        content_type = [k for k in tml_dict if k not in ['guid', 'id']][0]
+        return {'guid': tml_dict.get('guid'), 'content_type': content_type,
+                'name': tml_dict[content_type].get('name')}
+    return header_func
+
+
+def main():
+    files = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    columns = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    directory = tempfile.mkdtemp(prefix='tml_scan_')
+    try:
+        for i in range(files):
+            with open(os.path.join(directory, '{}.worksheet.tml'.format(i)), 'w', encoding='utf-8') as fh:
+                fh.write(synthetic_worksheet_tml(i, columns))
+
+        scans = [('full parse, yaml.Loader', full_parse_header(yaml.Loader))]
+        if hasattr(yaml, 'CSafeLoader'):
+            scans.append(('full parse, yaml.CSafeLoader', full_parse_header(yaml.CSafeLoader)))
+        scans.append(('lazy_tml.tml_header', tml_header))
+
+        print('{} files, {} columns each'.format(files, columns))
+        expected = None
+        for label, header_func in scans:
+            start = time.perf_counter()
+            headers = scan(directory, header_func)
+            elapsed = time.perf_counter() - start
+            if expected is None:
+                expected = headers
+            elif headers != expected:
+                print('{} returned different headers'.format(label))
+            print('{:<32} {:>10.3f} s {:>10.0f} files/s'.format(label, elapsed, files / elapsed))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
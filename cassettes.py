@@ -0,0 +1,328 @@
+from thoughtspot_rest_api_v1 import *
+from typing import Optional, Dict, List
+from urllib.parse import urlparse, parse_qsl
+import base64
+import gzip
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+
+import requests
+from requests.structures import CaseInsensitiveDict
+#
+# Record and replay of the HTTP exchanges made by a TSRestApiV1 object, for profiling and regression testing
+# automation offline. Like instrumentation.py, it wraps request() on the object's requests.Session.
+#
+# Modes:
+#   'record'  every request goes to the server, and the exchange is added to the cassette
+#   'replay'  every request is answered from the cassette, with no network. A request not in the cassette
+#             raises CassetteMissError
+#   'auto'    replay when the cassette has a match, otherwise go to the server and record
+#
+# A request is matched on method, endpoint and its normalized parameters and body: query string, form and JSON
+# values are combined, keys are sorted, and values that are themselves JSON (e.g. 'id': '["guid1","guid2"]') are
+# parsed so formatting differences don't matter. multipart files= fields are included, with file contents read
+# as text. Parameters in ignore_params are left out of the match and never written to the cassette.
+#
+# Credentials are never written: any parameter or body key (at any depth) whose name contains 'password', 'secret'
+# or 'token' is replaced by '<redacted>', and responses from token endpoints (session/gettoken,
+# session/auth/token ...) are saved with the same keys redacted, or with the whole body redacted when not JSON.
+# Replayed token responses therefore contain '<redacted>' rather than a usable token.
+# The same request recorded several times is replayed in the recorded order, then the last response repeats.
+#
+# Cassettes are one JSON document, gzip compressed when the filename ends in .gz.
+#
+# Usage:
+#   cassette = Cassette('nightly_audit.json.gz', mode='record').install(ts.tsrest)
+#   ... run the job against the server ...
+#   cassette.save()
+# then later, without a server:
+#   cassette = Cassette('nightly_audit.json.gz', mode='replay').install(ts.tsrest)
+#
+
+
+class CassetteMissError(LookupError):
+    pass
+
+
+redacted_value = '<redacted>'
+credential_key_parts = ['password', 'secret', 'token']
+
+
+def is_credential_key(key) -> bool:
+    key = str(key).lower()
+    return any(part in key for part in credential_key_parts)
+
+
+# Copy of a parsed JSON value with every credential key's value redacted
+def redact_credentials(value):
+    if isinstance(value, dict):
+        return {k: redacted_value if is_credential_key(k) else redact_credentials(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [redact_credentials(v) for v in value]
+    return value
+
+
+class Cassette:
+    version = 1
+    default_ignore_params = ['username', 'password', 'secret_key', 'token', 'auth_token']
+
+    def __init__(self, filename: str, mode: str = 'replay', ignore_params: Optional[List[str]] = None,
+                 simulate_latency: bool = False):
+        if mode not in ['record', 'replay', 'auto']:
+            raise ValueError('mode must be "record", "replay" or "auto"')
+        self.filename = filename
+        self.mode = mode
+        self.ignore_params = set(ignore_params if ignore_params is not None else self.default_ignore_params)
+        # When True, replay sleeps for the recorded response time, to reproduce the timing of the recorded run
+        self.simulate_latency = simulate_latency
+
+        # match key : List of recorded interactions, in recorded order
+        self.interactions = {}
+        # match key : number of times replayed so far
+        self._play_counts = {}
+        self._lock = threading.Lock()
+        self._installed = []
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+        if os.path.exists(filename):
+            self.load()
+        elif mode == 'replay':
+            raise FileNotFoundError('Cassette {} does not exist'.format(filename))
+
+    #
+    # Persistence
+    #
+    def _open(self, mode: str):
+        if self.filename.endswith('.gz'):
+            return gzip.open(self.filename, mode + 't', encoding='utf-8')
+        return open(self.filename, mode, encoding='utf-8')
+
+    def load(self):
+        with self._open('r') as fh:
+            saved = json.load(fh)
+        self.interactions = {}
+        for interaction in saved['interactions']:
+            self.interactions.setdefault(interaction['key'], []).append(interaction)
+        self._play_counts = {}
+
+    def save(self) -> str:
+        with self._lock:
+            interactions = [i for key_interactions in self.interactions.values() for i in key_interactions]
+        saved = {'version': self.version, 'interactions': interactions}
+        # Write then rename, so an interrupted save never loses an existing cassette
+        final_filename = self.filename
+        self.filename = final_filename + '.tmp' + ('.gz' if final_filename.endswith('.gz') else '')
+        try:
+            with self._open('w') as fh:
+                json.dump(saved, fh, separators=(',', ':'))
+            os.replace(self.filename, final_filename)
+        finally:
+            self.filename = final_filename
+        return final_filename
+
+    #
+    # Request matching
+    #
+    @staticmethod
+    def _normalize_value(value):
+        if isinstance(value, (list, tuple)):
+            return [Cassette._normalize_value(v) for v in value]
+        if isinstance(value, dict):
+            return {str(k): redacted_value if is_credential_key(k) else Cassette._normalize_value(v)
+                    for k, v in value.items()}
+        if isinstance(value, bytes):
+            value = value.decode('utf-8', errors='replace')
+        if isinstance(value, str) and len(value) > 0 and value[0] in '[{':
+            try:
+                return Cassette._normalize_value(json.loads(value))
+            except ValueError:
+                pass
+        # Query string values arrive as strings, so everything is compared as a string
+        return str(value)
+
+    # The value of a multipart files= field: (filename, content[, content type ...]) tuples, file objects or plain
+    # values. File objects are read and put back where they were, so the request still sends the whole file
+    @staticmethod
+    def _multipart_value(value):
+        if isinstance(value, (tuple, list)):
+            value = value[1] if len(value) > 1 else value[0]
+        if hasattr(value, 'read'):
+            if not (hasattr(value, 'seekable') and value.seekable()):
+                return '<stream>'
+            position = value.tell()
+            content = value.read()
+            value.seek(position)
+            return content
+        return value
+
+    def normalized_request(self, method: str, url: str, kwargs: Dict) -> Dict:
+        parsed = urlparse(url)
+        params = dict(parse_qsl(parsed.query, keep_blank_values=True))
+        if kwargs.get('params') is not None:
+            params.update(kwargs['params'])
+        body = kwargs.get('data') if kwargs.get('data') is not None else kwargs.get('json')
+        if isinstance(body, (str, bytes)):
+            # A raw body (already encoded JSON or form data) is matched as one value
+            params['__body__'] = body
+        elif isinstance(body, dict):
+            params.update(body)
+        if isinstance(kwargs.get('files'), dict):
+            params.update({k: self._multipart_value(v) for k, v in kwargs['files'].items()})
+        params = {k: redacted_value if is_credential_key(k) else self._normalize_value(v)
+                  for k, v in params.items() if k not in self.ignore_params}
+        return {'method': method.upper(),
+                'endpoint': normalize_cassette_endpoint(parsed.path),
+                'params': params}
+
+    @staticmethod
+    def request_key(normalized_request: Dict) -> str:
+        return hashlib.sha1(json.dumps(normalized_request, sort_keys=True).encode('utf-8')).hexdigest()
+
+    #
+    # Installing on a TSRestApiV1
+    #
+    # Other wrappers (instrumentation, PersistentSession, RateLimiter) may be installed on the same session after
+    # the cassette. Uninstalling only restores the previous request() when the cassette is still the outermost
+    # wrapper; otherwise its wrapper stays in the chain as a pass-through, so the wrappers around it keep working
+    def install(self, tsrest: TSRestApiV1) -> "Cassette":
+        session = tsrest.requests_session
+        original_request = session.request
+        # The cassette answering through this wrapper, or None once uninstalled (pass-through)
+        slot = {'cassette': self}
+
+        def cassette_request(method, url, *args, **kwargs):
+            cassette = slot['cassette']
+            if cassette is None:
+                return original_request(method, url, *args, **kwargs)
+            return cassette._request(original_request, method, url, *args, **kwargs)
+
+        self._installed.append((session, vars(session).get('request'), cassette_request, slot))
+        session.request = cassette_request
+        return self
+
+    def uninstall(self):
+        for session, previous_request, cassette_request, slot in reversed(self._installed):
+            slot['cassette'] = None
+            if vars(session).get('request') is not cassette_request:
+                continue
+            if previous_request is not None:
+                session.request = previous_request
+            elif 'request' in vars(session):
+                del session.request
+        self._installed = []
+
+    @property
+    def installed(self) -> bool:
+        return len(self._installed) > 0
+
+    # Answers through the other cassette's wrappers from now on, in the same place in the wrapper chain,
+    # and the other cassette stops answering
+    def take_over(self, other: "Cassette") -> "Cassette":
+        for installed in other._installed:
+            installed[3]['cassette'] = self
+            self._installed.append(installed)
+        other._installed = []
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.uninstall()
+        if self.mode != 'replay':
+            self.save()
+
+    def _request(self, original_request, method, url, *args, **kwargs):
+        normalized = self.normalized_request(method, url, kwargs)
+        key = self.request_key(normalized)
+        if self.mode != 'record':
+            interaction = self._next_interaction(key)
+            if interaction is not None:
+                self.hits += 1
+                return self._build_response(interaction, url)
+            if self.mode == 'replay':
+                self.misses += 1
+                raise CassetteMissError('No recorded response for {} {} {}'.format(
+                    normalized['method'], normalized['endpoint'], json.dumps(normalized['params'], sort_keys=True)))
+
+        self.misses += 1
+        start = time.perf_counter()
+        response = original_request(method, url, *args, **kwargs)
+        elapsed = time.perf_counter() - start
+        self._record(key, normalized, response, elapsed)
+        return response
+
+    def _next_interaction(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            recorded = self.interactions.get(key)
+            if not recorded:
+                return None
+            play_count = self._play_counts.get(key, 0)
+            self._play_counts[key] = play_count + 1
+            return recorded[min(play_count, len(recorded) - 1)]
+
+    def _record(self, key: str, normalized: Dict, response: requests.Response, elapsed: float):
+        # Reading .content consumes a streamed response, but the content stays on the Response,
+        # so iter_content() still works for the caller
+        content = response.content
+        interaction = {'key': key,
+                       'request': normalized,
+                       'status': response.status_code,
+                       'reason': response.reason,
+                       'content_type': response.headers.get('Content-Type'),
+                       'elapsed_seconds': round(elapsed, 4)}
+        if 'token' in normalized['endpoint'].lower():
+            interaction['body'] = self._redacted_token_body(content)
+        else:
+            try:
+                interaction['body'] = content.decode('utf-8')
+            except UnicodeDecodeError:
+                interaction['body_base64'] = base64.b64encode(content).decode('ascii')
+        with self._lock:
+            self.interactions.setdefault(key, []).append(interaction)
+            self.recorded += 1
+
+    # Token endpoints answer with the token itself, either as JSON or as plain text
+    @staticmethod
+    def _redacted_token_body(content: bytes) -> str:
+        try:
+            return json.dumps(redact_credentials(json.loads(content.decode('utf-8'))))
+        except (UnicodeDecodeError, ValueError):
+            return redacted_value
+
+    def _build_response(self, interaction: Dict, url: str) -> requests.Response:
+        if self.simulate_latency is True:
+            time.sleep(interaction.get('elapsed_seconds', 0))
+        response = requests.Response()
+        response.status_code = interaction['status']
+        response.reason = interaction.get('reason')
+        response.url = url
+        response.encoding = 'utf-8'
+        response.headers = CaseInsensitiveDict()
+        if interaction.get('content_type') is not None:
+            response.headers['Content-Type'] = interaction['content_type']
+        if 'body_base64' in interaction:
+            content = base64.b64decode(interaction['body_base64'])
+        else:
+            content = interaction.get('body', '').encode('utf-8')
+        # As a Response whose content has already been read, with a raw stream so that iter_content(), close()
+        # and 'with' blocks behave as they do on a live (streamed) response
+        response._content = content
+        response._content_consumed = True
+        response.raw = io.BytesIO(content)
+        response.headers['Content-Length'] = str(len(content))
+        return response
+
+
+# Matches are on the path only, so a cassette recorded against one server replays against any server URL
+def normalize_cassette_endpoint(path: str) -> str:
+    if '/callosum/v1/' in path:
+        path = path.split('/callosum/v1/', 1)[1]
+        if path.startswith('tspublic/v1/'):
+            path = path[len('tspublic/v1/'):]
+    return path.strip('/')
@@ -0,0 +1,229 @@
+from typing import Optional, Dict, List, Iterable
+#
+# Builds typed columnar arrays from the COMPACT format responses of searchdata and pinboarddata,
+# which are a 'columnNames' list plus a 'data' list of row lists.
+# NumPy and PyArrow are optional: they are only imported when a ColumnarDataBuilder using them is created,
+# so the rest of the library works without them installed
+#
+
+
+# ThoughtSpot column data types (as shown in metadata/details and TML db_column_properties) to NumPy dtypes
+TS_DATA_TYPE_TO_NUMPY_DTYPE = {
+    'BOOL': 'bool',
+    'INT32': 'int32',
+    'INT64': 'int64',
+    'FLOAT': 'float32',
+    'DOUBLE': 'float64',
+    'VARCHAR': 'object',
+    'CHAR': 'object',
+    'DATE': 'int64',
+    'DATE_TIME': 'int64',
+    'TIME': 'int64'
+}
+
+# ThoughtSpot column data types to PyArrow type factory names
+TS_DATA_TYPE_TO_ARROW_TYPE = {
+    'BOOL': 'bool_',
+    'INT32': 'int32',
+    'INT64': 'int64',
+    'FLOAT': 'float32',
+    'DOUBLE': 'float64',
+    'VARCHAR': 'string',
+    'CHAR': 'string',
+    'DATE': 'int64',
+    'DATE_TIME': 'int64',
+    'TIME': 'int64'
+}
+
+
+def _import_numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError('numpy is required for the "numpy" backend: pip install numpy')
+    return numpy
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError('pyarrow is required for the "arrow" backend: pip install pyarrow')
+    return pyarrow
+
+
+#
+# Pages are appended one at a time, each converted to one typed chunk per column.
+# The chunks are only joined together at the end by to_numpy() / to_arrow() / to_pandas()
+#
+class ColumnarDataBuilder:
+    def __init__(self, backend: str = 'numpy', column_names: Optional[List[str]] = None,
+                 column_data_types: Optional[Dict[str, str]] = None):
+        if backend not in ['numpy', 'arrow']:
+            raise ValueError('backend must be "numpy" or "arrow"')
+        self.backend = backend
+        if backend == 'numpy':
+            self._np = _import_numpy()
+        else:
+            self._pa = _import_pyarrow()
+
+        self.column_names = column_names
+        # Column name : ThoughtSpot data type. Columns without a type are inferred from the first page
+        self.column_data_types = column_data_types if column_data_types is not None else {}
+        # Column name : NumPy dtype string or PyArrow DataType, settled on the first page
+        self._column_types = {}
+        self._untyped_columns = set()
+        self._chunks = {}
+        self.row_count = 0
+
+    @classmethod
+    def from_pages(cls, pages: Iterable[Dict], backend: str = 'numpy',
+                   column_data_types: Optional[Dict[str, str]] = None) -> "ColumnarDataBuilder":
+        builder = cls(backend=backend, column_data_types=column_data_types)
+        for page in pages:
+            builder.append_page(page)
+        return builder
+
+    @staticmethod
+    def _first_non_null(values):
+        for v in values:
+            if v is not None:
+                return v
+        return None
+
+    def _infer_numpy_dtype(self, column_name: str, values) -> str:
+        if column_name in self.column_data_types:
+            return TS_DATA_TYPE_TO_NUMPY_DTYPE.get(self.column_data_types[column_name].upper(), 'object')
+        v = self._first_non_null(values)
+        # bool must be checked before int, since bool is a subclass of int
+        if isinstance(v, bool):
+            return 'bool'
+        elif isinstance(v, int):
+            return 'int64'
+        elif isinstance(v, float):
+            return 'float64'
+        return 'object'
+
+    def _infer_arrow_type(self, column_name: str, values):
+        if column_name in self.column_data_types:
+            type_factory = TS_DATA_TYPE_TO_ARROW_TYPE.get(self.column_data_types[column_name].upper(), 'string')
+            return getattr(self._pa, type_factory)()
+        # Let PyArrow infer from the values, then keep that type for every later page
+        return self._pa.array(values).type
+
+    def _settle_numpy_dtype(self, column_name: str, values):
+        dtype = self._infer_numpy_dtype(column_name, values)
+        # A column that is all nulls so far stays 'object' until a page with values arrives
+        if column_name not in self.column_data_types and self._first_non_null(values) is None:
+            self._untyped_columns.add(column_name)
+            self._column_types[column_name] = 'object'
+            return
+        self._untyped_columns.discard(column_name)
+        if len(self._chunks[column_name]) > 0 and dtype != 'object':
+            # Earlier chunks are all nulls, which only a float column can hold as NaN
+            if dtype in ['int32', 'int64', 'bool']:
+                dtype = 'float64'
+            self._chunks[column_name] = [self._np.full(len(c), float('nan'), dtype=dtype)
+                                         for c in self._chunks[column_name]]
+        self._column_types[column_name] = dtype
+
+    def _numpy_chunk(self, column_name: str, values):
+        dtype = self._column_types[column_name]
+        # An inferred integer column that later receives decimals widens to float, rather than truncating
+        if dtype in ['int32', 'int64'] and any(isinstance(v, float) for v in values):
+            dtype = 'float64'
+            self._widen_numpy_column(column_name, dtype)
+        if dtype != 'object' and None in values:
+            # NumPy integer and bool arrays can't hold nulls, so the column widens to float with NaN
+            if dtype in ['int32', 'int64', 'bool']:
+                dtype = 'float64'
+                self._widen_numpy_column(column_name, dtype)
+            values = [float('nan') if v is None else v for v in values]
+        return self._np.asarray(values, dtype=dtype)
+
+    def _widen_numpy_column(self, column_name: str, dtype: str):
+        self._column_types[column_name] = dtype
+        self._chunks[column_name] = [c.astype(dtype) for c in self._chunks[column_name]]
+
+    def _arrow_chunk(self, column_name: str, values):
+        column_type = self._column_types.get(column_name)
+        if column_type is None or column_type == self._pa.null():
+            column_type = self._infer_arrow_type(column_name, values)
+            # A column that was all nulls so far takes the type of the first page with values
+            if column_type != self._pa.null():
+                self._chunks[column_name] = [c.cast(column_type) for c in self._chunks[column_name]]
+            self._column_types[column_name] = column_type
+        # Same widening as the NumPy backend: integers followed by decimals become float64
+        if self._pa.types.is_integer(column_type) and any(isinstance(v, float) for v in values):
+            column_type = self._pa.float64()
+            self._column_types[column_name] = column_type
+            self._chunks[column_name] = [c.cast(column_type) for c in self._chunks[column_name]]
+        return self._pa.array(values, type=column_type)
+
+    def append_page(self, page: Dict):
+        rows = page['data']
+        if self.column_names is None:
+            self.column_names = list(page['columnNames'])
+            for c in self.column_names:
+                self._chunks[c] = []
+        if len(rows) == 0:
+            return
+
+        # zip(*rows) transposes the row lists into one tuple per column in a single C-level pass
+        columns = list(zip(*rows))
+        for i, column_name in enumerate(self.column_names):
+            values = list(columns[i])
+            if self.backend == 'numpy':
+                if column_name not in self._column_types or column_name in self._untyped_columns:
+                    self._settle_numpy_dtype(column_name, values)
+                chunk = self._numpy_chunk(column_name, values)
+            else:
+                chunk = self._arrow_chunk(column_name, values)
+            # Appended after conversion, since converting may widen (replace) the earlier chunks
+            self._chunks[column_name].append(chunk)
+        self.row_count += len(rows)
+
+    def to_numpy(self) -> Dict:
+        if self.backend != 'numpy':
+            raise ValueError('to_numpy() requires the "numpy" backend')
+        arrays = {}
+        for column_name in self.column_names:
+            chunks = self._chunks[column_name]
+            if len(chunks) == 0:
+                arrays[column_name] = self._np.asarray([], dtype=self._column_types.get(column_name, 'object'))
+            else:
+                arrays[column_name] = self._np.concatenate(chunks)
+        return arrays
+
+    def to_arrow(self):
+        pa = _import_pyarrow()
+        if self.backend == 'numpy':
+            arrays = self.to_numpy()
+            return pa.table({c: arrays[c] for c in self.column_names})
+        # chunked_array keeps each page as its own chunk without copying
+        columns = {}
+        for column_name in self.column_names:
+            if len(self._chunks[column_name]) == 0:
+                columns[column_name] = pa.chunked_array([], type=pa.null())
+            else:
+                columns[column_name] = pa.chunked_array(self._chunks[column_name])
+        return pa.table(columns)
+
+    def to_pandas(self):
+        if self.backend == 'arrow':
+            return self.to_arrow().to_pandas()
+        try:
+            import pandas
+        except ImportError:
+            raise ImportError('pandas is required for to_pandas(): pip install pandas')
+        arrays = self.to_numpy()
+        return pandas.DataFrame({c: arrays[c] for c in self.column_names})
+
+    def write_parquet(self, filename: str):
+        pa = _import_pyarrow()
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError('pyarrow with parquet support is required for write_parquet()')
+        pq.write_table(self.to_arrow(), filename)
+        return filename
@@ -0,0 +1,247 @@
+from thoughtspot_rest_api_v1 import *
+from typing import Optional, Dict, List
+import fnmatch
+import gzip
+import json
+import os
+import re
+import time
+#
+# The connection/fetchConnection response (connection_fetch_connection) with include_columns=True is the whole
+# warehouse catalog as nested lists of databases > schemas > tables > columns.
+# ConnectionCatalog indexes it once into Dicts keyed by name, can be saved to and loaded from disk, and can be
+# diffed against a newer fetch, so that repeated connection updates don't need to re-download or re-walk it
+#
+
+
+class ConnectionCatalog:
+    def __init__(self, external_databases: List[Dict], connection_guid: Optional[str] = None,
+                 fetched_at: Optional[float] = None):
+        self.external_databases = external_databases
+        self.connection_guid = connection_guid
+        # time.time() of the fetch, used to decide if a saved catalog is too old to reuse
+        self.fetched_at = fetched_at if fetched_at is not None else time.time()
+
+        # database name : database Dict
+        self.databases = {}
+        # (database, schema) : schema Dict
+        self.schemas = {}
+        # (database, schema, table) : table Dict
+        self.tables = {}
+        # (database, schema, table, column) : column Dict
+        self.columns = {}
+        # Databases with at least one table already selected (imported) on the connection
+        self.databases_with_selected_tables = set()
+        self._build_index()
+
+    def _build_index(self):
+        for db in self.external_databases:
+            self.databases[db['name']] = db
+            for schema in db.get('schemas', []):
+                self.schemas[(db['name'], schema['name'])] = schema
+                for table in schema.get('tables', []):
+                    self.tables[(db['name'], schema['name'], table['name'])] = table
+                    if table.get('selected') is True:
+                        self.databases_with_selected_tables.add(db['name'])
+                    for column in table.get('columns', []):
+                        self.columns[(db['name'], schema['name'], table['name'], column['name'])] = column
+
+    # Accepts either the full fetchConnection response or just its 'externalDatabases' list
+    @classmethod
+    def from_fetch_response(cls, fetch_connection_response, connection_guid: Optional[str] = None) -> "ConnectionCatalog":
+        if isinstance(fetch_connection_response, dict):
+            external_databases = fetch_connection_response['externalDatabases']
+        else:
+            external_databases = fetch_connection_response
+        return cls(external_databases=external_databases, connection_guid=connection_guid)
+
+    @classmethod
+    def fetch(cls, tsrest: TSRestApiV1, connection_guid: str, config_json_string: str,
+              include_columns: bool = True, authentication_type: str = 'SERVICE_ACCOUNT') -> "ConnectionCatalog":
+        response = tsrest.connection_fetch_connection(connection_guid=connection_guid,
+                                                      config_json_string=config_json_string,
+                                                      include_columns=include_columns,
+                                                      authentication_type=authentication_type)
+        return cls.from_fetch_response(response, connection_guid=connection_guid)
+
+    #
+    # Persistence. Filenames ending in .gz are gzip compressed
+    #
+    @staticmethod
+    def _open(filename: str, mode: str):
+        if filename.endswith('.gz'):
+            return gzip.open(filename, mode + 't', encoding='utf-8')
+        return open(filename, mode, encoding='utf-8')
+
+    def save(self, filename: str) -> str:
+        saved = {'connection_guid': self.connection_guid,
+                 'fetched_at': self.fetched_at,
+                 'externalDatabases': self.external_databases}
+        with self._open(filename, 'w') as fh:
+            json.dump(saved, fh)
+        return filename
+
+    @classmethod
+    def load(cls, filename: str) -> "ConnectionCatalog":
+        with cls._open(filename, 'r') as fh:
+            saved = json.load(fh)
+        return cls(external_databases=saved['externalDatabases'], connection_guid=saved.get('connection_guid'),
+                   fetched_at=saved.get('fetched_at'))
+
+    def age_seconds(self) -> float:
+        return time.time() - self.fetched_at
+
+    #
+    # Lookups
+    #
+    def has_table(self, database_name: str, schema_name: str, table_name: str) -> bool:
+        return (database_name, schema_name, table_name) in self.tables
+
+    def get_table(self, database_name: str, schema_name: str, table_name: str) -> Dict:
+        return self.tables[(database_name, schema_name, table_name)]
+
+    def get_columns(self, database_name: str, schema_name: str, table_name: str) -> List[Dict]:
+        return self.tables[(database_name, schema_name, table_name)].get('columns', [])
+
+    def tables_in_schema(self, database_name: str, schema_name: str) -> List[str]:
+        return [t['name'] for t in self.schemas[(database_name, schema_name)].get('tables', [])]
+
+    #
+    # Equivalents of the TSRestApiV1 connection processing methods, answered from the index
+    #
+    def get_databases(self) -> List[str]:
+        return list(self.databases.keys())
+
+    def get_databases_and_schemas(self, schema_names_to_skip: Optional[List[str]] = None) -> Dict:
+        skip = set(schema_names_to_skip) if schema_names_to_skip is not None else set()
+        dbs = {}
+        for db_name in self.databases:
+            dbs[db_name] = {}
+        for (db_name, schema_name) in self.schemas:
+            if schema_name not in skip:
+                dbs[db_name][schema_name] = []
+        return dbs
+
+    # Any database in tables_to_add_map, plus any database that already has selected tables, since the
+    # connection update must include all previously selected tables or they are removed
+    def get_selected_tables(self, tables_to_add_map: Optional[Dict] = None) -> List[Dict]:
+        selected_external_dbs = []
+        for db in self.external_databases:
+            if (tables_to_add_map is not None and db['name'] in tables_to_add_map) \
+                    or db['name'] in self.databases_with_selected_tables:
+                selected_external_dbs.append(db)
+        return selected_external_dbs
+
+    #
+    # Diff against a newer catalog, by set operations on the index keys
+    #
+    def diff(self, newer: "ConnectionCatalog") -> Dict[str, List]:
+        old_tables = set(self.tables.keys())
+        new_tables = set(newer.tables.keys())
+        old_columns = set(self.columns.keys())
+        new_columns = set(newer.columns.keys())
+
+        changed_columns = []
+        for key in old_columns.intersection(new_columns):
+            if self.columns[key].get('type') != newer.columns[key].get('type'):
+                changed_columns.append(key)
+
+        return {
+            'added_databases': sorted(set(newer.databases.keys()) - set(self.databases.keys())),
+            'removed_databases': sorted(set(self.databases.keys()) - set(newer.databases.keys())),
+            'added_schemas': sorted(set(newer.schemas.keys()) - set(self.schemas.keys())),
+            'removed_schemas': sorted(set(self.schemas.keys()) - set(newer.schemas.keys())),
+            'added_tables': sorted(new_tables - old_tables),
+            'removed_tables': sorted(old_tables - new_tables),
+            'added_columns': sorted(new_columns - old_columns),
+            'removed_columns': sorted(old_columns - new_columns),
+            'changed_columns': sorted(changed_columns)
+        }
+
+
+#
+# TableSelection compiles a tables_to_add_map into hashed sets and compiled patterns once, so that selecting
+# tables from a catalog is one linear pass with constant time lookups, rather than `in` tests against lists.
+#
+# tables_to_add_map format = { 'database_name' : { 'schema_name' : ['table_name_1', 'table_name_2'] } }
+# An empty list selects every table in the schema, as in TSRestApiV1.add_new_tables_to_connection.
+# Entries can also be rules, marked by a prefix so that any other entry is an exact name, even one containing
+# glob characters such as * or [:
+#   'glob:SALES_*'     glob pattern (fnmatch), matched against the whole table name
+#   're:^FACT_\d+$'    regular expression, matched against the whole table name
+# A schema key of '*' applies its rules to every schema in the database
+#
+class TableSelection:
+    regex_prefix = 're:'
+    glob_prefix = 'glob:'
+
+    def __init__(self, tables_to_add_map: Dict):
+        self.tables_to_add_map = tables_to_add_map
+        # (database, schema) : (Set of exact names, List of compiled patterns, select_all flag)
+        self._rules = {}
+        for db_name in tables_to_add_map:
+            for schema_name in tables_to_add_map[db_name]:
+                self._rules[(db_name, schema_name)] = self._compile(tables_to_add_map[db_name][schema_name])
+
+    @classmethod
+    def _compile(cls, entries: List[str]):
+        exact_names = set()
+        patterns = []
+        for e in entries:
+            if e.startswith(cls.regex_prefix):
+                patterns.append(re.compile(e[len(cls.regex_prefix):]))
+            elif e.startswith(cls.glob_prefix):
+                patterns.append(re.compile(fnmatch.translate(e[len(cls.glob_prefix):])))
+            else:
+                exact_names.add(e)
+        return exact_names, patterns, len(entries) == 0
+
+    def _schema_rules(self, db_name: str, schema_name: str) -> List:
+        rules = []
+        if (db_name, schema_name) in self._rules:
+            rules.append(self._rules[(db_name, schema_name)])
+        if (db_name, '*') in self._rules:
+            rules.append(self._rules[(db_name, '*')])
+        return rules
+
+    @staticmethod
+    def _matches_rules(rules: List, table_name: str) -> bool:
+        for exact_names, patterns, select_all in rules:
+            if select_all is True or table_name in exact_names:
+                return True
+            for p in patterns:
+                if p.fullmatch(table_name):
+                    return True
+        return False
+
+    def matches(self, db_name: str, schema_name: str, table_name: str) -> bool:
+        return self._matches_rules(self._schema_rules(db_name, schema_name), table_name)
+
+    # One pass over the catalog: keeps every database named in the map or with already selected tables
+    # (so the update doesn't drop them), marks the matching tables as selected and linked, and returns
+    # the selected databases plus (database, schema, table Dict) for each newly matched table.
+    # external_databases is not changed: a database with matches is returned as a copy, with copies of the
+    # matched tables, so a cached catalog can be selected from more than once
+    def select(self, external_databases: List[Dict]) -> (List[Dict], List[tuple]):
+        selected_external_dbs = []
+        matched_tables = []
+        for db in external_databases:
+            in_map = db['name'] in self.tables_to_add_map
+            keep_db = in_map
+            db_schemas = []
+            db_matched = False
+            for schema in db.get('schemas', []):
+                rules = self._schema_rules(db['name'], schema['name']) if in_map else []
+                schema_tables = []
+                for table in schema.get('tables', []):
+                    if len(rules) > 0 and self._matches_rules(rules, table['name']):
+                        table = dict(table, selected=True, linked=True)
+                        matched_tables.append((db['name'], schema['name'], table))
+                        db_matched = True
+                    elif table.get('selected') is True:
+                        keep_db = True
+                    schema_tables.append(table)
+                db_schemas.append(dict(schema, tables=schema_tables))
+            if keep_db is True:
+                selected_external_dbs.append(dict(db, schemas=db_schemas) if db_matched is True else db)
+        return selected_external_dbs, matched_tables
@@ -1,6 +1,19 @@
 from thoughtspot_rest_api_v1 import *
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, Callable
 import typing
+import copy
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+import json
+import os
+import re
+import threading
+import time
+
+import requests
+
+from columnar_data import ColumnarDataBuilder
+from connection_catalog import ConnectionCatalog, TableSelection
 #
 # Each of these classes is used as an object within the main wrapper class
 # to provide a structure based on the object types available within ThoughtSpot
@@ -8,6 +21,89 @@ import typing
 #
 
 
+#
+# Result of a bulk operation: one entry per input record, each with 'record', 'success'
+# and either 'response' or 'error'
+#
+class BulkResult:
+    def __init__(self):
+        self.results = []
+
+    def add_success(self, record, response=None):
+        self.results.append({'record': record, 'success': True, 'response': response})
+
+    # 'error' is the message. When error is an exception, it is also kept as 'exception', so it can be raised again
+    # with its details (e.g. the response of a requests HTTPError)
+    def add_failure(self, record, error):
+        self.results.append({'record': record, 'success': False, 'error': str(error),
+                             'exception': error if isinstance(error, BaseException) else None})
+
+    def extend(self, other: "BulkResult"):
+        self.results.extend(other.results)
+
+    @property
+    def succeeded(self) -> List[Dict]:
+        return [r for r in self.results if r['success'] is True]
+
+    @property
+    def failed(self) -> List[Dict]:
+        return [r for r in self.results if r['success'] is False]
+
+    @property
+    def all_succeeded(self) -> bool:
+        return len(self.failed) == 0
+
+
+# Runs func(item) for every item on a bounded pool of threads. The requests.Session on TSRestApiV1 is shared
+# by the threads, so every call uses the same signed-in session. Exceptions are captured per item
+# rather than stopping the whole run
+def run_concurrently(func: Callable, items: List, max_workers: int = 8) -> BulkResult:
+    bulk_result = BulkResult()
+
+    def call(item):
+        try:
+            return True, func(item)
+        except Exception as e:
+            return False, e
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # executor.map keeps the input order in the results
+        for item, (success, value) in zip(items, executor.map(call, items)):
+            if success is True:
+                bulk_result.add_success(item, value)
+            else:
+                bulk_result.add_failure(item, value)
+    return bulk_result
+
+
+# Groups records on one of their keys, in chunks of up to max_records_per_batch, as the (key, records)
+# batches for the endpoints that take many IDs in one call
+def _chunk_records_by_key(records: List[Dict], key: str, max_records_per_batch: int) -> List[tuple]:
+    records_by_key = {}
+    for record in records:
+        records_by_key.setdefault(record[key], []).append(record)
+
+    batches = []
+    for k in records_by_key:
+        key_records = records_by_key[k]
+        for i in range(0, len(key_records), max_records_per_batch):
+            batches.append((k, key_records[i:i + max_records_per_batch]))
+    return batches
+
+
+# Bulk operations that send several records in one call get a BulkResult per batch of (key, records).
+# This expands it back out so every original record has its own entry
+def _expand_batch_results(batch_results: BulkResult) -> BulkResult:
+    bulk_result = BulkResult()
+    for r in batch_results.results:
+        for record in r['record'][1]:
+            if r['success'] is True:
+                bulk_result.add_success(record, r['response'])
+            else:
+                bulk_result.add_failure(record, r['exception'] if r['exception'] is not None else r['error'])
+    return bulk_result
+
+
 class SharedEndpointMethods:
     def __init__(self, tsrest: TSRestApiV1):
         self.rest = tsrest
@@ -168,6 +264,32 @@ class UserMethods(SharedEndpointMethods):
         details = self.details(guid=user_guid)
         return details['header']['modified']
 
+    #
+    # Bulk operations. user_post only creates one User per call, so the records are run on a bounded worker pool
+    #
+
+    # Each record is a Dict of the user_post() arguments:
+    # {'username': , 'password': , 'display_name': , 'properties': (optional), 'groups': (optional) ...}
+    def bulk_create_users(self, user_records: List[Dict], max_workers: int = 8) -> BulkResult:
+        def create_user(record):
+            r = dict(record)
+            if 'properties' not in r:
+                r['properties'] = None
+            return self.rest.user_post(**r)
+
+        return run_concurrently(create_user, user_records, max_workers=max_workers)
+
+    def bulk_delete_users(self, user_guids: List[str], max_workers: int = 8) -> BulkResult:
+        return run_concurrently(lambda guid: self.rest.user_delete(user_guid=guid), user_guids,
+                                max_workers=max_workers)
+
+    # groups_by_user is {user_guid: [group_guids]}. user/{id}/groups POST replaces the User's whole membership,
+    # so each User is set in one call with all of their Groups
+    def bulk_set_groups_for_users(self, groups_by_user: Dict[str, List[str]], max_workers: int = 8) -> BulkResult:
+        return run_concurrently(
+            lambda guid: self.rest.user_groups_post(user_guid=guid, group_guids=groups_by_user[guid]),
+            list(groups_by_user.keys()), max_workers=max_workers)
+
     # Used when a user should be removed from the system but their content needs to be reassigned to a new owner
     def transfer_ownership_of_all_objects_between_users(self, current_owner_username, new_owner_username):
         return self.rest.user_transfer_ownership(current_owner_username=current_owner_username,
@@ -260,6 +382,76 @@ class GroupMethods(SharedEndpointMethods):
     def remove_privilege_from_group(self, privilege: str, group_name: str):
         return self.rest.group_removeprivilege(privilege=privilege, group_names=[group_name,])
 
+    #
+    # Bulk operations. Membership and privilege changes use the endpoints that take many IDs in one call,
+    # chunked to max_ids_per_call. Each input record still gets its own entry in the returned BulkResult
+    #
+
+    # Each record is a Dict of the group_post() arguments:
+    # {'group_name': , 'display_name': , 'privileges': (optional) ...}
+    def bulk_create_groups(self, group_records: List[Dict], max_workers: int = 8) -> BulkResult:
+        def create_group(record):
+            r = dict(record)
+            if 'privileges' not in r:
+                r['privileges'] = None
+            return self.rest.group_post(**r)
+
+        return run_concurrently(create_group, group_records, max_workers=max_workers)
+
+    # membership_records are Dicts of {'user_guid': , 'group_guid': }
+    def bulk_add_users_to_groups(self, membership_records: List[Dict], max_ids_per_call: int = 500,
+                                 max_workers: int = 8) -> BulkResult:
+        return self._bulk_group_membership(membership_records, self.rest.group_users_post, self.rest.user_groups_put,
+                                           max_ids_per_call=max_ids_per_call, max_workers=max_workers)
+
+    def bulk_remove_users_from_groups(self, membership_records: List[Dict], max_ids_per_call: int = 500,
+                                      max_workers: int = 8) -> BulkResult:
+        return self._bulk_group_membership(membership_records, self.rest.group_users_delete,
+                                           self.rest.user_groups_delete,
+                                           max_ids_per_call=max_ids_per_call, max_workers=max_workers)
+
+    @staticmethod
+    def _bulk_group_membership(membership_records: List[Dict], group_users_method: Callable,
+                               user_groups_method: Callable, max_ids_per_call: int, max_workers: int) -> BulkResult:
+        # group/{id}/users takes many Users for one Group, user/{id}/groups takes many Groups for one User.
+        # Batch along whichever side needs fewer calls, rather than one call per membership
+        by_group = _chunk_records_by_key(membership_records, 'group_guid', max_ids_per_call)
+        by_user = _chunk_records_by_key(membership_records, 'user_guid', max_ids_per_call)
+
+        if len(by_group) <= len(by_user):
+            batch_results = run_concurrently(
+                lambda b: group_users_method(group_guid=b[0], user_guids=[r['user_guid'] for r in b[1]]),
+                by_group, max_workers=max_workers)
+        else:
+            batch_results = run_concurrently(
+                lambda b: user_groups_method(user_guid=b[0], group_guids=[r['group_guid'] for r in b[1]]),
+                by_user, max_workers=max_workers)
+
+        return _expand_batch_results(batch_results)
+
+    # privilege_records are Dicts of {'privilege': , 'group_name': }, using the Privileges values
+    def bulk_add_privileges_to_groups(self, privilege_records: List[Dict], max_ids_per_call: int = 500,
+                                      max_workers: int = 8) -> BulkResult:
+        return self._bulk_group_privileges(privilege_records, self.rest.group_addprivilege,
+                                           max_ids_per_call=max_ids_per_call, max_workers=max_workers)
+
+    def bulk_remove_privileges_from_groups(self, privilege_records: List[Dict], max_ids_per_call: int = 500,
+                                           max_workers: int = 8) -> BulkResult:
+        return self._bulk_group_privileges(privilege_records, self.rest.group_removeprivilege,
+                                           max_ids_per_call=max_ids_per_call, max_workers=max_workers)
+
+    @staticmethod
+    def _bulk_group_privileges(privilege_records: List[Dict], privilege_method: Callable,
+                               max_ids_per_call: int, max_workers: int) -> BulkResult:
+        # group/addprivilege and group/removeprivilege take a list of groupNames for a single privilege
+        batches = _chunk_records_by_key(privilege_records, 'privilege', max_ids_per_call)
+
+        batch_results = run_concurrently(
+            lambda b: privilege_method(privilege=b[0], group_names=[r['group_name'] for r in b[1]]),
+            batches, max_workers=max_workers)
+
+        return _expand_batch_results(batch_results)
+
     @staticmethod
     def get_group_element_for_user_sync(group_name: str,
                                         display_name: str,
@@ -349,6 +541,62 @@ class PinboardMethods(SharedEndpointMethods):
                                              footer_text=footer_text,
                                              visualization_ids=visualization_ids)
 
+    # Same request as TSRestApiV1.export_pinboard_pdf, but the response is streamed to the file in chunks
+    # rather than held in memory as a single bytes object. Writes to {filename}.part first, so a failed
+    # download never leaves a partial PDF at filename. Returns the number of bytes written
+    def pdf_export_to_file(self, pinboard_id: str, filename: str,
+                           one_visualization_per_page: bool = False,
+                           landscape_or_portrait="LANDSCAPE",
+                           cover_page: bool = True, logo: bool = True,
+                           page_numbers: bool = False, filter_page: bool = True,
+                           truncate_tables: bool = False,
+                           footer_text: str = None,
+                           chunk_size: int = 1024 * 1024) -> int:
+        endpoint = 'export/pinboard/pdf'
+
+        layout_type = 'PINBOARD'
+        if one_visualization_per_page is True:
+            layout_type = 'VISUALIZATION'
+
+        url_params = {
+            'id': pinboard_id,
+            'layout_type': layout_type,
+            'orientation': landscape_or_portrait.upper(),
+            'truncate_tables': str(truncate_tables).lower(),
+            'include_cover_page': str(cover_page).lower(),
+            'include_logo': str(logo).lower(),
+            'include_page_number': str(page_numbers).lower(),
+            'include_filter_page': str(filter_page).lower(),
+        }
+        if footer_text is not None:
+            url_params['footer_text'] = footer_text
+
+        url = self.rest.base_url + endpoint
+        part_filename = filename + '.part'
+        bytes_written = 0
+        with self.rest.requests_session.post(url=url, params=url_params,
+                                             headers={'Accept': 'application/octet-stream'},
+                                             stream=True) as response:
+            response.raise_for_status()
+            try:
+                with open(part_filename, 'wb') as fh:
+                    for chunk in response.iter_content(chunk_size=chunk_size):
+                        fh.write(chunk)
+                        bytes_written += len(chunk)
+            except Exception:
+                if os.path.exists(part_filename):
+                    os.remove(part_filename)
+                raise
+        os.replace(part_filename, filename)
+        return bytes_written
+
+    # jobs are tuples of (pinboard_id, options Dict of pdf_export_to_file() arguments, output filename)
+    def bulk_pdf_export(self, jobs: List[tuple], max_workers: int = 4, retries: int = 2,
+                        retry_backoff_seconds: float = 5) -> BulkResult:
+        export_queue = PdfExportQueue(self, max_workers=max_workers, retries=retries,
+                                      retry_backoff_seconds=retry_backoff_seconds)
+        return export_queue.run(jobs)
+
     # The metadata/details call details the connected data sources on a Pinboard, but it is a very complex response to parse
     def get_referenced_data_sources(self, guid):
         details = self.details(guid=guid)
@@ -365,12 +613,117 @@ class PinboardMethods(SharedEndpointMethods):
         details = self.details(guid=guid)
 
 
+#
+# Runs many PDF exports with bounded concurrency. Each job is retried with a growing backoff on connection errors,
+# HTTP 429 and HTTP 5xx responses. After run(), self.stats holds the counts, total bytes, elapsed time and throughput
+#
+class PdfExportQueue:
+    def __init__(self, pinboard_methods: PinboardMethods, max_workers: int = 4, retries: int = 2,
+                 retry_backoff_seconds: float = 5):
+        self.pinboard_methods = pinboard_methods
+        self.max_workers = max_workers
+        self.retries = retries
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self.stats = {}
+
+    @staticmethod
+    def _is_retryable(e: Exception) -> bool:
+        if isinstance(e, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+            return True
+        if isinstance(e, requests.exceptions.HTTPError) and e.response is not None:
+            return e.response.status_code == 429 or e.response.status_code >= 500
+        return False
+
+    def _export_job(self, job: tuple) -> Dict:
+        pinboard_id, options, filename = job
+        if options is None:
+            options = {}
+        attempt = 0
+        start = time.monotonic()
+        while True:
+            attempt += 1
+            try:
+                bytes_written = self.pinboard_methods.pdf_export_to_file(pinboard_id=pinboard_id,
+                                                                         filename=filename, **options)
+                return {'filename': filename, 'bytes': bytes_written, 'attempts': attempt,
+                        'seconds': time.monotonic() - start}
+            except Exception as e:
+                if attempt > self.retries or self._is_retryable(e) is False:
+                    raise
+                time.sleep(self.retry_backoff_seconds * attempt)
+
+    def run(self, jobs: List[tuple]) -> BulkResult:
+        start = time.monotonic()
+        bulk_result = run_concurrently(self._export_job, jobs, max_workers=self.max_workers)
+        elapsed = time.monotonic() - start
+
+        total_bytes = sum([r['response']['bytes'] for r in bulk_result.succeeded])
+        self.stats = {
+            'jobs': len(jobs),
+            'succeeded': len(bulk_result.succeeded),
+            'failed': len(bulk_result.failed),
+            'bytes': total_bytes,
+            'elapsed_seconds': elapsed,
+            'pdfs_per_second': len(bulk_result.succeeded) / elapsed if elapsed > 0 else 0,
+            'bytes_per_second': total_bytes / elapsed if elapsed > 0 else 0
+        }
+        return bulk_result
+
+
 # Liveboard is renaming of Pinboard. Most APIs have not changed naming
 class LiveboardMethods(PinboardMethods):
 
     def liveboard_info(self, liveboard_guid: str) -> Dict:
         return self.pinboard_info(pinboard_guid=liveboard_guid)
 
+    # vizType of the tiles that have data (rather than text, notes or filters)
+    data_viz_types = ['CHART', 'TABLE', 'HEADLINE']
+
+    def list_viz_ids(self, liveboard_guid: str) -> List[str]:
+        viz_headers = self.rest.metadata_listvizheaders(guid=liveboard_guid)
+        return [v['id'] for v in viz_headers]
+
+    # Headers without a vizType are kept, as not every release reports it
+    def list_data_viz_ids(self, liveboard_guid: str) -> List[str]:
+        viz_headers = self.rest.metadata_listvizheaders(guid=liveboard_guid)
+        return [v['id'] for v in viz_headers if v.get('vizType', self.data_viz_types[0]) in self.data_viz_types]
+
+    # Fetches the data for every viz (tile) on the Liveboard in parallel, rather than in one pinboarddata call
+    # which the server works through one viz at a time. Returns a Dict of viz id : ColumnarDataBuilder
+    # viz_group_size > 1 sends that many vizids in each pinboarddata call (unpaged) instead of paging each viz
+    # Without vizids, every tile with data is fetched; text and note tiles have none, so they are left out
+    def fetch_all_viz_data(self, liveboard_guid: str, vizids: Optional[List[str]] = None, max_workers: int = 8,
+                           viz_group_size: int = 1, batch_size: int = 10000, backend: str = 'numpy',
+                           raise_on_error: bool = True) -> Dict[str, ColumnarDataBuilder]:
+        if vizids is None:
+            vizids = self.list_data_viz_ids(liveboard_guid=liveboard_guid)
+        data_methods = DataMethods(self.rest)
+
+        def fetch_viz_group(viz_group: List[str]) -> Dict[str, ColumnarDataBuilder]:
+            if len(viz_group) == 1:
+                return {viz_group[0]: data_methods.pinboarddata_columnar(pinboard_guid=liveboard_guid,
+                                                                         vizid=viz_group[0],
+                                                                         batch_size=batch_size, backend=backend)}
+            response = self.rest.pinboarddata(pinboard_guid=liveboard_guid, vizids=viz_group,
+                                              format_type='COMPACT')
+            group_results = {}
+            for vizid in viz_group:
+                page = DataMethods.get_result_from_data_response(response, vizid=vizid,
+                                                                 requested_viz_count=len(viz_group))
+                group_results[vizid] = ColumnarDataBuilder.from_pages([page], backend=backend)
+            return group_results
+
+        viz_groups = [vizids[i:i + viz_group_size] for i in range(0, len(vizids), viz_group_size)]
+        bulk_result = run_concurrently(fetch_viz_group, viz_groups, max_workers=max_workers)
+        if raise_on_error is True and bulk_result.all_succeeded is False:
+            failed = bulk_result.failed[0]
+            raise Exception('Fetching data for viz {} failed: {}'.format(failed['record'], failed['error']))
+
+        all_viz_data = {}
+        for r in bulk_result.succeeded:
+            all_viz_data.update(r['response'])
+        return all_viz_data
+
     def share_liveboards(self, shared_liveboard_guids: List[str], permissions: Dict,
                        notify_users: Optional[bool] = False, message: Optional[str] = None,
                        email_shares: Optional[List[str]] = None, use_custom_embed_urls: bool = False):
@@ -450,6 +803,102 @@ class ConnectionMethods(SharedEndpointMethods):
                 tables_for_conn.append(a['header']['id'])
         return tables_for_conn
 
+    # Returns the connection's catalog from cache_file when it exists, is for the same connection and is younger
+    # than max_age_seconds (None reuses it however old), otherwise fetches it with connection_fetch_connection and
+    # saves it to cache_file (if given).
+    # A cached catalog is for browsing and diffing the warehouse: its 'selected' flags are only as new as the
+    # fetch, so connection updates are built with build_add_tables_update(), which always fetches them again
+    def get_catalog(self, connection_guid: str, config_json_string: str, include_columns: bool = True,
+                    cache_file: Optional[str] = None, max_age_seconds: Optional[float] = 3600,
+                    refresh: bool = False) -> ConnectionCatalog:
+        if refresh is False and cache_file is not None and os.path.exists(cache_file):
+            catalog = ConnectionCatalog.load(cache_file)
+            if catalog.connection_guid == connection_guid and \
+                    (max_age_seconds is None or catalog.age_seconds() < max_age_seconds):
+                return catalog
+
+        catalog = ConnectionCatalog.fetch(self.rest, connection_guid=connection_guid,
+                                          config_json_string=config_json_string, include_columns=include_columns)
+        if cache_file is not None:
+            catalog.save(cache_file)
+        return catalog
+
+    # Fetches a new catalog, diffs it against the one saved in cache_file, then saves the new one
+    def refresh_catalog(self, connection_guid: str, config_json_string: str, cache_file: str,
+                        include_columns: bool = True) -> (ConnectionCatalog, Dict[str, List]):
+        previous = None
+        if os.path.exists(cache_file):
+            previous = ConnectionCatalog.load(cache_file)
+            # A cache_file from another connection is replaced, not diffed against
+            if previous.connection_guid != connection_guid:
+                previous = None
+        catalog = self.get_catalog(connection_guid=connection_guid, config_json_string=config_json_string,
+                                   include_columns=include_columns, cache_file=cache_file, refresh=True)
+        if previous is None:
+            return catalog, ConnectionCatalog([]).diff(catalog)
+        return catalog, previous.diff(catalog)
+
+    # Same result as TSRestApiV1.add_new_tables_to_connection, but the connection_fetch_live_columns calls
+    # (one per table) are made concurrently on a pool of max_workers threads instead of inside the nested loops.
+    # The selection pass only marks the tables and collects the work, then the columns are merged back in.
+    # selected_external_databases can be the full externalDatabases list, as the selection pass also does the
+    # work of get_selected_tables_from_connection
+    def add_new_tables_to_connection(self, selected_external_databases, tables_to_add_map, connection_guid: str,
+                                     config_json: str, max_workers: int = 8) -> Dict:
+        config_json_string = json.dumps(config_json)
+
+        # tables_to_add_map may also use the glob and regex rules described on TableSelection
+        external_databases, tables_to_fetch = TableSelection(tables_to_add_map).select(selected_external_databases)
+
+        def fetch_columns(item):
+            db_name, schema_name, table = item
+            return self.rest.connection_fetch_live_columns(connection_guid=connection_guid,
+                                                           config_json_string=config_json_string,
+                                                           database_name=db_name, schema_name=schema_name,
+                                                           table_name=table["name"])
+
+        bulk_result = run_concurrently(fetch_columns, tables_to_fetch, max_workers=max_workers)
+        if bulk_result.all_succeeded is False:
+            # The first failure is raised as it is (usually a requests HTTPError with the server's response), as
+            # TSRestApiV1.add_new_tables_to_connection would, rather than after the other tables are merged in
+            failed = bulk_result.failed[0]
+            if failed['exception'] is not None:
+                raise failed['exception']
+            raise ConnectionError('Fetching live columns for {}.{}.{} failed: {}'.format(
+                failed['record'][0], failed['record'][1], failed['record'][2]['name'], failed['error']))
+
+        for r in bulk_result.results:
+            db_name, schema_name, table = r['record']
+            table_columns = r['response']
+            for t in table_columns:
+                columns_list = []
+                for c in table_columns[t]:
+                    c['selected'] = True  # Select every column
+                    c['isImported'] = False
+                    c['tableName'] = table["name"]
+                    c['schemaName'] = schema_name
+                    c['dbName'] = db_name
+                    columns_list.append(c)
+                table['columns'] = columns_list
+
+        final_response = {"configuration": config_json,
+                          "externalDatabases": external_databases
+                          }
+        return final_response
+
+    # The connection update (for connection_update's metadata_json) adding the tables in tables_to_add_map.
+    # The update must list every table currently selected on the connection or those tables are removed, so it
+    # is always built from a new fetch of the connection, never from a cached catalog. The fetch is without
+    # columns, since 'selected': true keeps an existing table as it is and only the new tables need columns
+    def build_add_tables_update(self, connection_guid: str, config_json: Dict, tables_to_add_map: Dict,
+                                max_workers: int = 8) -> Dict:
+        response = self.rest.connection_fetch_connection(connection_guid=connection_guid,
+                                                         config_json_string=json.dumps(config_json),
+                                                         include_columns=False)
+        return self.add_new_tables_to_connection(response['externalDatabases'], tables_to_add_map,
+                                                 connection_guid=connection_guid, config_json=config_json,
+                                                 max_workers=max_workers)
+
 
 class TableMethods(SharedEndpointMethods):
     def __init__(self, tsrest: TSRestApiV1):
@@ -557,6 +1006,69 @@ class TMLMethods:
         return self.import_tml(tml=tml, create_new_on_server=True,
                                validate_only=False, formattype=formattype)
 
+    # An import with warnings still creates or updates the object
+    import_success_status_codes = ['OK', 'WARNING']
+
+    # Imports many TML documents with one metadata/tml/import call per batch of batch_size documents, batches
+    # running concurrently. Each document gets its own entry in the BulkResult, with its object's part of the
+    # import response. The import policy is ALL_OR_NONE per call, so when a batch is rejected the documents that
+    # had no errors of their own are imported again without the ones that did, until a call is accepted
+    def bulk_import_tml(self, tml_list: List, create_new_on_server=False, validate_only=False,
+                        batch_size: int = 25, max_workers: int = 4) -> BulkResult:
+        batches = [tml_list[i:i + batch_size] for i in range(0, len(tml_list), batch_size)]
+
+        def import_call(tml_docs: List):
+            # (whether the call was rejected, the per object responses)
+            try:
+                response = self.rest.metadata_tml_import(tml=tml_docs, create_new_on_server=create_new_on_server,
+                                                         validate_only=validate_only)
+                return False, response['object']
+            except SyntaxError as e:
+                # raise_tml_errors() raises with the per object responses, which say which documents had errors
+                if len(e.args) > 0 and isinstance(e.args[0], list) and len(e.args[0]) == len(tml_docs):
+                    return True, e.args[0]
+                raise
+
+        def object_status(object_response: Dict) -> Dict:
+            return object_response.get('response', object_response.get('info', {})).get('status', {})
+
+        def import_batch(batch: List) -> List:
+            # Per document in the batch: (its object response, whether it was only rejected with other documents)
+            results = [None] * len(batch)
+            pending = list(range(len(batch)))
+            while len(pending) > 0:
+                call_rejected, object_responses = import_call([batch[i] for i in pending])
+                if call_rejected is False or validate_only is True:
+                    for i, object_response in zip(pending, object_responses):
+                        results[i] = (object_response, False)
+                    break
+                retry = []
+                for i, object_response in zip(pending, object_responses):
+                    if object_status(object_response).get('status_code') in self.import_success_status_codes:
+                        retry.append(i)
+                    results[i] = (object_response, True)
+                # Rejected with no document reporting an error: importing them again won't change anything
+                if len(retry) == len(pending):
+                    break
+                pending = retry
+            return results
+
+        bulk_result = BulkResult()
+        for r in run_concurrently(import_batch, batches, max_workers=max_workers).results:
+            for j, tml in enumerate(r['record']):
+                if r['success'] is False:
+                    bulk_result.add_failure(tml, r['exception'] if r['exception'] is not None else r['error'])
+                    continue
+                object_response, rejected = r['response'][j]
+                status = object_status(object_response)
+                if status.get('status_code') not in self.import_success_status_codes:
+                    bulk_result.add_failure(tml, status.get('error_message', object_response))
+                elif rejected is True:
+                    bulk_result.add_failure(tml, 'Not imported: another document in the same import call had errors')
+                else:
+                    bulk_result.add_success(tml, object_response)
+        return bulk_result
+
     def get_guid_from_import_response(self, response):
         return response['object'][0]['response']['header']['id_guid']
 
@@ -566,4 +1078,288 @@ class TMLMethods:
         if status_code == 'OK':
             return True
         else:
-            return False
\ No newline at end of file
+            return False
+
+
+#
+# Cache of searchdata responses, keyed by the normalized query string, data source, format and paging.
+# Entries expire after ttl_seconds and the least recently used entry is evicted beyond max_entries.
+# When modified_check_interval_seconds is set, the data source's 'modified' time from metadata/listobjectheaders
+# is checked at most that often, and all cached results for the data source are dropped when it has changed
+# Cached responses are shared: every hit returns the same Dict, which callers must treat as read-only.
+# Copying a large response on every hit costs about as much as the request it saves, so copies are only made
+# with copy_results=True, for callers that change the results they get back
+#
+class SearchDataCache:
+    def __init__(self, tsrest: TSRestApiV1, ttl_seconds: float = 300, max_entries: int = 256,
+                 modified_check_interval_seconds: Optional[float] = 60, copy_results: bool = False):
+        self.rest = tsrest
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.modified_check_interval_seconds = modified_check_interval_seconds
+        self.copy_results = copy_results
+
+        # key : (expiry time, response). OrderedDict order is least to most recently used
+        self._entries = OrderedDict()
+        # data_source_guid : (last checked time, modified timestamp from the header)
+        self._data_source_modified = {}
+        self._lock = threading.Lock()
+        # Called with the data_source_guid whenever its entries are invalidated
+        self.invalidation_hooks = []
+
+        self.hits = 0
+        self.misses = 0
+
+    # Whitespace is collapsed and everything outside of quoted values is lower-cased, since search keywords and
+    # [column] references are not case-sensitive but filter values in quotes may be
+    @staticmethod
+    def normalize_query(query_string: str) -> str:
+        parts = re.split(r'(\'[^\']*\'|"[^"]*")', query_string.strip())
+        normalized = []
+        for i, part in enumerate(parts):
+            # re.split with a capture group puts the quoted values at the odd indexes
+            if i % 2 == 1:
+                normalized.append(part)
+            else:
+                normalized.append(re.sub(r'\s+', ' ', part.lower()))
+        return ''.join(normalized)
+
+    def make_key(self, query_string: str, data_source_guid: str, format_type: str, batch_size: int,
+                 page_number: int, offset: int):
+        return (self.normalize_query(query_string), data_source_guid, format_type.upper(), batch_size,
+                page_number, offset)
+
+    def _data_source_modified_time(self, data_source_guid: str):
+        headers = self.rest.metadata_listobjectheaders(object_type=MetadataTypes.TABLE, fetchids=[data_source_guid])
+        if len(headers) == 0:
+            return None
+        return headers[0].get('modified')
+
+    # Drops cached results if the data source has been modified since it was last checked.
+    # The lock is not held during the request; invalidate() takes it again
+    def check_data_source(self, data_source_guid: str, force: bool = False):
+        now = time.monotonic()
+        with self._lock:
+            previous = self._data_source_modified.get(data_source_guid)
+        if force is False and previous is not None and self.modified_check_interval_seconds is not None \
+                and now - previous[0] < self.modified_check_interval_seconds:
+            return
+        modified = self._data_source_modified_time(data_source_guid)
+        with self._lock:
+            # Compare with the latest check, which another thread may have made during the request
+            latest = self._data_source_modified.get(data_source_guid)
+            if latest is not None and latest[0] > now:
+                return
+            self._data_source_modified[data_source_guid] = (now, modified)
+        if latest is not None and latest[1] != modified:
+            self.invalidate(data_source_guid=data_source_guid)
+
+    def invalidate(self, data_source_guid: Optional[str] = None):
+        with self._lock:
+            if data_source_guid is None:
+                self._entries.clear()
+            else:
+                for key in [k for k in self._entries if k[1] == data_source_guid]:
+                    del self._entries[key]
+        for hook in self.invalidation_hooks:
+            hook(data_source_guid)
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            expiry, response = self._entries[key]
+            if time.monotonic() > expiry:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        return copy.deepcopy(response) if self.copy_results is True else response
+
+    def put(self, key, response):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def searchdata(self, query_string: str, data_source_guid: str, format_type: str = 'COMPACT',
+                   batch_size: int = -1, page_number: int = -1, offset: int = -1) -> Dict:
+        if self.modified_check_interval_seconds is not None:
+            self.check_data_source(data_source_guid)
+        key = self.make_key(query_string, data_source_guid, format_type, batch_size, page_number, offset)
+        response = self.get(key)
+        if response is not None:
+            self.hits += 1
+            return response
+        self.misses += 1
+        response = self.rest.searchdata(query_string=query_string, data_source_guid=data_source_guid,
+                                        format_type=format_type, batch_size=batch_size,
+                                        page_number=page_number, offset=offset)
+        self.put(key, response)
+        return copy.deepcopy(response) if self.copy_results is True else response
+
+
+#
+# The searchdata and pinboarddata endpoints default to batch_size=-1, which returns every row in one response.
+# These methods page through the results with batch_size/offset instead, yielding each page as it arrives
+# so that only one page (two with prefetch) is ever held in memory
+#
+class DataMethods:
+    def __init__(self, tsrest: TSRestApiV1, cache: Optional["SearchDataCache"] = None):
+        self.rest = tsrest
+        # Optional result cache for searchdata(), see SearchDataCache below
+        self.cache = cache
+
+    def enable_cache(self, ttl_seconds: float = 300, max_entries: int = 256,
+                     modified_check_interval_seconds: Optional[float] = 60,
+                     copy_results: bool = False) -> "SearchDataCache":
+        self.cache = SearchDataCache(self.rest, ttl_seconds=ttl_seconds, max_entries=max_entries,
+                                     modified_check_interval_seconds=modified_check_interval_seconds,
+                                     copy_results=copy_results)
+        return self.cache
+
+    # searchdata() that goes through the cache when one is enabled
+    def searchdata(self, query_string: str, data_source_guid: str, format_type: str = 'COMPACT',
+                   batch_size: int = -1, page_number: int = -1, offset: int = -1) -> Dict:
+        if self.cache is None:
+            return self.rest.searchdata(query_string=query_string, data_source_guid=data_source_guid,
+                                        format_type=format_type, batch_size=batch_size,
+                                        page_number=page_number, offset=offset)
+        return self.cache.searchdata(query_string=query_string, data_source_guid=data_source_guid,
+                                     format_type=format_type, batch_size=batch_size,
+                                     page_number=page_number, offset=offset)
+
+    # pinboarddata responses are keyed by the viz id, while searchdata responses are the single result itself
+    # requested_viz_count is the number of vizids sent in the request. Only a single viz request falls back to
+    # the only entry in the response when it isn't keyed by the vizid
+    @staticmethod
+    def get_result_from_data_response(data_response: Dict, vizid: Optional[str] = None,
+                                      requested_viz_count: int = 1) -> Dict:
+        if 'data' in data_response:
+            return data_response
+        if vizid is not None and vizid in data_response:
+            return data_response[vizid]
+        if requested_viz_count > 1:
+            raise LookupError('No data section found in response for vizid {}'.format(vizid))
+        # Single viz requested, just take the only entry
+        for k in data_response:
+            if isinstance(data_response[k], dict) and 'data' in data_response[k]:
+                return data_response[k]
+        raise LookupError('No data section found in response')
+
+    @staticmethod
+    def _iter_pages(fetch_page: Callable[[int], Dict], batch_size: int, prefetch: bool = False,
+                    max_rows: Optional[int] = None) -> typing.Iterator[Dict]:
+        if batch_size <= 0:
+            raise ValueError('batch_size must be a positive number of rows for paging')
+
+        rows_seen = 0
+        offset = 0
+        executor = None
+        next_page_future = None
+        if prefetch is True:
+            executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            while True:
+                if next_page_future is not None:
+                    page = next_page_future.result()
+                else:
+                    page = fetch_page(offset)
+                page_rows = len(page.get('data', []))
+                offset += batch_size
+
+                # The last page is the first one that comes back short, or reaches the totalRowCount reported
+                is_last_page = page_rows < batch_size
+                if 'totalRowCount' in page and offset >= page['totalRowCount']:
+                    is_last_page = True
+                if max_rows is not None and rows_seen + page_rows >= max_rows:
+                    is_last_page = True
+
+                # Request the next page while the caller works on this one
+                next_page_future = None
+                if executor is not None and is_last_page is False:
+                    next_page_future = executor.submit(fetch_page, offset)
+
+                if page_rows > 0:
+                    yield page
+                rows_seen += page_rows
+                if is_last_page is True:
+                    break
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=True)
+
+    # Pages come straight from the REST API, not through the cache, so that paging through a large result
+    # doesn't keep every page in memory
+    def iter_searchdata_pages(self, query_string: str, data_source_guid: str, batch_size: int = 10000,
+                              format_type: str = 'COMPACT', prefetch: bool = False,
+                              max_rows: Optional[int] = None) -> typing.Iterator[Dict]:
+        def fetch_page(offset):
+            return self.rest.searchdata(query_string=query_string, data_source_guid=data_source_guid,
+                                        format_type=format_type, batch_size=batch_size, offset=offset)
+
+        return self._iter_pages(fetch_page, batch_size=batch_size, prefetch=prefetch, max_rows=max_rows)
+
+    def iter_searchdata_rows(self, query_string: str, data_source_guid: str, batch_size: int = 10000,
+                             format_type: str = 'COMPACT', prefetch: bool = False,
+                             max_rows: Optional[int] = None) -> typing.Iterator:
+        rows_yielded = 0
+        for page in self.iter_searchdata_pages(query_string=query_string, data_source_guid=data_source_guid,
+                                               batch_size=batch_size, format_type=format_type,
+                                               prefetch=prefetch, max_rows=max_rows):
+            for row in page['data']:
+                yield row
+                rows_yielded += 1
+                if max_rows is not None and rows_yielded >= max_rows:
+                    return
+
+    # Paging only makes sense one viz at a time, since each viz on the Liveboard has a different row count
+    def iter_pinboarddata_pages(self, pinboard_guid: str, vizid: str, batch_size: int = 10000,
+                                format_type: str = 'COMPACT', prefetch: bool = False,
+                                max_rows: Optional[int] = None) -> typing.Iterator[Dict]:
+        def fetch_page(offset):
+            response = self.rest.pinboarddata(pinboard_guid=pinboard_guid, vizids=[vizid],
+                                              format_type=format_type, batch_size=batch_size, offset=offset)
+            return self.get_result_from_data_response(response, vizid=vizid)
+
+        return self._iter_pages(fetch_page, batch_size=batch_size, prefetch=prefetch, max_rows=max_rows)
+
+    def iter_pinboarddata_rows(self, pinboard_guid: str, vizid: str, batch_size: int = 10000,
+                               format_type: str = 'COMPACT', prefetch: bool = False,
+                               max_rows: Optional[int] = None) -> typing.Iterator:
+        rows_yielded = 0
+        for page in self.iter_pinboarddata_pages(pinboard_guid=pinboard_guid, vizid=vizid,
+                                                 batch_size=batch_size, format_type=format_type,
+                                                 prefetch=prefetch, max_rows=max_rows):
+            for row in page['data']:
+                yield row
+                rows_yielded += 1
+                if max_rows is not None and rows_yielded >= max_rows:
+                    return
+
+    # Liveboard is renaming of Pinboard
+    def iter_liveboarddata_rows(self, liveboard_guid: str, vizid: str, batch_size: int = 10000,
+                                format_type: str = 'COMPACT', prefetch: bool = False,
+                                max_rows: Optional[int] = None) -> typing.Iterator:
+        return self.iter_pinboarddata_rows(pinboard_guid=liveboard_guid, vizid=vizid, batch_size=batch_size,
+                                           format_type=format_type, prefetch=prefetch, max_rows=max_rows)
+
+    #
+    # Columnar results: pages are converted into typed arrays as they arrive, see columnar_data.py
+    # backend is 'numpy' or 'arrow'. column_data_types is an optional Dict of column name : ThoughtSpot data type
+    #
+    def searchdata_columnar(self, query_string: str, data_source_guid: str, batch_size: int = 10000,
+                            backend: str = 'numpy', column_data_types: Optional[Dict[str, str]] = None,
+                            prefetch: bool = False, max_rows: Optional[int] = None) -> ColumnarDataBuilder:
+        pages = self.iter_searchdata_pages(query_string=query_string, data_source_guid=data_source_guid,
+                                           batch_size=batch_size, format_type='COMPACT',
+                                           prefetch=prefetch, max_rows=max_rows)
+        return ColumnarDataBuilder.from_pages(pages, backend=backend, column_data_types=column_data_types)
+
+    def pinboarddata_columnar(self, pinboard_guid: str, vizid: str, batch_size: int = 10000,
+                              backend: str = 'numpy', column_data_types: Optional[Dict[str, str]] = None,
+                              prefetch: bool = False, max_rows: Optional[int] = None) -> ColumnarDataBuilder:
+        pages = self.iter_pinboarddata_pages(pinboard_guid=pinboard_guid, vizid=vizid,
+                                             batch_size=batch_size, format_type='COMPACT',
+                                             prefetch=prefetch, max_rows=max_rows)
+        return ColumnarDataBuilder.from_pages(pages, backend=backend, column_data_types=column_data_types)
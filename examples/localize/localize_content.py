@@ -9,17 +9,25 @@
 import argparse
 import json
 import os
+import re
 import requests
 import shutil
 import tempfile
 import yaml
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
 
-from thoughtspot import ThoughtSpot
+from thoughtspot import ThoughtSpot, TSTypes, run_concurrently
+from tml_remap import BulkFQNRemapper
 from deprecated.tml import *
 
 
 THOUGHTSPOT_GUID: str = "thoughtspot.guid"
 
+# Matches any <% token %>.  The token is then looked up in the token table, so every token is replaced in one pass
+# over the content, however many tokens the token file has.
+TOKEN_PATTERN = re.compile(r"<%\s*(.*?)\s*%>")
+
 
 def get_args():
     """Returns the command line arguments."""
@@ -35,8 +43,17 @@ def get_args():
                         help="unique ID (GUID) for the connection the worksheet uses.")
     parser.add_argument("--worksheet", type=str, required=True,
                         help="unique ID (GUID) for the worksheet to localize.")
-    parser.add_argument("--tokenfile", type=str, required=True,
+    parser.add_argument("--tokenfile", type=str, required=False,
                         help="path to the file with the token replacements.")
+    parser.add_argument("--tokenfiles", type=str, nargs="+", required=False,
+                        help="paths to the token files for many locales.  The content is exported once and "
+                        "localized for every token file.")
+    parser.add_argument("--outdir", type=str, required=False,
+                        help="directory to write each locale's TML to, when using --tokenfiles.")
+    parser.add_argument("--max_workers", type=int, required=False,
+                        help="worker processes for localizing with --tokenfiles.  Default is the number of CPUs.")
+    parser.add_argument("--batch_size", type=int, default=25, required=False,
+                        help="TML documents per import call when writing back with --tokenfiles.  Default is 25.")
     parser.add_argument("--writeback", action="store_true", required=False, default=False,
                         help="if true, write the resulting content back to ThoughtSpot as new content.")
     parser.add_argument("--mode", type=str, required=False,
@@ -44,12 +61,17 @@ def get_args():
                         help="if writing back, specifies the if it's for validation, update, or create new.  "
                         "Default is 'validate'")
     parser.add_argument("--outfile", type=str, required=False,
-                        help="path to the file to write to.")
-    parser.add_argument("--include_dependencies", type=bool, default=False, required=False,
-                        help="if true will also localize all of the dependencies.")
+                        help="path to the file to write to.  Not used with --tokenfiles or --include_dependencies, "
+                        "which write to --outdir.")
+    parser.add_argument("--include_dependencies", action="store_true", required=False, default=False,
+                        help="if set, also localize the answers and liveboards that use the worksheet.")
 
     cmdargs = parser.parse_args()
 
+    # Many documents are written, one file each, so a single --outfile can't hold them
+    if cmdargs.outfile and (cmdargs.tokenfiles or cmdargs.include_dependencies):
+        parser.error("--outfile can't be used with --tokenfiles or --include_dependencies, use --outdir instead")
+
     if not valid_args(cmdargs):
         parser.print_help()
         exit(-1)
@@ -59,7 +81,8 @@ def get_args():
 
 def valid_args(cmdargs) -> bool:
     """Does minimal validation on the arguments."""
-    return cmdargs.tsurl and cmdargs.username and cmdargs.password and cmdargs.worksheet
+    return cmdargs.tsurl and cmdargs.username and cmdargs.password and cmdargs.worksheet and \
+        (cmdargs.tokenfile or cmdargs.tokenfiles)
 
 
 def localize_content(cmdargs) -> None:
@@ -79,6 +102,14 @@ def localize_content(cmdargs) -> None:
     # convert to text.
     worksheet_yaml = yaml.dump(worksheet_tml.tml)
 
+    if cmdargs.tokenfiles or cmdargs.include_dependencies:
+        documents = [{"source_guid": None, "content_type": "worksheet",
+                      "name": worksheet_tml.content_name, "yaml": worksheet_yaml}]
+        if cmdargs.include_dependencies:
+            documents.extend(get_dependents(ts, cmdargs.worksheet))
+        localize_all_locales(ts, cmdargs, cmdargs.tokenfiles or [cmdargs.tokenfile], documents)
+        return
+
     worksheet_yaml, worksheet_guid = replace_tokens(worksheet_yaml, cmdargs.tokenfile)
 
     # if this is an update, add the worksheet GUID
@@ -128,6 +159,103 @@ def get_worksheet(ts: ThoughtSpot, connection_guid: str, worksheet_guid: str) ->
     return worksheet_tml
 
 
+def get_dependents(ts: ThoughtSpot, worksheet_guid: str) -> List[Dict]:
+    """
+    Finds the answers and liveboards that use the worksheet and exports their TML concurrently.
+    :param ts: The connection to ThoughtSpot for API calls.
+    :param worksheet_guid: GUID for the worksheet that is being localized
+    :return: A document for each dependent object with its source GUID, content type, name and YAML.
+    """
+    print(f"getting answers and liveboards that use worksheet {worksheet_guid}")
+    dependents = ts.worksheet.get_dependent_objects(worksheet_guids=[worksheet_guid])
+    headers = {}
+    for by_type in dependents.values():
+        for object_type in [TSTypes.ANSWER, TSTypes.PINBOARD]:
+            for header in by_type.get(object_type, []):
+                headers[header["id"]] = header
+
+    print(f"exporting {len(headers)} dependent objects")
+    results = run_concurrently(lambda header: ts.tml.export_tml(guid=header["id"]), list(headers.values()))
+    documents = []
+    for result in results.results:
+        header = result["record"]
+        if result["success"] is False:
+            print(f"\tcould not export {header['name']}: {result['error']}")
+            continue
+        tml = TML(result["response"])
+        tml.remove_guid()  # always remove the old one since we are copying and not updating.
+        content_type = [k for k in tml.tml if k not in ["guid", "id"]][0]
+        documents.append({"source_guid": header["id"], "content_type": content_type, "name": header["name"],
+                          "yaml": yaml.dump(tml.tml)})
+    return documents
+
+
+class TokenTable:
+    """The token to value mappings from a token file, ready to apply to any number of documents."""
+
+    def __init__(self, tokens: Dict[str, str], guid: Optional[str] = None):
+        self.tokens = tokens
+        self.guid = guid
+
+    @staticmethod
+    def from_file(tokenfile: str) -> "TokenTable":
+        """
+        Reads a token file with lines of token=value.  Lines starting with # are ignored.
+        :param tokenfile: The path to the token file
+        :return: The token table.  If a token appears more than once, the first value is used.
+        """
+        tokens = {}
+        guid = None
+        with open(tokenfile) as tkfile:
+            for line in tkfile:
+                line = line.strip()
+                if line.startswith('#') or not "=" in line:
+                    continue
+                (token, value) = map(lambda x: x.strip(), line.split('=', 1))
+                if token == THOUGHTSPOT_GUID and guid is None:
+                    guid = value
+                tokens.setdefault(token, value)
+        return TokenTable(tokens, guid)
+
+    def replace(self, content: str) -> str:
+        """
+        Replaces every known <% token %> in the content in a single pass.  Unknown tokens are left as they are.
+        :param content: The YAML (or any text) for the content
+        :return: The updated content
+        """
+        tokens = self.tokens
+        return TOKEN_PATTERN.sub(lambda m: tokens.get(m.group(1), m.group(0)), content)
+
+
+# token file path : (modified time, size, TokenTable), so a token file is only read once for many documents.
+_token_table_cache = {}
+
+
+def load_token_table(tokenfile: str) -> TokenTable:
+    """
+    Returns the token table for the token file, re-reading the file only if it has changed since last time.
+    :param tokenfile: The path to the token file
+    :return: The token table.
+    """
+    stat = os.stat(tokenfile)
+    path = os.path.abspath(tokenfile)
+    cached = _token_table_cache.get(path)
+    if cached is not None and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+        return cached[2]
+    token_table = TokenTable.from_file(tokenfile)
+    _token_table_cache[path] = (stat.st_mtime_ns, stat.st_size, token_table)
+    return token_table
+
+
+def guid_token(source_guid: Optional[str]) -> str:
+    """
+    Returns the token file key that holds the GUID of the localized copy of an object.
+    :param source_guid: The GUID of the object being localized, or None for the worksheet.
+    :return: thoughtspot.guid for the worksheet, thoughtspot.guid.{source GUID} for dependent content.
+    """
+    return THOUGHTSPOT_GUID if source_guid is None else f"{THOUGHTSPOT_GUID}.{source_guid}"
+
+
 def replace_tokens(content_yaml: str, tokenfile: str) -> (str, str):
     """
     Returns the updated YAML with the tokens replace with values.
@@ -135,21 +263,145 @@ def replace_tokens(content_yaml: str, tokenfile: str) -> (str, str):
     :param tokenfile: The path to the token file
     :return: The updated YAML and the GUID (or None).  The GUID is needed for updates.
     """
+    token_table = load_token_table(tokenfile)
+    return token_table.replace(content_yaml), token_table.guid
 
-    # run through the config file and replace tokens.
-    guid = None
-    with open(tokenfile) as tkfile:
-        for line in tkfile:
-            line = line.strip()
-            if line.startswith('#') or not "=" in line:
-                continue
-            else:
-                (token, value) = map(lambda x: x.strip(), line.split('='))
-                if token == THOUGHTSPOT_GUID:
-                    guid = value
-                content_yaml = re.sub(f"<%\s*{token}\s*%>", value, content_yaml)
 
-    return content_yaml, guid
+def localize_locale(args: tuple) -> tuple:
+    """
+    Localizes the content for one locale.  Runs in a worker process when localizing many locales.
+    :param args: The documents to localize, the path to the locale's token file and the mode.
+    :return: The token file and the localized documents, each with its localized YAML and TML (for importing).
+    """
+    documents, tokenfile, mode = args
+    token_table = load_token_table(tokenfile)
+    localized = []
+    for document in documents:
+        localized_yaml = token_table.replace(document["yaml"])
+        guid = token_table.tokens.get(guid_token(document["source_guid"]))
+        if mode == "update" and guid:
+            localized_yaml = f"guid: {guid}\n{localized_yaml}"
+        localized.append(dict(document, yaml=localized_yaml, tml=yaml.load(localized_yaml, Loader=yaml.Loader)))
+    return tokenfile, localized
+
+
+def localize_all_locales(ts: ThoughtSpot, cmdargs, tokenfiles: List[str], documents: List[Dict]) -> None:
+    """
+    Localizes content that has already been exported for every token file, then writes the results to files and/or
+    imports them with batched TML import calls.  The worksheets are imported first, then the answers and
+    liveboards are pointed at their locale's new worksheet and imported.
+    :param ts: The connection to ThoughtSpot for API calls.
+    :param cmdargs: The command line arguments.
+    :param tokenfiles: The paths to the token files, one per locale.
+    :param documents: The worksheet and any dependent content, with tokens.  See get_dependents().
+    """
+    print(f"localizing {len(documents)} objects for {len(tokenfiles)} token files")
+    jobs = [(documents, tokenfile, cmdargs.mode) for tokenfile in tokenfiles]
+    with ProcessPoolExecutor(max_workers=cmdargs.max_workers) as executor:
+        localized = list(executor.map(localize_locale, jobs))
+
+    validate_only, create_new = import_flags(cmdargs.mode)
+    # token file : {guid token : GUID of the imported object}
+    new_guids = {tokenfile: {} for tokenfile in tokenfiles}
+
+    if cmdargs.writeback:
+        import_documents(ts, cmdargs, [(tokenfile, d) for (tokenfile, docs) in localized
+                                       for d in docs if d["source_guid"] is None], new_guids)
+
+    remapped_tokenfiles = remap_to_localized_worksheet(localized, documents[0], new_guids, cmdargs.mode)
+
+    if cmdargs.outdir:
+        os.makedirs(cmdargs.outdir, exist_ok=True)
+        for tokenfile, docs in localized:
+            for d in docs:
+                source = "" if d["source_guid"] is None else f".{d['source_guid']}"
+                filename = f"{os.path.basename(tokenfile)}{source}.{d['content_type']}.tml"
+                write_yaml_file(os.path.join(cmdargs.outdir, filename), d["yaml"])
+
+    if cmdargs.writeback:
+        dependents = [(tokenfile, d) for (tokenfile, docs) in localized for d in docs if d["source_guid"] is not None]
+        # Without its locale's worksheet, dependent content would be resolved by name, or to an old worksheet.
+        # Validating creates no worksheet to point at, so dependent content is validated as it is, with the
+        # worksheet resolved by name
+        skipped = [(tokenfile, d) for (tokenfile, d) in dependents
+                   if tokenfile not in remapped_tokenfiles and not validate_only]
+        if skipped:
+            print(f"Skipping {len(skipped)} TML documents: their localized worksheet was not imported in this run "
+                  "(or, in update mode, is not in the token file)")
+            for tokenfile, d in skipped:
+                print(f"\t{tokenfile}: {d['content_type']} {d['name']}")
+        dependents = [(tokenfile, d) for (tokenfile, d) in dependents
+                      if tokenfile in remapped_tokenfiles or validate_only]
+        if dependents:
+            import_documents(ts, cmdargs, dependents, new_guids)
+        if not validate_only:
+            for tokenfile, guids in new_guids.items():
+                if guids:
+                    add_guids_to_file(tokenfile, guids)
+
+    if not (cmdargs.outdir or cmdargs.writeback):  # if no other activity, then just dump the results to stdout.
+        for tokenfile, docs in localized:
+            for d in docs:
+                print(f"# {tokenfile}: {d['content_type']} {d['source_guid'] or ''}")
+                print(d["yaml"])
+
+
+def import_documents(ts: ThoughtSpot, cmdargs, documents: List[tuple], new_guids: Dict[str, Dict]) -> None:
+    """
+    Imports localized documents from all locales with batched TML import calls.
+    :param ts: The connection to ThoughtSpot for API calls.
+    :param cmdargs: The command line arguments.
+    :param documents: (token file, localized document) for each document to import.
+    :param new_guids: Updated with the GUID of each imported object, by token file and guid token.
+    """
+    validate_only, create_new = import_flags(cmdargs.mode)
+    print(f"Uploading {len(documents)} TML documents to ThoughtSpot")
+    results = ts.tml.bulk_import_tml([d["tml"] for (tokenfile, d) in documents], create_new_on_server=create_new,
+                                     validate_only=validate_only, batch_size=cmdargs.batch_size)
+    for (tokenfile, d), result in zip(documents, results.results):
+        label = f"{tokenfile}: {d['content_type']} {d['tml'][d['content_type']].get('name')}"
+        if result["success"] is False:
+            print(f"\t{label}: {result['error']}")
+            continue
+        status = result["response"].get("response", {}).get("status", {})
+        if status.get("status_code") == "WARNING":  # imported, with warnings
+            print(f"\t{label}: success with warnings: {status.get('error_message')}")
+        else:
+            print(f"\t{label}: success")
+        guid = result["response"].get("response", {}).get("header", {}).get("id_guid")
+        if guid and not validate_only:  # validating doesn't create anything, so there is no GUID to keep
+            new_guids[tokenfile][guid_token(d["source_guid"])] = guid
+
+
+def remap_to_localized_worksheet(localized: List[tuple], worksheet_document: Dict,
+                                 new_guids: Dict[str, Dict], mode: str) -> set:
+    """
+    Points the answers and liveboards of each locale at that locale's worksheet, by its GUID from the import in this
+    run or, in update mode, from the token file.
+    :param localized: (token file, localized documents) for each locale.
+    :param worksheet_document: The worksheet document before localizing.
+    :param new_guids: The GUIDs of the objects imported so far, by token file and guid token.
+    :param mode: validate, create or update
+    :return: The token files whose dependent content now points at their worksheet.
+    """
+    remapped_tokenfiles = set()
+    for tokenfile, docs in localized:
+        dependents = [d for d in docs if d["source_guid"] is not None]
+        worksheet_guid = new_guids[tokenfile].get(THOUGHTSPOT_GUID)
+        if not worksheet_guid and mode == "update":
+            worksheet_guid = load_token_table(tokenfile).guid
+        if not dependents or not worksheet_guid:
+            continue
+        # Dependent content refers to the worksheet by name: the original name (with tokens) or the localized one
+        localized_worksheet = [d for d in docs if d["source_guid"] is None][0]
+        names = [worksheet_document["name"], localized_worksheet["tml"]["worksheet"]["name"]]
+        remapper = BulkFQNRemapper({name: worksheet_guid for name in names})
+        for d in dependents:
+            report = remapper.remap(d["tml"])
+            if report["substitutions"] > 0:
+                d["yaml"] = yaml.dump(d["tml"])
+        remapped_tokenfiles.add(tokenfile)
+    return remapped_tokenfiles
 
 
 def write_yaml_file(outfile: str, content_yaml) -> None:
@@ -163,17 +415,23 @@ def write_yaml_file(outfile: str, content_yaml) -> None:
         of.writelines(content_yaml)
 
 
-def write_yaml_to_thoughtspot(ts: ThoughtSpot, tokenfile: str, mode: str, content_yaml: str) -> None:
-
+def import_flags(mode: str) -> (bool, bool):
+    """
+    Returns the TML import flags for the mode.
+    :param mode: validate, create or update
+    :return: validate_only and create_new
+    """
     if mode == 'validate':
-        validate_only = True
-        create_new = False
+        return True, False
     elif mode == 'create':
-        validate_only = False
-        create_new = True
+        return False, True
     else:  # update
-        validate_only = False
-        create_new = False
+        return False, False
+
+
+def write_yaml_to_thoughtspot(ts: ThoughtSpot, tokenfile: str, mode: str, content_yaml: str) -> None:
+
+    validate_only, create_new = import_flags(mode)
 
     print("Uploading TML to ThoughtSpot")
     response = ts.tml.upload_tml(yaml.load(content_yaml, Loader=yaml.Loader), create_new_on_server=create_new,
@@ -197,19 +455,31 @@ def add_guid_to_file(tokenfile: str, guid: str) -> None:
     :param guid: The GUID for the object.
     :return: None
     """
+    add_guids_to_file(tokenfile, {THOUGHTSPOT_GUID: guid})
+
+
+def add_guids_to_file(tokenfile: str, guids: Dict[str, str]) -> None:
+    """
+    Adds or replaces GUIDs in the token file for updates.
+    :param tokenfile: The path to the token file.
+    :param guids: The GUID for each guid token (see guid_token()).
+    :return: None
+    """
     tmp, path = tempfile.mkstemp()
 
     with open(tokenfile, "r") as tkfile:
         try:
-            added: bool = False
+            added = set()
             for line in tkfile:
-                if THOUGHTSPOT_GUID in line:
-                    added = True
-                    line = f"{THOUGHTSPOT_GUID}={guid}"
+                token = line.split("=", 1)[0].strip()
+                if token in guids:
+                    added.add(token)
+                    line = f"{token}={guids[token]}" + ("\n" if line.endswith("\n") else "")
                 os.write(tmp, bytearray(line, "UTF-8"))
 
-            if not added:  # GUID wasn't there before, so add it now.
-                os.write(tmp, bytearray(f"\n{THOUGHTSPOT_GUID}={guid}", "UTF-8"))
+            for token, guid in guids.items():  # GUIDs that weren't there before, so add them now.
+                if token not in added:
+                    os.write(tmp, bytearray(f"\n{token}={guid}", "UTF-8"))
 
         except IOError as ioe:
             print(f"Error writing GUID: {ioe}")
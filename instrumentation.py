@@ -0,0 +1,319 @@
+from thoughtspot_rest_api_v1 import *
+from typing import Optional, Dict, List, Callable
+import bisect
+import os
+import re
+import threading
+import time
+#
+# Instrumentation of the HTTP calls made by a TSRestApiV1 object.
+# Every TSRestApiV1 method goes through its requests.Session (.requests_session), so wrapping Session.request
+# on that one object sees every call without changing the library. Each call produces a record Dict:
+#   'endpoint'  path after callosum/v1/tspublic/v1/, with GUIDs replaced by {guid}, e.g. 'metadata/details'
+#   'method'    'GET' / 'POST' ...
+#   'status'    HTTP status code, or None when no response was received (connection error, timeout)
+#   'request_bytes', 'response_bytes'
+#   'latency_seconds'  time until the response (headers only, for stream=True requests)
+#   'retries'   retries made by a urllib3 Retry mounted on the Session, 0 otherwise
+#   'start_time', 'end_time'  time.time() values, 'error' the exception text when there was one
+# Records are passed to every hook, and aggregated per (endpoint, method) into latency histograms.
+#
+# Usage:
+#   instr = RequestInstrumentation().install(ts.tsrest)
+#   ... run the job ...
+#   for row in instr.summary(): print(row)
+#   instr.write_prometheus_textfile('/var/lib/node_exporter/thoughtspot.prom')
+#
+
+guid_pattern = re.compile(r'[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}')
+
+# Upper bounds in seconds, the same as the Prometheus client library defaults plus longer ones for exports
+default_latency_buckets = [0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0,
+                           30.0, 60.0, 120.0]
+
+
+def normalize_endpoint(url: str, base_url: Optional[str] = None) -> str:
+    path = url.split('?', 1)[0]
+    if base_url is not None and path.startswith(base_url):
+        path = path[len(base_url):]
+    elif '/callosum/v1/' in path:
+        path = path.split('/callosum/v1/', 1)[1]
+        if path.startswith('tspublic/v1/'):
+            path = path[len('tspublic/v1/'):]
+    return guid_pattern.sub('{guid}', path)
+
+
+class LatencyHistogram:
+    def __init__(self, buckets: Optional[List[float]] = None):
+        self.buckets = buckets if buckets is not None else default_latency_buckets
+        # One count per bucket plus the final +Inf bucket. Counts are per bucket, not cumulative
+        self.bucket_counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.bucket_counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def cumulative_counts(self) -> List[int]:
+        cumulative = []
+        total = 0
+        for c in self.bucket_counts:
+            total += c
+            cumulative.append(total)
+        return cumulative
+
+    # Estimated by linear interpolation within the bucket holding the quantile, as Prometheus histogram_quantile()
+    def quantile(self, q: float) -> Optional[float]:
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for i, c in enumerate(self.bucket_counts):
+            if cumulative + c >= rank and c > 0:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.max
+                return lower + (upper - lower) * ((rank - cumulative) / c)
+            cumulative += c
+        return self.max
+
+
+class EndpointStats:
+    def __init__(self, buckets: Optional[List[float]] = None):
+        self.latency = LatencyHistogram(buckets)
+        # HTTP status (None for no response) : count
+        self.status_counts = {}
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.retries = 0
+        self.errors = 0
+
+    def add(self, record: Dict):
+        self.latency.observe(record['latency_seconds'])
+        self.status_counts[record['status']] = self.status_counts.get(record['status'], 0) + 1
+        self.request_bytes += record['request_bytes']
+        self.response_bytes += record['response_bytes']
+        self.retries += record['retries']
+        if record['status'] is None or record['status'] >= 400:
+            self.errors += 1
+
+
+class RequestInstrumentation:
+    def __init__(self, hooks: Optional[List[Callable[[Dict], None]]] = None,
+                 latency_buckets: Optional[List[float]] = None):
+        self.hooks = list(hooks) if hooks is not None else []
+        self.latency_buckets = latency_buckets
+        # (endpoint, method) : EndpointStats
+        self.stats = {}
+        self._lock = threading.Lock()
+        self._installed = []
+
+    def add_hook(self, hook: Callable[[Dict], None]):
+        self.hooks.append(hook)
+
+    def install(self, tsrest: TSRestApiV1) -> "RequestInstrumentation":
+        session = tsrest.requests_session
+        original_request = session.request
+        base_url = getattr(tsrest, 'base_url', None)
+
+        def instrumented_request(method, url, *args, **kwargs):
+            return self._timed_request(original_request, base_url, method, url, *args, **kwargs)
+
+        # Set on the instance, so only this Session is affected. Session.get() / .post() call self.request()
+        self._installed.append((session, vars(session).get('request')))
+        session.request = instrumented_request
+        return self
+
+    def uninstall(self):
+        for session, previous_request in reversed(self._installed):
+            if previous_request is not None:
+                session.request = previous_request
+            elif 'request' in vars(session):
+                # Removing the instance attribute uncovers the original Session.request
+                del session.request
+        self._installed = []
+
+    @staticmethod
+    def _request_bytes(kwargs) -> int:
+        body = kwargs.get('data') if kwargs.get('data') is not None else kwargs.get('json')
+        if body is None:
+            return 0
+        if isinstance(body, (bytes, str)):
+            return len(body)
+        # Form fields and JSON bodies are encoded by requests; this approximation avoids encoding them twice
+        return len(str(body))
+
+    def _timed_request(self, original_request, base_url, method, url, *args, **kwargs):
+        record = {'endpoint': normalize_endpoint(url, base_url),
+                  'method': method.upper(),
+                  'status': None,
+                  'request_bytes': self._request_bytes(kwargs),
+                  'response_bytes': 0,
+                  'retries': 0,
+                  'error': None,
+                  'start_time': time.time()}
+        start = time.perf_counter()
+        try:
+            response = original_request(method, url, *args, **kwargs)
+        except Exception as e:
+            record['latency_seconds'] = time.perf_counter() - start
+            record['end_time'] = time.time()
+            record['error'] = str(e)
+            self.record(record)
+            raise
+        record['latency_seconds'] = time.perf_counter() - start
+        record['end_time'] = time.time()
+        record['status'] = response.status_code
+        # Reading .content on a streamed response would defeat the streaming, so use the header instead
+        if kwargs.get('stream') is True:
+            record['response_bytes'] = int(response.headers.get('Content-Length', 0))
+        else:
+            record['response_bytes'] = len(response.content)
+        retry_state = getattr(response.raw, 'retries', None)
+        if retry_state is not None and getattr(retry_state, 'history', None):
+            record['retries'] = len(retry_state.history)
+        self.record(record)
+        return response
+
+    def record(self, record: Dict):
+        key = (record['endpoint'], record['method'])
+        with self._lock:
+            if key not in self.stats:
+                self.stats[key] = EndpointStats(self.latency_buckets)
+            self.stats[key].add(record)
+        # Hooks run outside the lock, on the thread that made the call
+        for hook in self.hooks:
+            hook(record)
+
+    def reset(self):
+        with self._lock:
+            self.stats = {}
+
+    # One Dict per (endpoint, method), sorted by total time descending, to see which calls dominate a run
+    def summary(self) -> List[Dict]:
+        rows = []
+        with self._lock:
+            for (endpoint, method), s in self.stats.items():
+                rows.append({'endpoint': endpoint,
+                             'method': method,
+                             'count': s.latency.count,
+                             'errors': s.errors,
+                             'retries': s.retries,
+                             'total_seconds': s.latency.sum,
+                             'mean_seconds': s.latency.sum / s.latency.count,
+                             'p50_seconds': s.latency.quantile(0.5),
+                             'p95_seconds': s.latency.quantile(0.95),
+                             'max_seconds': s.latency.max,
+                             'request_bytes': s.request_bytes,
+                             'response_bytes': s.response_bytes,
+                             'status_counts': dict(s.status_counts)})
+        rows.sort(key=lambda r: r['total_seconds'], reverse=True)
+        return rows
+
+    #
+    # Prometheus text exposition format
+    #
+    @staticmethod
+    def _labels(**labels) -> str:
+        parts = []
+        for k, v in labels.items():
+            v = str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+            parts.append('{}="{}"'.format(k, v))
+        return '{' + ','.join(parts) + '}'
+
+    def prometheus_text(self, prefix: str = 'thoughtspot_rest') -> str:
+        lines = ['# HELP {}_requests_total Requests by endpoint, method and status'.format(prefix),
+                 '# TYPE {}_requests_total counter'.format(prefix)]
+        with self._lock:
+            stats = sorted(self.stats.items())
+            for (endpoint, method), s in stats:
+                for status, count in sorted(s.status_counts.items(), key=lambda i: str(i[0])):
+                    labels = self._labels(endpoint=endpoint, method=method,
+                                          status=status if status is not None else 'error')
+                    lines.append('{}_requests_total{} {}'.format(prefix, labels, count))
+
+            lines.append('# HELP {}_request_duration_seconds Request latency'.format(prefix))
+            lines.append('# TYPE {}_request_duration_seconds histogram'.format(prefix))
+            for (endpoint, method), s in stats:
+                h = s.latency
+                for bound, count in zip(h.buckets + ['+Inf'], h.cumulative_counts()):
+                    labels = self._labels(endpoint=endpoint, method=method, le=bound)
+                    lines.append('{}_request_duration_seconds_bucket{} {}'.format(prefix, labels, count))
+                labels = self._labels(endpoint=endpoint, method=method)
+                lines.append('{}_request_duration_seconds_sum{} {}'.format(prefix, labels, h.sum))
+                lines.append('{}_request_duration_seconds_count{} {}'.format(prefix, labels, h.count))
+
+            for metric, attr, help_text in [('request_bytes_total', 'request_bytes', 'Request body bytes'),
+                                            ('response_bytes_total', 'response_bytes', 'Response body bytes'),
+                                            ('retries_total', 'retries', 'Retries made by the transport')]:
+                lines.append('# HELP {}_{} {}'.format(prefix, metric, help_text))
+                lines.append('# TYPE {}_{} counter'.format(prefix, metric))
+                for (endpoint, method), s in stats:
+                    labels = self._labels(endpoint=endpoint, method=method)
+                    lines.append('{}_{}{} {}'.format(prefix, metric, labels, getattr(s, attr)))
+        return '\n'.join(lines) + '\n'
+
+    # For the node_exporter textfile collector. Written then renamed, so a scrape never sees a partial file
+    def write_prometheus_textfile(self, filename: str, prefix: str = 'thoughtspot_rest') -> str:
+        tmp_file = filename + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as fh:
+            fh.write(self.prometheus_text(prefix=prefix))
+        os.replace(tmp_file, filename)
+        return filename
+
+
+#
+# Span hooks, for add_hook(). SpanRecorder keeps OpenTelemetry-shaped span Dicts in memory (to dump as JSON or
+# forward elsewhere); opentelemetry_hook() sends real spans through the opentelemetry-api package when installed
+#
+class SpanRecorder:
+    def __init__(self, max_spans: Optional[int] = None):
+        self.spans = []
+        self.max_spans = max_spans
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def span_attributes(record: Dict) -> Dict:
+        attributes = {'http.method': record['method'],
+                      'http.route': record['endpoint'],
+                      'http.request_content_length': record['request_bytes'],
+                      'http.response_content_length': record['response_bytes'],
+                      'thoughtspot.retries': record['retries']}
+        if record['status'] is not None:
+            attributes['http.status_code'] = record['status']
+        return attributes
+
+    def __call__(self, record: Dict):
+        span = {'name': '{} {}'.format(record['method'], record['endpoint']),
+                'start_time_unix_nano': int(record['start_time'] * 1e9),
+                'end_time_unix_nano': int(record['end_time'] * 1e9),
+                'attributes': self.span_attributes(record),
+                'status': 'ERROR' if record['status'] is None or record['status'] >= 400 else 'OK'}
+        if record['error'] is not None:
+            span['attributes']['exception.message'] = record['error']
+        with self._lock:
+            self.spans.append(span)
+            if self.max_spans is not None and len(self.spans) > self.max_spans:
+                self.spans.pop(0)
+
+
+def opentelemetry_hook(tracer=None) -> Callable[[Dict], None]:
+    try:
+        from opentelemetry import trace
+    except ImportError:
+        raise ImportError('opentelemetry-api is required for opentelemetry_hook(): pip install opentelemetry-api')
+    if tracer is None:
+        tracer = trace.get_tracer('thoughtspot_rest_api')
+
+    def hook(record: Dict):
+        span = tracer.start_span('{} {}'.format(record['method'], record['endpoint']),
+                                 start_time=int(record['start_time'] * 1e9),
+                                 attributes=SpanRecorder.span_attributes(record))
+        if record['status'] is None or record['status'] >= 400:
+            span.set_status(trace.Status(trace.StatusCode.ERROR, record['error']))
+        span.end(end_time=int(record['end_time'] * 1e9))
+
+    return hook
@@ -0,0 +1,196 @@
+from typing import Optional, Dict, List, Union
+from collections import OrderedDict
+from collections.abc import MutableMapping
+import json
+import re
+
+import yaml
+#
+# Lazy views over TML documents, for reading a few properties (guid, name, table references) from many files
+# without parsing each whole document.
+#
+# LazyTMLMapping is a MutableMapping over the raw YAML text. Creating it only finds where each key of a mapping
+# starts (one regex pass over the lines at that indentation); a value is parsed by the YAML loader the first time
+# it is read, and nested block mappings are themselves LazyTMLMappings. So reading guid and the content name of a
+# Worksheet parses two short lines, not the thousands of lines of worksheet_columns.
+#
+# The thoughtspot_tml classes (TML, Worksheet, Table, Answer, Liveboard ...) only use mapping operations on the
+# Dict they wrap, so they work unchanged over a LazyTMLMapping, with the same property API:
+#   ws = lazy_tml_object(open('sales.worksheet.tml').read())
+#   print(ws.guid, ws.content_name, [t['name'] for t in ws.tables])
+# Values read are cached, so changes made through the TML objects are kept, and materialize() returns the whole
+# document as an OrderedDict (parsing whatever was not read yet), e.g. before YAMLTML.dump_tml_object()
+#
+# JSON TML is parsed in full, since json.loads is already fast
+#
+
+# The C LibYAML loader is many times faster than the pure Python one, when PyYAML was built with it
+yaml_loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+def load_yaml(text: str):
+    return yaml.load(text, Loader=yaml_loader)
+
+
+class LazyTMLMapping(MutableMapping):
+    # Block scalars (| or >) and anything on the following lines are parsed together with the key line
+    key_line_template = r'^ {{{indent}}}((?:"[^"\n]*"|\'[^\'\n]*\'|[^\s#\-"\'][^:\n]*?)):(?=[ \t]|$)'
+
+    def __init__(self, text: str, start: int = 0, end: Optional[int] = None, indent: int = 0):
+        self._text = text
+        self._start = start
+        self._end = end if end is not None else len(text)
+        self._indent = indent
+        # key : (start of the key line, end of the value), in document order. Built on first use
+        self._spans = None
+        self._keys = None
+        # key : value already parsed (or set)
+        self._values = {}
+        self._deleted = set()
+
+    def _index(self):
+        if self._spans is not None:
+            return
+        pattern = re.compile(self.key_line_template.format(indent=self._indent), re.MULTILINE)
+        starts = []
+        for m in pattern.finditer(self._text, self._start, self._end):
+            key = m.group(1)
+            if key[0] in '"\'':
+                key = key[1:-1]
+            starts.append((key, m.start()))
+        self._spans = {}
+        self._keys = []
+        for i, (key, key_start) in enumerate(starts):
+            value_end = starts[i + 1][1] if i + 1 < len(starts) else self._end
+            self._spans[key] = (key_start, value_end)
+            self._keys.append(key)
+
+    @staticmethod
+    def _first_content_line(text: str, start: int, end: int):
+        pos = start
+        while pos < end:
+            line_end = text.find('\n', pos, end)
+            if line_end == -1:
+                line_end = end
+            line = text[pos:line_end]
+            stripped = line.lstrip(' ')
+            if stripped != '' and not stripped.startswith('#'):
+                return len(line) - len(stripped), stripped
+            pos = line_end + 1
+        return None, None
+
+    def _parse_value(self, key: str):
+        key_start, value_end = self._spans[key]
+        line_end = self._text.find('\n', key_start, value_end)
+        if line_end == -1:
+            line_end = value_end
+        after_colon = self._text[key_start:line_end].split(':', 1)[1].strip() if ':' in self._text[key_start:line_end] else ''
+        # A key with nothing after the colon, followed by a more indented mapping, becomes a nested lazy mapping
+        if after_colon == '' or after_colon.startswith('#'):
+            child_indent, child_line = self._first_content_line(self._text, line_end + 1, value_end)
+            if child_indent is not None and child_indent > self._indent and not child_line.startswith('-'):
+                return LazyTMLMapping(self._text, line_end + 1, value_end, child_indent)
+        # Anything else (scalars, lists, flow values, block scalars) is parsed as a one-key fragment
+        parsed = load_yaml(self._text[key_start:value_end])
+        return parsed[key] if isinstance(parsed, dict) and key in parsed else None
+
+    #
+    # MutableMapping interface
+    #
+    def __getitem__(self, key):
+        if key in self._values:
+            return self._values[key]
+        self._index()
+        if key in self._deleted or key not in self._spans:
+            raise KeyError(key)
+        value = self._parse_value(key)
+        self._values[key] = value
+        return value
+
+    def __setitem__(self, key, value):
+        self._index()
+        self._deleted.discard(key)
+        if key not in self._spans and key not in self._keys:
+            self._keys.append(key)
+        self._values[key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self._values.pop(key, None)
+        self._deleted.add(key)
+
+    def __contains__(self, key):
+        if key in self._values:
+            return True
+        self._index()
+        return key in self._spans and key not in self._deleted
+
+    def __iter__(self):
+        self._index()
+        for key in self._keys:
+            if key not in self._deleted:
+                yield key
+
+    def __len__(self):
+        self._index()
+        return len([k for k in self._keys if k not in self._deleted])
+
+    def __repr__(self):
+        return 'LazyTMLMapping({})'.format(list(self))
+
+    # The whole document as plain OrderedDicts and lists, keeping any values changed through the view
+    def materialize(self) -> OrderedDict:
+        result = OrderedDict()
+        for key in self:
+            value = self[key]
+            result[key] = value.materialize() if isinstance(value, LazyTMLMapping) else value
+        return result
+
+
+def load_lazy_tml(tml_text: str) -> Union[LazyTMLMapping, OrderedDict]:
+    if tml_text.lstrip().startswith('{'):
+        return json.loads(tml_text, object_pairs_hook=OrderedDict)
+    return LazyTMLMapping(tml_text)
+
+
+def open_lazy_tml(filename: str) -> Union[LazyTMLMapping, OrderedDict]:
+    with open(filename, 'r', encoding='utf-8') as fh:
+        return load_lazy_tml(fh.read())
+
+
+def tml_content_type(tml_mapping) -> Optional[str]:
+    # Connections have a top level 'type' rather than a content key, as in thoughtspot_tml.TML
+    top_level_type = tml_mapping.get('type')
+    if isinstance(top_level_type, str) and top_level_type.startswith('RDBMS'):
+        return 'connection'
+    for key in tml_mapping:
+        if key not in ['guid', 'id']:
+            return key
+    return None
+
+
+# The thoughtspot_tml class for the document's content type, wrapping the lazy mapping
+def lazy_tml_object(tml_text_or_mapping):
+    import thoughtspot_tml
+    tml_mapping = load_lazy_tml(tml_text_or_mapping) if isinstance(tml_text_or_mapping, str) else tml_text_or_mapping
+    tml_classes = {'worksheet': thoughtspot_tml.Worksheet,
+                   'table': thoughtspot_tml.Table,
+                   'view': thoughtspot_tml.View,
+                   'sql_view': thoughtspot_tml.SQLView,
+                   'answer': thoughtspot_tml.Answer,
+                   'pinboard': thoughtspot_tml.Pinboard,
+                   'liveboard': thoughtspot_tml.Liveboard,
+                   'connection': thoughtspot_tml.Connection}
+    return tml_classes.get(tml_content_type(tml_mapping), thoughtspot_tml.TML)(tml_mapping)
+
+
+# guid, content type and name of a TML document, parsing only those lines
+def tml_header(tml_text: str) -> Dict[str, Optional[str]]:
+    tml_mapping = load_lazy_tml(tml_text)
+    content_type = tml_content_type(tml_mapping)
+    content = tml_mapping.get(content_type) if content_type is not None else None
+    name = content.get('name') if isinstance(content, MutableMapping) or isinstance(content, dict) else None
+    if content_type == 'connection':
+        name = tml_mapping.get('name')
+    return {'guid': tml_mapping.get('guid', tml_mapping.get('id')), 'content_type': content_type, 'name': name}
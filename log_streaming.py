@@ -0,0 +1,418 @@
+#!/usr/bin/env python3
+from thoughtspot_rest_api_v1 import *
+from typing import Optional, Dict, List, TextIO
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import sys
+import time
+
+import requests
+#
+# Streaming consumer for the logs/topics endpoint (TSRestApiV1.logs_topics).
+# Instead of one request for a whole from_epoch/to_epoch range, the range is walked in time windows whose size
+# adapts to the volume of events: a window returning more than max_events_per_window is split in half and
+# requested again, and quiet windows grow back up to max_window_ms.
+# A checkpoint of the position (timestamp of the last event emitted, plus the keys of the events emitted in the
+# last late_event_ms before it) is saved to disk, so a restarted consumer resumes exactly where the previous one
+# stopped. An event only counts as emitted once the consumer asks for the next one, so delivery is at-least-once:
+# the event being handled when a consumer stops is emitted again on restart.
+# Events can reach the log after later ones (late arrivals). Every request re-reads the late_event_ms before the
+# position, and emits the events in it that haven't been emitted yet, so an event is only missed if it arrives
+# more than late_event_ms after the events around it.
+#
+# All epochs are in milliseconds, as used by the logs/topics endpoint
+#
+
+
+def epoch_ms_now() -> int:
+    return int(time.time() * 1000)
+
+
+# Each log event is a Dict with a 'date' in ISO format and a 'log' that is itself a JSON string
+def parse_log_event(raw_event: Dict) -> Dict:
+    event = dict(raw_event)
+    if isinstance(event.get('log'), str):
+        try:
+            event['log'] = json.loads(event['log'])
+        except ValueError:
+            pass
+    event['epoch_ms'] = event_epoch_ms(event)
+    return event
+
+
+def event_epoch_ms(event: Dict) -> Optional[int]:
+    if 'epoch_ms' in event:
+        return event['epoch_ms']
+    date_str = event.get('date')
+    if date_str is None:
+        return None
+    # fromisoformat() before Python 3.11 does not accept the 'Z' suffix
+    if date_str.endswith('Z'):
+        date_str = date_str[:-1] + '+00:00'
+    d = datetime.datetime.fromisoformat(date_str)
+    if d.tzinfo is None:
+        d = d.replace(tzinfo=datetime.timezone.utc)
+    return int(d.timestamp() * 1000)
+
+
+# Identity of an event for de-duplication, as the same event can be returned by two overlapping windows
+def event_key(event: Dict) -> str:
+    log = event.get('log')
+    if isinstance(log, dict) and 'id' in log:
+        return str(log['id'])
+    return hashlib.sha1(json.dumps(event.get('log'), sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+class LogStreamConsumer:
+    def __init__(self, tsrest: TSRestApiV1, topic: str = 'security_logs', checkpoint_file: Optional[str] = None,
+                 initial_window_ms: int = 15 * 60 * 1000, min_window_ms: int = 1000,
+                 max_window_ms: int = 24 * 60 * 60 * 1000, max_events_per_window: int = 5000,
+                 late_event_ms: int = 5 * 60 * 1000):
+        self.rest = tsrest
+        self.topic = topic
+        self.checkpoint_file = checkpoint_file
+        self.window_ms = initial_window_ms
+        self.min_window_ms = min_window_ms
+        self.max_window_ms = max_window_ms
+        self.max_events_per_window = max_events_per_window
+        self.late_event_ms = late_event_ms
+
+        # Position: every event before position_epoch had been emitted when it was read. recent_keys holds
+        # key : timestamp of the events emitted from late_event_ms before position_epoch onwards, so re-reading
+        # that overlap only emits the late arrivals. start_epoch is the from_epoch of the first run, which the
+        # overlap never goes before
+        self.position_epoch = None
+        self.recent_keys = {}
+        self.start_epoch = None
+        # Called before each checkpoint is saved, e.g. to flush the output the events were written to
+        self.before_checkpoint = None
+        self.load_checkpoint()
+
+    #
+    # Checkpoint handling
+    #
+    def load_checkpoint(self):
+        if self.checkpoint_file is None or os.path.exists(self.checkpoint_file) is False:
+            return
+        with open(self.checkpoint_file, 'r', encoding='utf-8') as fh:
+            checkpoint = json.load(fh)
+        if checkpoint.get('topic', self.topic) != self.topic:
+            raise ValueError('Checkpoint file {} is for topic {}'.format(self.checkpoint_file, checkpoint['topic']))
+        self.position_epoch = checkpoint['position_epoch']
+        if 'recent_keys' in checkpoint:
+            self.recent_keys = checkpoint['recent_keys']
+        else:
+            # Checkpoint written before late arrivals were re-read: only the keys at the position
+            self.recent_keys = {k: self.position_epoch for k in checkpoint.get('emitted_keys_at_position', [])}
+        self.start_epoch = checkpoint.get('start_epoch')
+        self.window_ms = checkpoint.get('window_ms', self.window_ms)
+
+    def save_checkpoint(self):
+        if self.checkpoint_file is None or self.position_epoch is None:
+            return
+        if self.before_checkpoint is not None:
+            self.before_checkpoint()
+        checkpoint = {'topic': self.topic,
+                      'position_epoch': self.position_epoch,
+                      'recent_keys': self.recent_keys,
+                      'start_epoch': self.start_epoch,
+                      'window_ms': self.window_ms}
+        # Write then rename, so a crash mid-write never leaves a corrupt checkpoint
+        tmp_file = self.checkpoint_file + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as fh:
+            json.dump(checkpoint, fh)
+        os.replace(tmp_file, self.checkpoint_file)
+
+    #
+    # Fetching
+    #
+    def fetch_window(self, from_epoch: int, to_epoch: int) -> List[Dict]:
+        response = self.rest.logs_topics(topic=self.topic, from_epoch=str(from_epoch), to_epoch=str(to_epoch))
+        events = [parse_log_event(e) for e in response]
+        # Events without a date sort to the start of their window
+        events.sort(key=lambda e: e['epoch_ms'] if e['epoch_ms'] is not None else from_epoch)
+        return events
+
+    # Fetches [overlap_from_epoch, to_epoch], with the window after from_epoch split in half until it is small
+    # enough. The overlap before from_epoch is always read in full.
+    # Returns the events and the end of the window actually covered, which may be before to_epoch
+    def _fetch_adaptive(self, overlap_from_epoch: int, from_epoch: int, to_epoch: int) -> (List[Dict], int):
+        window_end = min(to_epoch, from_epoch + self.window_ms)
+        while True:
+            events = self.fetch_window(overlap_from_epoch, window_end)
+            window_size = window_end - from_epoch
+            # The window is sized on the events after from_epoch, the overlap being the same every time
+            window_events = len([e for e in events if e['epoch_ms'] is None or e['epoch_ms'] >= from_epoch])
+            if window_events > self.max_events_per_window and window_size > self.min_window_ms:
+                self.window_ms = max(self.min_window_ms, window_size // 2)
+                window_end = from_epoch + self.window_ms
+                continue
+            # Quiet window, try a bigger one next time
+            if window_events < self.max_events_per_window // 4:
+                self.window_ms = min(self.max_window_ms, self.window_ms * 2)
+            return events, window_end
+
+    def events(self, from_epoch: Optional[int] = None, to_epoch: Optional[int] = None, follow: bool = False,
+               poll_interval_seconds: float = 60, checkpoint_every: int = 1000):
+        # A checkpoint overrides from_epoch, so that restarts resume rather than start over
+        if self.position_epoch is None:
+            if from_epoch is None:
+                from_epoch = epoch_ms_now() - self.window_ms
+            self.position_epoch = from_epoch
+            self.start_epoch = from_epoch
+            self.recent_keys = {}
+
+        emitted_since_checkpoint = 0
+        while True:
+            end_epoch = to_epoch if to_epoch is not None else epoch_ms_now()
+            if self.position_epoch >= end_epoch:
+                if follow is False or to_epoch is not None:
+                    break
+                time.sleep(poll_interval_seconds)
+                continue
+
+            overlap_from = self.position_epoch - self.late_event_ms
+            if self.start_epoch is not None:
+                overlap_from = max(overlap_from, self.start_epoch)
+            events, window_end = self._fetch_adaptive(overlap_from, self.position_epoch, end_epoch)
+            for event in events:
+                ts = event['epoch_ms'] if event['epoch_ms'] is not None else self.position_epoch
+                key = event_key(event)
+                # Already emitted: in the overlap, or stamped exactly at the end of the previous window
+                if ts < overlap_from or key in self.recent_keys:
+                    continue
+
+                yield event
+
+                self.recent_keys[key] = ts
+                if ts > self.position_epoch:
+                    self.position_epoch = ts
+                emitted_since_checkpoint += 1
+                if emitted_since_checkpoint >= checkpoint_every:
+                    self.save_checkpoint()
+                    emitted_since_checkpoint = 0
+
+            # The whole window has been emitted, so its end is the new position. Only the keys the next overlap
+            # can return again are kept
+            if window_end > self.position_epoch:
+                self.position_epoch = window_end
+            oldest_kept = self.position_epoch - self.late_event_ms
+            self.recent_keys = {k: ts for k, ts in self.recent_keys.items() if ts >= oldest_kept}
+            self.save_checkpoint()
+            emitted_since_checkpoint = 0
+
+    # Writes each event as one line of JSON to the output, which is a filename (appended to) or a file object.
+    # The output is flushed before every checkpoint, so the checkpoint never gets ahead of what was written
+    def forward(self, output, from_epoch: Optional[int] = None, to_epoch: Optional[int] = None,
+                follow: bool = False, poll_interval_seconds: float = 60, checkpoint_every: int = 1000) -> int:
+        if isinstance(output, str):
+            with open(output, 'a', encoding='utf-8') as fh:
+                return self._forward_to(fh, from_epoch, to_epoch, follow, poll_interval_seconds, checkpoint_every)
+        return self._forward_to(output, from_epoch, to_epoch, follow, poll_interval_seconds, checkpoint_every)
+
+    def _forward_to(self, fh: TextIO, from_epoch, to_epoch, follow, poll_interval_seconds, checkpoint_every) -> int:
+        count = 0
+        self.before_checkpoint = fh.flush
+        try:
+            for event in self.events(from_epoch=from_epoch, to_epoch=to_epoch, follow=follow,
+                                     poll_interval_seconds=poll_interval_seconds,
+                                     checkpoint_every=checkpoint_every):
+                fh.write(json.dumps(event, default=str))
+                fh.write('\n')
+                count += 1
+        finally:
+            self.before_checkpoint = None
+            fh.flush()
+        return count
+
+
+#
+# Backfill of a long range (months of security_logs) as gzip compressed JSON Lines, one file per UTC day.
+# The range is cut into windows that never cross midnight, which are fetched concurrently by a thread pool.
+# Each window keeps only the events in [window start, window end), so an event on a boundary belongs to exactly
+# one window; event keys from the previous window are also checked in case the server returns an event twice.
+# Results are consumed in window order, so each day file is written in time order and finished before the next
+# starts. Day files are written as .part and renamed when the whole day is done; completed days are skipped on a
+# re-run
+#
+class LogBackfill:
+    def __init__(self, tsrest: TSRestApiV1, topic: str = 'security_logs', window_ms: int = 60 * 60 * 1000,
+                 max_workers: int = 8, max_events_per_window: int = 5000, min_window_ms: int = 1000):
+        self.rest = tsrest
+        self.topic = topic
+        self.window_ms = window_ms
+        self.max_workers = max_workers
+        self.max_events_per_window = max_events_per_window
+        self.min_window_ms = min_window_ms
+        # { 'YYYY-MM-DD' : events written } for the days the last run() left as .part
+        self.partial_day_counts = {}
+
+    @staticmethod
+    def day_of_epoch(epoch_ms: int) -> str:
+        return datetime.datetime.fromtimestamp(epoch_ms / 1000, tz=datetime.timezone.utc).strftime('%Y-%m-%d')
+
+    @staticmethod
+    def _midnight(epoch_ms: int) -> int:
+        d = datetime.datetime.fromtimestamp(epoch_ms / 1000, tz=datetime.timezone.utc)
+        midnight = datetime.datetime(d.year, d.month, d.day, tzinfo=datetime.timezone.utc)
+        return int(midnight.timestamp() * 1000)
+
+    @staticmethod
+    def _next_midnight(epoch_ms: int) -> int:
+        d = datetime.datetime.fromtimestamp(epoch_ms / 1000, tz=datetime.timezone.utc)
+        midnight = datetime.datetime(d.year, d.month, d.day, tzinfo=datetime.timezone.utc) + datetime.timedelta(days=1)
+        return int(midnight.timestamp() * 1000)
+
+    def day_filename(self, output_dir: str, day: str) -> str:
+        return os.path.join(output_dir, '{}-{}.jsonl.gz'.format(self.topic, day))
+
+    # (start, end) windows covering [from_epoch, to_epoch), split at every UTC midnight
+    def windows(self, from_epoch: int, to_epoch: int) -> List[tuple]:
+        windows = []
+        start = from_epoch
+        while start < to_epoch:
+            end = min(start + self.window_ms, self._next_midnight(start), to_epoch)
+            windows.append((start, end))
+            start = end
+        return windows
+
+    # Events in [start, end), in time order. A window with too many events is fetched again as two halves
+    def fetch_window(self, start: int, end: int) -> List[Dict]:
+        response = self.rest.logs_topics(topic=self.topic, from_epoch=str(start), to_epoch=str(end))
+        if len(response) > self.max_events_per_window and end - start > self.min_window_ms:
+            middle = start + (end - start) // 2
+            return self.fetch_window(start, middle) + self.fetch_window(middle, end)
+        events = []
+        for raw_event in response:
+            event = parse_log_event(raw_event)
+            ts = event['epoch_ms'] if event['epoch_ms'] is not None else start
+            if start <= ts < end:
+                events.append(event)
+        events.sort(key=lambda e: e['epoch_ms'] if e['epoch_ms'] is not None else start)
+        return events
+
+    # Fetches windows with up to max_workers requests in flight, yielding (window, events) in window order.
+    # Only a bounded number of windows are submitted ahead, so memory doesn't grow with the length of the range
+    def _fetch_in_order(self, windows: List[tuple]):
+        max_ahead = self.max_workers * 2
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = []
+            next_window = 0
+            while next_window < len(windows) or len(pending) > 0:
+                while next_window < len(windows) and len(pending) < max_ahead:
+                    w = windows[next_window]
+                    pending.append((w, executor.submit(self.fetch_window, w[0], w[1])))
+                    next_window += 1
+                w, future = pending.pop(0)
+                yield w, future.result()
+
+    # Returns { 'YYYY-MM-DD' : events written } for the days this run finalized. Days left as .part are in
+    # partial_day_counts
+    def run(self, from_epoch: int, to_epoch: int, output_dir: str, overwrite: bool = False) -> Dict[str, int]:
+        os.makedirs(output_dir, exist_ok=True)
+        windows = [w for w in self.windows(from_epoch, to_epoch)
+                   if overwrite is True or os.path.exists(self.day_filename(output_dir, self.day_of_epoch(w[0]))) is False]
+
+        day_counts = {}
+        self.partial_day_counts = {}
+        current_day = None
+        fh = None
+        part_file = None
+        previous_keys = set()
+        # Start of the current day's first window and end of its last one
+        day_start = None
+        day_end = None
+
+        # Only a day fetched from midnight to midnight is final. A first day starting after midnight (from_epoch)
+        # or a last day cut short by to_epoch stays .part, so that a later run covering the whole day redoes it
+        def finish_day():
+            fh.close()
+            if day_start == self._midnight(day_start) and day_end == self._next_midnight(day_start):
+                os.replace(part_file, self.day_filename(output_dir, current_day))
+            else:
+                self.partial_day_counts[current_day] = day_counts.pop(current_day)
+
+        try:
+            for (start, end), events in self._fetch_in_order(windows):
+                day = self.day_of_epoch(start)
+                if day != current_day:
+                    if fh is not None:
+                        finish_day()
+                    current_day = day
+                    day_start = start
+                    part_file = self.day_filename(output_dir, day) + '.part'
+                    fh = gzip.open(part_file, 'wt', encoding='utf-8')
+                    day_counts[day] = 0
+                    previous_keys = set()
+                day_end = end
+
+                window_keys = set()
+                for event in events:
+                    key = event_key(event)
+                    if key in previous_keys or key in window_keys:
+                        continue
+                    window_keys.add(key)
+                    fh.write(json.dumps(event, default=str))
+                    fh.write('\n')
+                    day_counts[day] += 1
+                previous_keys = window_keys
+
+            if fh is not None:
+                finish_day()
+                fh = None
+        finally:
+            # An unfinished day is left as .part, and is fetched again by the next run
+            if fh is not None:
+                fh.close()
+        return day_counts
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description='Stream ThoughtSpot log topic events as JSON Lines')
+    parser.add_argument("--tsurl", type=str, required=True, help="full URL for the ThoughtSpot cluster.")
+    parser.add_argument("--username", type=str, required=True, help="admin user.")
+    parser.add_argument("--password", type=str, required=True, help="admin password.")
+    parser.add_argument("--topic", type=str, default='security_logs', help="log topic, default security_logs.")
+    parser.add_argument("--from_epoch", type=int, required=False,
+                        help="start epoch in milliseconds, ignored when resuming from a checkpoint.")
+    parser.add_argument("--to_epoch", type=int, required=False, help="end epoch in milliseconds, default now.")
+    parser.add_argument("--checkpoint", type=str, required=False, help="path to the checkpoint file.")
+    parser.add_argument("--outfile", type=str, required=False, help="JSON Lines file to append to, default stdout.")
+    parser.add_argument("--follow", action="store_true", default=False,
+                        help="keep polling for new events after catching up.")
+    parser.add_argument("--backfill_dir", type=str, required=False,
+                        help="backfill --from_epoch to --to_epoch into one gzip JSON Lines file per day in this directory.")
+    parser.add_argument("--max_workers", type=int, default=8, help="concurrent requests for --backfill_dir.")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = get_args()
+    ts = TSRestApiV1(server_url=args.tsurl)
+    try:
+        ts.session_login(username=args.username, password=args.password)
+    except requests.exceptions.HTTPError as e:
+        print(e, file=sys.stderr)
+        print(e.response.content, file=sys.stderr)
+        exit(-1)
+
+    if args.backfill_dir:
+        if args.from_epoch is None:
+            print('--from_epoch is required with --backfill_dir', file=sys.stderr)
+            exit(-1)
+        backfill = LogBackfill(ts, topic=args.topic, max_workers=args.max_workers)
+        to_epoch = args.to_epoch if args.to_epoch is not None else epoch_ms_now()
+        for day, count in backfill.run(args.from_epoch, to_epoch, args.backfill_dir).items():
+            print('{}: {} events'.format(day, count))
+        for day, count in backfill.partial_day_counts.items():
+            print('{}: {} events (partial day, left as .part)'.format(day, count))
+        exit(0)
+
+    consumer = LogStreamConsumer(ts, topic=args.topic, checkpoint_file=args.checkpoint)
+    output = args.outfile if args.outfile else sys.stdout
+    consumer.forward(output, from_epoch=args.from_epoch, to_epoch=args.to_epoch, follow=args.follow)
@@ -0,0 +1,178 @@
+from typing import Optional, Dict, List, Callable, Any
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+from thoughtspot import ThoughtSpot
+#
+# Runs the same operation against many ThoughtSpot clusters at once (e.g. dev / test / prod per region).
+# One ThoughtSpot facade object (with its own signed-in TSRestApiV1 session) is kept per cluster, the operation
+# runs on all clusters concurrently, and results come back tagged with the cluster name.
+#
+# Each cluster can have its own limits, enforced on every HTTP request made through that cluster's session,
+# including requests from operations that use threads themselves (bulk exports etc.):
+#   'max_requests_per_second'  sustained request rate (token bucket, bursting up to 'burst' requests)
+#   'max_concurrent_requests'  requests in flight at once
+#
+# clusters format = { 'prod-us' : { 'server_url': 'https://...', 'username': '...', 'password': '...',
+#                                   'max_requests_per_second': 5, 'max_concurrent_requests': 4 }, ... }
+#
+# Usage:
+#   executor = MultiClusterExecutor(clusters).connect()
+#   results = executor.call('liveboard.list')
+#   for row in results.merged_rows(): print(row['cluster'], row['name'])
+#
+
+
+class RateLimiter:
+    def __init__(self, max_requests_per_second: Optional[float] = None, burst: Optional[int] = None,
+                 max_concurrent_requests: Optional[int] = None):
+        self.rate = max_requests_per_second
+        self.capacity = burst if burst is not None else max(1, int(max_requests_per_second or 1))
+        self._tokens = float(self.capacity)
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+        self._concurrency = threading.BoundedSemaphore(max_concurrent_requests) \
+            if max_concurrent_requests is not None else None
+
+    def _wait_for_token(self):
+        if self.rate is None:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.rate)
+                self._last_refill = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_seconds = (1 - self._tokens) / self.rate
+            time.sleep(wait_seconds)
+
+    def install(self, session) -> "RateLimiter":
+        original_request = session.request
+
+        def limited_request(method, url, *args, **kwargs):
+            self._wait_for_token()
+            if self._concurrency is None:
+                return original_request(method, url, *args, **kwargs)
+            with self._concurrency:
+                return original_request(method, url, *args, **kwargs)
+
+        session.request = limited_request
+        return self
+
+
+#
+# Results of one operation across clusters: one entry per cluster with 'cluster', 'success', 'elapsed_seconds'
+# and either 'response' or 'error'
+#
+class ClusterResults:
+    def __init__(self):
+        self.results = []
+
+    def add(self, cluster: str, success: bool, elapsed_seconds: float, response=None, error=None):
+        entry = {'cluster': cluster, 'success': success, 'elapsed_seconds': elapsed_seconds}
+        if success is True:
+            entry['response'] = response
+        else:
+            entry['error'] = str(error)
+        self.results.append(entry)
+
+    @property
+    def succeeded(self) -> List[Dict]:
+        return [r for r in self.results if r['success'] is True]
+
+    @property
+    def failed(self) -> List[Dict]:
+        return [r for r in self.results if r['success'] is False]
+
+    @property
+    def all_succeeded(self) -> bool:
+        return len(self.failed) == 0
+
+    def by_cluster(self) -> Dict[str, Any]:
+        return {r['cluster']: r['response'] for r in self.succeeded}
+
+    # Flattens the successful responses into one list. Responses that are lists contribute one row per item,
+    # anything else one row. Dict rows are copied with the cluster name added under cluster_key; other values
+    # are wrapped as { cluster_key: cluster, 'value': value }
+    def merged_rows(self, cluster_key: str = 'cluster') -> List[Dict]:
+        rows = []
+        for r in self.succeeded:
+            items = r['response'] if isinstance(r['response'], list) else [r['response']]
+            for item in items:
+                if isinstance(item, dict):
+                    row = dict(item)
+                    row[cluster_key] = r['cluster']
+                else:
+                    row = {cluster_key: r['cluster'], 'value': item}
+                rows.append(row)
+        return rows
+
+
+class MultiClusterExecutor:
+    def __init__(self, clusters: Dict[str, Dict], session_store=None, max_workers: Optional[int] = None):
+        self.clusters = clusters
+        # Optional SessionStore from session_store.py, so repeated runs reuse each cluster's session
+        self.session_store = session_store
+        self.max_workers = max_workers if max_workers is not None else max(1, len(clusters))
+        # cluster name : ThoughtSpot
+        self.connections = {}
+
+    def _connect_cluster(self, name: str) -> ThoughtSpot:
+        config = self.clusters[name]
+        ts = ThoughtSpot(server_url=config['server_url'])
+        if config.get('max_requests_per_second') is not None or config.get('max_concurrent_requests') is not None:
+            RateLimiter(max_requests_per_second=config.get('max_requests_per_second'), burst=config.get('burst'),
+                        max_concurrent_requests=config.get('max_concurrent_requests')).install(ts.tsrest.requests_session)
+        ts.login(username=config['username'], password=config['password'], session_store=self.session_store)
+        return ts
+
+    # Signs in to every cluster concurrently. Clusters that fail are left out of self.connections and
+    # reported in the returned ClusterResults
+    def connect(self, raise_on_error: bool = True) -> "MultiClusterExecutor":
+        results = self._run_on(list(self.clusters.keys()), self._connect_cluster)
+        for r in results.succeeded:
+            self.connections[r['cluster']] = r['response']
+        self.connect_results = results
+        if raise_on_error is True and len(results.failed) > 0:
+            raise ConnectionError('Could not sign in to: {}'.format(
+                ', '.join('{} ({})'.format(r['cluster'], r['error']) for r in results.failed)))
+        return self
+
+    def _run_on(self, cluster_names: List[str], func: Callable[[str], Any]) -> ClusterResults:
+        results = ClusterResults()
+
+        def timed(name):
+            start = time.perf_counter()
+            try:
+                response = func(name)
+                return name, True, time.perf_counter() - start, response, None
+            except Exception as e:
+                return name, False, time.perf_counter() - start, None, e
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for name, success, elapsed, response, error in executor.map(timed, cluster_names):
+                results.add(name, success, elapsed, response=response, error=error)
+        return results
+
+    # operation(ts: ThoughtSpot) runs once per connected cluster (or the named subset)
+    def run(self, operation: Callable[[ThoughtSpot], Any], clusters: Optional[List[str]] = None) -> ClusterResults:
+        cluster_names = clusters if clusters is not None else list(self.connections.keys())
+        return self._run_on(cluster_names, lambda name: operation(self.connections[name]))
+
+    # Calls a facade method by its dotted path on every cluster, e.g. call('liveboard.list', filter='Sales')
+    # or call('tsrest.metadata_listobjectheaders', object_type=TSTypes.ANSWER)
+    def call(self, method_path: str, *args, clusters: Optional[List[str]] = None, **kwargs) -> ClusterResults:
+        def operation(ts: ThoughtSpot):
+            target = ts
+            for attr in method_path.split('.'):
+                target = getattr(target, attr)
+            return target(*args, **kwargs)
+
+        return self.run(operation, clusters=clusters)
+
+    def logout(self):
+        self._run_on(list(self.connections.keys()), lambda name: self.connections[name].logout())
+        self.connections = {}
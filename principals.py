@@ -0,0 +1,403 @@
+from thoughtspot_rest_api_v1 import *
+from typing import Optional, Dict, List, Set, FrozenSet, Tuple
+import hashlib
+import json
+
+import requests
+#
+# Classes for working with Users and Groups (principals) in bulk, rather than through the
+# per-principal details() calls of UserMethods and GroupMethods
+#
+
+
+#
+# PrincipalGraph loads every User and Group with one user_get() and one group_get() call, then answers
+# group membership and privilege questions from memory.
+# Group membership is transitive: a Group assigned to another Group inherits that Group's privileges, and so on
+# up the chain. The closure for each Group is computed once on first request and reused for every User in it
+#
+class PrincipalGraph:
+    def __init__(self, tsrest: TSRestApiV1):
+        self.rest = tsrest
+        # GUID : user_get / group_get details response for that principal
+        self.users = {}
+        self.groups = {}
+        # Reverse index of Group GUID : Set of Group GUIDs directly assigned to it (its child Groups)
+        self._child_groups = {}
+        # Name : GUID, so name lookups don't scan every principal
+        self._user_guid_by_name = {}
+        self._group_guid_by_name = {}
+
+        # Closure caches, invalidated by refresh_user() and refresh_group()
+        self._group_closure = {}
+        self._group_privileges = {}
+        self._user_closure = {}
+
+        self.loaded = False
+
+    def load(self):
+        users = self.rest.user_get()
+        groups = self.rest.group_get()
+
+        self.users = {}
+        self.groups = {}
+        self._user_guid_by_name = {}
+        self._group_guid_by_name = {}
+        for u in users:
+            self.users[u['header']['id']] = u
+            self._user_guid_by_name[u['header']['name']] = u['header']['id']
+        for g in groups:
+            self.groups[g['header']['id']] = g
+            self._group_guid_by_name[g['header']['name']] = g['header']['id']
+        self._rebuild_child_index()
+        self._clear_closures()
+        self.loaded = True
+        return self
+
+    def _ensure_loaded(self):
+        if self.loaded is False:
+            self.load()
+
+    def _rebuild_child_index(self):
+        self._child_groups = {}
+        for g_guid in self.groups:
+            self._index_group_parents(g_guid)
+
+    def _index_group_parents(self, group_guid: str):
+        for parent_guid in self.groups[group_guid].get('assignedGroups', []):
+            self._child_groups.setdefault(parent_guid, set()).add(group_guid)
+
+    def _clear_closures(self):
+        self._group_closure = {}
+        self._group_privileges = {}
+        self._user_closure = {}
+
+    #
+    # Closure computation
+    #
+    def _closure_for_group(self, group_guid: str) -> FrozenSet[str]:
+        if group_guid in self._group_closure:
+            return self._group_closure[group_guid]
+
+        # Iterative walk so that deep hierarchies don't hit the recursion limit, and cycles
+        # (which ThoughtSpot should not allow, but could exist in bad data) cannot loop forever
+        closure = set()
+        to_visit = list(self.groups.get(group_guid, {}).get('assignedGroups', []))
+        while len(to_visit) > 0:
+            g = to_visit.pop()
+            if g in closure or g == group_guid:
+                continue
+            closure.add(g)
+            # Reuse any closure already computed further up the hierarchy
+            if g in self._group_closure:
+                closure.update(self._group_closure[g])
+            else:
+                to_visit.extend(self.groups.get(g, {}).get('assignedGroups', []))
+
+        self._group_closure[group_guid] = frozenset(closure)
+        return self._group_closure[group_guid]
+
+    def _privileges_for_group(self, group_guid: str) -> FrozenSet[str]:
+        if group_guid in self._group_privileges:
+            return self._group_privileges[group_guid]
+
+        privileges = set(self.groups.get(group_guid, {}).get('privileges', []))
+        for g in self._closure_for_group(group_guid):
+            privileges.update(self.groups.get(g, {}).get('privileges', []))
+        self._group_privileges[group_guid] = frozenset(privileges)
+        return self._group_privileges[group_guid]
+
+    def _closure_for_user(self, user_guid: str) -> FrozenSet[str]:
+        if user_guid in self._user_closure:
+            return self._user_closure[user_guid]
+
+        closure = set()
+        for g in self.users[user_guid].get('assignedGroups', []):
+            closure.add(g)
+            closure.update(self._closure_for_group(g))
+        self._user_closure[user_guid] = frozenset(closure)
+        return self._user_closure[user_guid]
+
+    #
+    # Queries, answered without any REST API calls after load()
+    #
+    def groups_for_user(self, user_guid: str) -> Set[str]:
+        self._ensure_loaded()
+        return set(self._closure_for_user(user_guid))
+
+    def inherited_groups_for_user(self, user_guid: str) -> Set[str]:
+        self._ensure_loaded()
+        return set(self._closure_for_user(user_guid)) - set(self.users[user_guid].get('assignedGroups', []))
+
+    def privileges_for_user(self, user_guid: str) -> Set[str]:
+        self._ensure_loaded()
+        privileges = set(self.users[user_guid].get('privileges', []))
+        for g in self._closure_for_user(user_guid):
+            privileges.update(self.groups.get(g, {}).get('privileges', []))
+        return privileges
+
+    def user_has_privilege(self, user_guid: str, privilege: str) -> bool:
+        return privilege in self.privileges_for_user(user_guid)
+
+    def is_user_in_group(self, user_guid: str, group_guid: str) -> bool:
+        self._ensure_loaded()
+        return group_guid in self._closure_for_user(user_guid)
+
+    def groups_for_group(self, group_guid: str) -> Set[str]:
+        self._ensure_loaded()
+        return set(self._closure_for_group(group_guid))
+
+    def privileges_for_group(self, group_guid: str) -> Set[str]:
+        self._ensure_loaded()
+        return set(self._privileges_for_group(group_guid))
+
+    # All Users who are members of the Group either directly or through any nested Group
+    def users_in_group(self, group_guid: str) -> Set[str]:
+        self._ensure_loaded()
+        users = set()
+        for u_guid in self.users:
+            if group_guid in self._closure_for_user(u_guid):
+                users.add(u_guid)
+        return users
+
+    def users_with_privilege(self, privilege: str) -> Set[str]:
+        self._ensure_loaded()
+        users = set()
+        for u_guid in self.users:
+            if privilege in self.privileges_for_user(u_guid):
+                users.add(u_guid)
+        return users
+
+    def guid_for_user_name(self, username: str) -> str:
+        self._ensure_loaded()
+        if username not in self._user_guid_by_name:
+            raise LookupError()
+        return self._user_guid_by_name[username]
+
+    def guid_for_group_name(self, group_name: str) -> str:
+        self._ensure_loaded()
+        if group_name not in self._group_guid_by_name:
+            raise LookupError()
+        return self._group_guid_by_name[group_name]
+
+    #
+    # Incremental refresh: re-request a single principal and only invalidate the closures it can affect
+    #
+    def refresh_user(self, user_guid: str):
+        self._ensure_loaded()
+        try:
+            user = self.rest.user_get(user_id=user_guid)
+        except requests.exceptions.HTTPError as e:
+            # User has been deleted on the server
+            if e.response is not None and e.response.status_code == 404:
+                user = None
+            else:
+                raise
+        # The name may have changed, so drop the previous entry before adding the current one
+        if user_guid in self.users:
+            self._user_guid_by_name.pop(self.users[user_guid]['header']['name'], None)
+        if user is None:
+            self.users.pop(user_guid, None)
+        else:
+            self.users[user_guid] = user
+            self._user_guid_by_name[user['header']['name']] = user_guid
+        self._user_closure.pop(user_guid, None)
+
+    def refresh_group(self, group_guid: str):
+        self._ensure_loaded()
+        # Every Group below this one in the hierarchy, plus the Group itself, has a stale closure
+        affected_groups = self._descendant_groups(group_guid)
+        affected_groups.add(group_guid)
+
+        try:
+            group = self.rest.group_get(group_guid=group_guid)
+        except requests.exceptions.HTTPError as e:
+            # Group has been deleted on the server
+            if e.response is not None and e.response.status_code == 404:
+                group = None
+            else:
+                raise
+
+        if group_guid in self.groups:
+            for parent_guid in self.groups[group_guid].get('assignedGroups', []):
+                self._child_groups.get(parent_guid, set()).discard(group_guid)
+            self._group_guid_by_name.pop(self.groups[group_guid]['header']['name'], None)
+        if group is None:
+            self.groups.pop(group_guid, None)
+        else:
+            self.groups[group_guid] = group
+            self._group_guid_by_name[group['header']['name']] = group_guid
+            self._index_group_parents(group_guid)
+
+        for g in affected_groups:
+            self._group_closure.pop(g, None)
+            self._group_privileges.pop(g, None)
+        # Users are only stale if they sit in one of the affected Groups
+        for u_guid in list(self._user_closure.keys()):
+            if len(affected_groups.intersection(self.users.get(u_guid, {}).get('assignedGroups', []))) > 0:
+                del self._user_closure[u_guid]
+
+    def _descendant_groups(self, group_guid: str) -> Set[str]:
+        descendants = set()
+        to_visit = list(self._child_groups.get(group_guid, set()))
+        while len(to_visit) > 0:
+            g = to_visit.pop()
+            if g in descendants:
+                continue
+            descendants.add(g)
+            to_visit.extend(self._child_groups.get(g, set()))
+        return descendants
+
+
+#
+# UserSyncPlanner compares the principals currently on the server with a desired list of user_sync elements
+# (as built by UserMethods.get_user_element_for_user_sync and GroupMethods.get_group_element_for_user_sync)
+# and only sends the principals that are new or changed to the user/sync endpoint.
+# user_sync is always called with remove_deleted=False, since each call only carries part of the directory.
+# Removals are done with explicit user_delete / group_delete calls on the principals listed in the plan
+# Users and Groups can share a name, so principals are keyed by ('USER' or 'GROUP', name) throughout. The kind
+# rather than the principalTypeEnum, so that an LDAP, SAML or other non-local User on the server matches a
+# LOCAL_USER desired element with the same name, instead of being added again (or removed)
+#
+class UserSyncPlanner:
+    # Fields of a user_sync element that are compared to decide if a principal needs an update
+    # 'created' and 'modified' are set by the server and are intentionally ignored, as is 'principalTypeEnum',
+    # since a sync shouldn't turn an LDAP or SAML principal into a local one
+    compared_fields = ['displayName', 'visibility', 'mail', 'description', 'groupNames']
+
+    # Built-in principals that should never be removed, even with remove_missing=True
+    default_protected_names = ['tsadmin', 'su', 'system', 'All', 'Administrator', 'System']
+
+    # Groups every User belongs to implicitly, left out of groupNames when comparing
+    implicit_group_names = ['All']
+
+    def __init__(self, tsrest: TSRestApiV1, principal_graph: Optional[PrincipalGraph] = None,
+                 protected_names: Optional[List[str]] = None):
+        self.rest = tsrest
+        if principal_graph is None:
+            principal_graph = PrincipalGraph(tsrest)
+        self.principal_graph = principal_graph
+        if protected_names is None:
+            protected_names = self.default_protected_names
+        self.protected_names = set(protected_names)
+
+        # principal_key() : GUID for every principal in the last snapshot, used for removals
+        self.guids = {}
+
+    # 'USER' or 'GROUP' for any principalTypeEnum (LOCAL_USER, LDAP_USER, SAML_USER, LOCAL_GROUP, LDAP_GROUP ...)
+    @staticmethod
+    def principal_kind(principal_type: str) -> str:
+        return 'GROUP' if principal_type.endswith('_GROUP') else 'USER'
+
+    @classmethod
+    def principal_key(cls, element: Dict) -> Tuple[str, str]:
+        return cls.principal_kind(element['principalTypeEnum']), element['name']
+
+    # Converts the current Users and Groups on the server into user_sync elements keyed by principal_key()
+    def snapshot(self, reload: bool = True) -> Dict[Tuple[str, str], Dict]:
+        if reload is True or self.principal_graph.loaded is False:
+            self.principal_graph.load()
+        groups = self.principal_graph.groups
+        users = self.principal_graph.users
+
+        group_guid_to_name = {}
+        for g_guid in groups:
+            group_guid_to_name[g_guid] = groups[g_guid]['header']['name']
+
+        current = {}
+        self.guids = {}
+        for principals, principal_type in [(groups, 'LOCAL_GROUP'), (users, 'LOCAL_USER')]:
+            for guid in principals:
+                details = principals[guid]
+                header = details['header']
+                element = {
+                    "name": header['name'],
+                    "displayName": header.get('displayName'),
+                    "principalTypeEnum": details.get('type', principal_type),
+                    "visibility": details.get('visibility', 'DEFAULT'),
+                    "description": header.get('description', ""),
+                    "groupNames": [group_guid_to_name[g] for g in details.get('assignedGroups', [])
+                                   if g in group_guid_to_name
+                                   and group_guid_to_name[g] not in self.implicit_group_names]
+                }
+                mail = details.get('userContent', {}).get('userProperties', {}).get('mail')
+                if mail is not None:
+                    element["mail"] = mail
+                # The kind comes from the list the principal is in, whatever type the server reports
+                key = (self.principal_kind(principal_type), header['name'])
+                current[key] = element
+                self.guids[key] = guid
+        return current
+
+    # Digest of only the fields the desired element specifies, so that leaving a field out of the desired
+    # element means "don't care" rather than "clear it"
+    @classmethod
+    def principal_hash(cls, element: Dict, fields: List[str]) -> str:
+        values = []
+        for f in fields:
+            v = element.get(f)
+            if f == 'groupNames' and v is not None:
+                v = sorted([g for g in v if g not in cls.implicit_group_names])
+            if f == 'description' and v is None:
+                v = ""
+            values.append(v)
+        return hashlib.sha1(json.dumps(values, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def plan(self, desired_principals: List[Dict], current: Optional[Dict[Tuple[str, str], Dict]] = None,
+             remove_missing: bool = False) -> Dict[str, List]:
+        if current is None:
+            current = self.snapshot()
+
+        sync_plan = {'add': [], 'update': [], 'remove': [], 'unchanged': 0}
+        desired_keys = set()
+        for element in desired_principals:
+            key = self.principal_key(element)
+            desired_keys.add(key)
+            if key not in current:
+                sync_plan['add'].append(element)
+                continue
+            fields = [f for f in self.compared_fields if f in element]
+            if self.principal_hash(element, fields) != self.principal_hash(current[key], fields):
+                sync_plan['update'].append(element)
+            else:
+                sync_plan['unchanged'] += 1
+
+        if remove_missing is True:
+            for key in current:
+                if key not in desired_keys and key[1] not in self.protected_names:
+                    sync_plan['remove'].append(current[key])
+
+        # Groups first, so that Users referencing new Groups in groupNames can be created in the same batch
+        for k in ['add', 'update']:
+            sync_plan[k].sort(key=lambda e: 0 if self.principal_key(e)[0] == 'GROUP' else 1)
+        return sync_plan
+
+    def apply(self, sync_plan: Dict[str, List], password: str, batch_size: int = 1000) -> Dict[str, List]:
+        results = {'sync_responses': [], 'removed': [], 'remove_errors': []}
+        changed = sync_plan['add'] + sync_plan['update']
+        for i in range(0, len(changed), batch_size):
+            batch = changed[i:i + batch_size]
+            response = self.rest.user_sync(principals_file=json.dumps(batch), password=password,
+                                           apply_changes=True, remove_deleted=False)
+            results['sync_responses'].append(response)
+
+        for element in sync_plan['remove']:
+            name = element['name']
+            key = self.principal_key(element)
+            if key not in self.guids:
+                results['remove_errors'].append({'name': name, 'error': 'No GUID in snapshot'})
+                continue
+            try:
+                if key[0] == 'GROUP':
+                    self.rest.group_delete(group_guid=self.guids[key])
+                else:
+                    self.rest.user_delete(user_guid=self.guids[key])
+                results['removed'].append(name)
+            except requests.exceptions.HTTPError as e:
+                results['remove_errors'].append({'name': name, 'error': str(e)})
+        return results
+
+    def sync(self, desired_principals: List[Dict], password: str, remove_missing: bool = False,
+             batch_size: int = 1000) -> Dict[str, List]:
+        sync_plan = self.plan(desired_principals=desired_principals, remove_missing=remove_missing)
+        return self.apply(sync_plan=sync_plan, password=password, batch_size=batch_size)
@@ -0,0 +1,181 @@
+from thoughtspot_rest_api_v1 import *
+from typing import Optional, Dict, Callable
+import hashlib
+import json
+import os
+import threading
+import time
+
+import requests
+#
+# Persistence of authenticated REST API sessions across short-lived processes.
+# After a login, the session cookies (and a bearer Authorization header, if one is set on the Session) are saved
+# to one file per (server, username) with an expiry time. The next process restores them instead of calling
+# session/login, and only signs in again when the saved session has expired or the server answers 401.
+#
+# The files hold live session credentials, so the directory is created readable by the owner only (0700) and
+# each file is written with 0600 permissions. The password itself is never stored.
+#
+# Usage:
+#   store = SessionStore()
+#   session = PersistentSession(ts.tsrest, username, password, store).install()
+#   session.login()   # restores a saved session if there is one, otherwise signs in and saves it
+# or through the facade: ts.login(username, password, session_store=SessionStore())
+#
+
+
+class SessionStore:
+    def __init__(self, directory: Optional[str] = None, default_ttl_seconds: float = 6 * 60 * 60):
+        self.directory = directory if directory is not None \
+            else os.path.join(os.path.expanduser('~'), '.thoughtspot', 'sessions')
+        # Used as the expiry when none of the session cookies have one. Should be shorter than the
+        # session timeout on the cluster
+        self.default_ttl_seconds = default_ttl_seconds
+
+    def _filename(self, server_url: str, username: str) -> str:
+        key = '{}\n{}'.format(server_url.rstrip('/').lower(), username)
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.json')
+
+    def save(self, tsrest: TSRestApiV1, username: str, expires_at: Optional[float] = None) -> str:
+        session = tsrest.requests_session
+        cookies = []
+        cookie_expiries = []
+        for c in session.cookies:
+            cookies.append({'name': c.name, 'value': c.value, 'domain': c.domain, 'path': c.path,
+                            'expires': c.expires, 'secure': c.secure})
+            if c.expires is not None:
+                cookie_expiries.append(c.expires)
+        if expires_at is None:
+            expires_at = min(cookie_expiries) if len(cookie_expiries) > 0 else time.time() + self.default_ttl_seconds
+
+        saved = {'server_url': tsrest.server,
+                 'username': username,
+                 'saved_at': time.time(),
+                 'expires_at': expires_at,
+                 'cookies': cookies,
+                 'authorization': session.headers.get('Authorization')}
+
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        filename = self._filename(tsrest.server, username)
+        tmp_file = filename + '.tmp'
+        # Created with owner-only permissions from the start, rather than chmod after writing
+        fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w', encoding='utf-8') as fh:
+            json.dump(saved, fh)
+        os.replace(tmp_file, filename)
+        return filename
+
+    # The saved session Dict, or None when there is none, it has expired or the file can't be read
+    def load(self, server_url: str, username: str) -> Optional[Dict]:
+        filename = self._filename(server_url, username)
+        try:
+            with open(filename, 'r', encoding='utf-8') as fh:
+                saved = json.load(fh)
+        except (OSError, ValueError):
+            return None
+        if saved.get('expires_at', 0) <= time.time():
+            return None
+        return saved
+
+    def restore(self, tsrest: TSRestApiV1, username: str) -> bool:
+        saved = self.load(tsrest.server, username)
+        if saved is None:
+            return False
+        session = tsrest.requests_session
+        for c in saved['cookies']:
+            session.cookies.set(c['name'], c['value'], domain=c['domain'], path=c['path'], expires=c['expires'],
+                                secure=c['secure'])
+        if saved.get('authorization') is not None:
+            session.headers['Authorization'] = saved['authorization']
+        return True
+
+    def delete(self, server_url: str, username: str):
+        try:
+            os.remove(self._filename(server_url, username))
+        except FileNotFoundError:
+            pass
+
+
+#
+# Ties a TSRestApiV1 to a SessionStore: login() reuses a saved session, and once installed, any request answered
+# with 401 (session expired or revoked on the server) signs in again, saves the new session and is retried once.
+# login_func can replace the default session_login, e.g. lambda: tsrest.session_login_v2(token=token)
+#
+class PersistentSession:
+    def __init__(self, tsrest: TSRestApiV1, username: str, password: Optional[str] = None,
+                 store: Optional[SessionStore] = None, login_func: Optional[Callable[[], object]] = None):
+        if password is None and login_func is None:
+            raise ValueError('Either password or login_func is required')
+        self.rest = tsrest
+        self.username = username
+        self.store = store if store is not None else SessionStore()
+        self.login_func = login_func if login_func is not None \
+            else (lambda: tsrest.session_login(username=username, password=password))
+        # Incremented by every sign in, so threads that all got a 401 sign in only once between them
+        self.generation = 0
+        self.logins = 0
+        self.restored = False
+        self._lock = threading.Lock()
+        self._installed = None
+
+    def login(self, force: bool = False) -> bool:
+        if force is False and self.store.restore(self.rest, self.username) is True:
+            self.restored = True
+            return True
+        self._sign_in()
+        return True
+
+    def _sign_in(self):
+        self.rest.requests_session.cookies.clear()
+        self.login_func()
+        self.logins += 1
+        self.generation += 1
+        self.store.save(self.rest, self.username)
+
+    def logout(self) -> bool:
+        self.store.delete(self.rest.server, self.username)
+        return self.rest.session_logout()
+
+    # Other wrappers (instrumentation, cassettes, RateLimiter) may be installed on the same session afterwards.
+    # Uninstalling only restores the previous request() when this is still the outermost wrapper; otherwise the
+    # wrapper stays in the chain as a pass-through, so the wrappers around it keep working
+    def install(self) -> "PersistentSession":
+        session = self.rest.requests_session
+        original_request = session.request
+        slot = {'active': True}
+
+        def reauthenticating_request(method, url, *args, **kwargs):
+            if slot['active'] is False:
+                return original_request(method, url, *args, **kwargs)
+            return self._request(original_request, method, url, *args, **kwargs)
+
+        self._installed = (session, vars(session).get('request'), reauthenticating_request, slot)
+        session.request = reauthenticating_request
+        return self
+
+    def uninstall(self):
+        if self._installed is None:
+            return
+        session, previous_request, reauthenticating_request, slot = self._installed
+        slot['active'] = False
+        if vars(session).get('request') is reauthenticating_request:
+            if previous_request is not None:
+                session.request = previous_request
+            elif 'request' in vars(session):
+                del session.request
+        self._installed = None
+
+    def _request(self, original_request, method, url, *args, **kwargs):
+        generation = self.generation
+        response = original_request(method, url, *args, **kwargs)
+        # A 401 from the login call itself is bad credentials, not an expired session
+        if response.status_code != 401 or '/session/login' in url or '/session/gettoken' in url:
+            return response
+        # Release the connection of the rejected response before signing in and sending the request again
+        response.close()
+        with self._lock:
+            # Another thread may have signed in again while this request was in flight
+            if self.generation == generation:
+                self.store.delete(self.rest.server, self.username)
+                self._sign_in()
+        return original_request(method, url, *args, **kwargs)
@@ -0,0 +1,65 @@
+import io
+import os
+import sys
+
+import requests
+from requests.adapters import BaseAdapter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from thoughtspot_rest_api_v1 import TSRestApiV1
+from cassettes import Cassette
+from endpoint_method_classes import PinboardMethods
+
+pdf_content = b'%PDF-1.4 ' + bytes(range(256)) * 64
+
+
+# Answers every request with the same PDF, as a streamed response
+class PdfAdapter(BaseAdapter):
+    def send(self, request, **kwargs):
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = 'OK'
+        response.url = request.url
+        response.request = request
+        response.headers['Content-Type'] = 'application/octet-stream'
+        response.raw = io.BytesIO(pdf_content)
+        return response
+
+    def close(self):
+        pass
+
+
+def test_replay_streamed_pdf_export(tmp_path):
+    cassette_file = str(tmp_path / 'pdf.json')
+    recording_rest = TSRestApiV1(server_url='http://ts.example')
+    recording_rest.requests_session.mount('http://', PdfAdapter())
+    with Cassette(cassette_file, mode='record').install(recording_rest):
+        PinboardMethods(recording_rest).pdf_export_to_file('lb-guid', str(tmp_path / 'recorded.pdf'),
+                                                           chunk_size=1000)
+
+    # No adapter mounted: any request that isn't answered from the cassette would fail
+    replay_rest = TSRestApiV1(server_url='http://ts.example')
+    with Cassette(cassette_file, mode='replay').install(replay_rest) as cassette:
+        bytes_written = PinboardMethods(replay_rest).pdf_export_to_file('lb-guid', str(tmp_path / 'replayed.pdf'),
+                                                                        chunk_size=1000)
+        assert cassette.hits == 1
+    assert bytes_written == len(pdf_content)
+    with open(str(tmp_path / 'replayed.pdf'), 'rb') as fh:
+        assert fh.read() == pdf_content
+
+
+def test_replayed_response_can_be_streamed_and_closed(tmp_path):
+    cassette_file = str(tmp_path / 'stream.json')
+    recording_rest = TSRestApiV1(server_url='http://ts.example')
+    recording_rest.requests_session.mount('http://', PdfAdapter())
+    with Cassette(cassette_file, mode='record').install(recording_rest):
+        recording_rest.requests_session.get('http://ts.example/callosum/v1/tspublic/v1/export/file', stream=True)
+
+    replay_rest = TSRestApiV1(server_url='http://ts.example')
+    with Cassette(cassette_file, mode='replay').install(replay_rest):
+        with replay_rest.requests_session.get('http://ts.example/callosum/v1/tspublic/v1/export/file',
+                                              stream=True) as response:
+            assert b''.join(response.iter_content(chunk_size=100)) == pdf_content
+            assert response.raw.read() == pdf_content
+        response.close()
@@ -1,5 +1,61 @@
-from thoughtspot_rest_api_v1 import *
-from endpoint_method_classes import *
+from typing import Optional, Dict, List, Callable
+import importlib
+
+#
+# Importing this module is kept cheap for short-lived scripts: requests, thoughtspot_rest_api_v1 and the
+# endpoint method modules are only imported when first needed, and each sub-API object (.tml, .connection ...)
+# is only built on first access.
+# Every name these modules used to star-import (TSTypes, MetadataTypes, run_concurrently ...) is still available
+# from this module, resolved on first use by the module __getattr__ below
+#
+
+# Modules whose public names are re-exported from this module, in the order they used to be star-imported
+_reexported_modules = ['thoughtspot_rest_api_v1', 'endpoint_method_classes', 'principals', 'instrumentation',
+                       'cassettes', 'session_store']
+
+
+def _public_names(module) -> List[str]:
+    if hasattr(module, '__all__'):
+        return list(module.__all__)
+    return [n for n in vars(module) if not n.startswith('_')]
+
+
+def __getattr__(name: str):
+    # 'from thoughtspot import *' asks for __all__, which means importing everything
+    if name == '__all__':
+        names = {'ThoughtSpot'}
+        for module_name in _reexported_modules:
+            names.update(_public_names(importlib.import_module(module_name)))
+        return sorted(names)
+    # The import system probes for names like __path__, which must not trigger the imports
+    if name.startswith('__'):
+        raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
+    # Later modules take precedence, as with the original star-imports
+    for module_name in reversed(_reexported_modules):
+        module = importlib.import_module(module_name)
+        if name in _public_names(module):
+            value = getattr(module, name)
+            globals()[name] = value
+            return value
+    raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
+
+
+# attribute name : (module, class name) for the sub-APIs built on first access, each taking the TSRestApiV1
+_sub_api_classes = {
+    'user': ('endpoint_method_classes', 'UserMethods'),
+    'group': ('endpoint_method_classes', 'GroupMethods'),
+    'tml': ('endpoint_method_classes', 'TMLMethods'),
+    'pinboard': ('endpoint_method_classes', 'PinboardMethods'),
+    'liveboard': ('endpoint_method_classes', 'LiveboardMethods'),
+    'answer': ('endpoint_method_classes', 'AnswerMethods'),
+    'connection': ('endpoint_method_classes', 'ConnectionMethods'),
+    'worksheet': ('endpoint_method_classes', 'WorksheetMethods'),
+    'table': ('endpoint_method_classes', 'TableMethods'),
+    'tag': ('endpoint_method_classes', 'TagMethods'),
+    'data': ('endpoint_method_classes', 'DataMethods'),
+    # Loads all Users and Groups on first use to answer membership and privilege questions from memory
+    'principals': ('principals', 'PrincipalGraph')
+}
 
 
 #
@@ -8,20 +64,61 @@ from endpoint_method_classes import *
 #
 class ThoughtSpot:
     def __init__(self, server_url: str):
-        self.tsrest = TSRestApiV1(server_url=server_url)
-        self.user = UserMethods(self.tsrest)
-        self.group = GroupMethods(self.tsrest)
-        self.tml = TMLMethods(self.tsrest)
-        self.pinboard = PinboardMethods(self.tsrest)
-        self.liveboard = LiveboardMethods(self.tsrest)
-        self.answer = AnswerMethods(self.tsrest)
-        self.connection = ConnectionMethods(self.tsrest)
-        self.worksheet = WorksheetMethods(self.tsrest)
-        self.table = TableMethods(self.tsrest)
-        self.tag = TagMethods(self.tsrest)
-
-    def login(self, username: str, password: str):
-        return self.tsrest.session_login(username=username, password=password)
+        self.server_url = server_url
+        self.instrumentation = None
+        self.cassette = None
+        self.persistent_session = None
+
+    # Only called for attributes not yet set on the object, so each one is built once then found normally
+    def __getattr__(self, name: str):
+        if name == 'tsrest':
+            from thoughtspot_rest_api_v1 import TSRestApiV1
+            value = TSRestApiV1(server_url=self.server_url)
+        elif name == 'user_sync':
+            from principals import UserSyncPlanner
+            value = UserSyncPlanner(self.tsrest, principal_graph=self.principals)
+        elif name in _sub_api_classes:
+            module_name, class_name = _sub_api_classes[name]
+            value = getattr(importlib.import_module(module_name), class_name)(self.tsrest)
+        else:
+            raise AttributeError("'ThoughtSpot' object has no attribute '{}'".format(name))
+        setattr(self, name, value)
+        return value
+
+    # With a session_store, a saved session is reused instead of signing in, and the session is renewed
+    # automatically when the server answers 401. See session_store.py
+    def login(self, username: str, password: str, session_store: Optional["SessionStore"] = None):
+        if session_store is None:
+            return self.tsrest.session_login(username=username, password=password)
+        from session_store import PersistentSession
+        if self.persistent_session is not None:
+            self.persistent_session.uninstall()
+        self.persistent_session = PersistentSession(self.tsrest, username=username, password=password,
+                                                    store=session_store).install()
+        return self.persistent_session.login()
 
     def logout(self):
+        if self.persistent_session is not None:
+            return self.persistent_session.logout()
         return self.tsrest.session_logout()
+
+    # Records latency, status and bytes of every REST API call made through this object. See instrumentation.py
+    def enable_instrumentation(self, hooks: Optional[List[Callable[[Dict], None]]] = None) -> "RequestInstrumentation":
+        from instrumentation import RequestInstrumentation
+        if self.instrumentation is None:
+            self.instrumentation = RequestInstrumentation(hooks=hooks).install(self.tsrest)
+        elif hooks is not None:
+            for hook in hooks:
+                self.instrumentation.add_hook(hook)
+        return self.instrumentation
+
+    # Records REST API calls to, or replays them from, a cassette file. See cassettes.py
+    def use_cassette(self, filename: str, mode: str = 'replay', simulate_latency: bool = False) -> "Cassette":
+        from cassettes import Cassette
+        cassette = Cassette(filename=filename, mode=mode, simulate_latency=simulate_latency)
+        # A new cassette takes the previous one's place, under any wrappers installed since
+        if self.cassette is not None and self.cassette.installed is True:
+            self.cassette = cassette.take_over(self.cassette)
+        else:
+            self.cassette = cassette.install(self.tsrest)
+        return self.cassette
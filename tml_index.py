@@ -0,0 +1,295 @@
+from typing import Optional, Dict, List
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import sys
+import time
+
+from lazy_tml import load_lazy_tml, tml_content_type
+#
+# Persistent index of a directory tree of TML files: guid, type, name and the objects each file references,
+# so release tooling can look objects up without re-parsing the repository.
+# Files are read with lazy_tml, which only parses the guid, the name and the reference sections.
+#
+# scan() is incremental: a file whose mtime and size are unchanged keeps its entry; a changed file is hashed,
+# and only re-parsed when its content hash differs. Parsing runs on a pool of worker processes, since YAML
+# parsing is CPU bound.
+#
+# Each entry (keyed by path relative to the directory):
+#   {'path', 'guid', 'content_type', 'name', 'references', 'mtime_ns', 'size', 'sha1', 'error'}
+# 'references' is a List of {'kind': 'table' | 'connection' | 'join', 'name', 'fqn'} ('fqn' may be None)
+#
+# From the command line, replacing tml_details_from_directory.py (prints filename|name|guid):
+#   python tml_index.py {directory} [--type worksheet] [--name "Sales"] [--referencing "FACT_SALES"]
+#
+
+tml_file_extensions = ('.tml', '.tml.yaml', '.yaml', '.yml', '.json')
+
+
+def _reference(kind: str, ref: Dict) -> Dict:
+    return {'kind': kind, 'name': ref.get('name', ref.get('id')), 'fqn': ref.get('fqn')}
+
+
+# References made by a TML document to other objects, by name and (when present) fqn GUID
+def tml_references(tml_mapping, content_type: Optional[str] = None) -> List[Dict]:
+    if content_type is None:
+        content_type = tml_content_type(tml_mapping)
+    if content_type == 'connection':
+        return []
+    content = tml_mapping.get(content_type)
+    if content is None:
+        return []
+    references = []
+    if content_type in ['table', 'sql_view']:
+        connection = content.get('connection')
+        if connection is not None:
+            references.append(_reference('connection', connection))
+        for join in content.get('joins_with') or []:
+            if join.get('destination') is not None:
+                references.append(_reference('join', join['destination']))
+    elif content_type in ['pinboard', 'liveboard']:
+        for viz in content.get('visualizations') or []:
+            for t in (viz.get('answer') or {}).get('tables') or []:
+                references.append(_reference('table', t))
+    else:
+        # worksheet, view and answer all list their sources under 'tables'
+        for t in content.get('tables') or []:
+            references.append(_reference('table', t))
+    return references
+
+
+def _file_sha1(full_path: str) -> (str, bytes):
+    with open(full_path, 'rb') as fh:
+        content = fh.read()
+    return hashlib.sha1(content).hexdigest(), content
+
+
+# Runs in a worker process: everything needed for one entry from one file
+def _index_file(args) -> Dict:
+    full_path, relative_path = args
+    stat = os.stat(full_path)
+    entry = {'path': relative_path, 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size,
+             'guid': None, 'content_type': None, 'name': None, 'references': [], 'error': None}
+    try:
+        entry['sha1'], content = _file_sha1(full_path)
+        tml_mapping = load_lazy_tml(content.decode('utf-8'))
+        content_type = tml_content_type(tml_mapping)
+        entry['content_type'] = content_type
+        entry['guid'] = tml_mapping.get('guid', tml_mapping.get('id'))
+        if content_type == 'connection':
+            entry['name'] = tml_mapping.get('name')
+        elif content_type is not None and tml_mapping.get(content_type) is not None:
+            entry['name'] = tml_mapping[content_type].get('name')
+        entry['references'] = tml_references(tml_mapping, content_type)
+    except Exception as e:
+        # A file that isn't valid TML is kept in the index with its error, so it isn't re-parsed until it changes
+        entry['error'] = '{}: {}'.format(type(e).__name__, e)
+    return entry
+
+
+class TMLDirectoryIndex:
+    version = 1
+
+    def __init__(self, directory: str, index_file: Optional[str] = None):
+        self.directory = directory
+        # Defaults to a file in the directory itself. Filenames ending in .gz are gzip compressed
+        self.index_file = index_file if index_file is not None else os.path.join(directory, '.tml_index.json')
+        # relative path : entry
+        self.entries = {}
+        self.scanned_at = None
+        self._by_guid = None
+        self._by_name = None
+        self._referenced_by = None
+        if os.path.exists(self.index_file):
+            self.load()
+
+    #
+    # Persistence
+    #
+    def _open(self, mode: str):
+        if self.index_file.endswith('.gz'):
+            return gzip.open(self.index_file, mode + 't', encoding='utf-8')
+        return open(self.index_file, mode, encoding='utf-8')
+
+    def load(self):
+        with self._open('r') as fh:
+            saved = json.load(fh)
+        if saved.get('version') != self.version:
+            # Index from a different format version: start again with a full scan
+            self.entries = {}
+            return
+        self.entries = saved['entries']
+        self.scanned_at = saved.get('scanned_at')
+        self._clear_lookups()
+
+    def save(self) -> str:
+        saved = {'version': self.version, 'directory': os.path.abspath(self.directory),
+                 'scanned_at': self.scanned_at, 'entries': self.entries}
+        final_file = self.index_file
+        self.index_file = final_file + '.tmp' + ('.gz' if final_file.endswith('.gz') else '')
+        try:
+            with self._open('w') as fh:
+                json.dump(saved, fh)
+            os.replace(self.index_file, final_file)
+        finally:
+            self.index_file = final_file
+        return final_file
+
+    #
+    # Scanning
+    #
+    def _walk(self) -> Dict[str, str]:
+        index_file_abs = os.path.abspath(self.index_file)
+        files = {}
+        for root, dirs, filenames in os.walk(self.directory):
+            # Skip hidden directories such as .git
+            dirs[:] = [d for d in dirs if not d.startswith('.')]
+            for f in filenames:
+                if not f.lower().endswith(tml_file_extensions) or f.startswith('.'):
+                    continue
+                full_path = os.path.join(root, f)
+                if os.path.abspath(full_path) == index_file_abs:
+                    continue
+                files[os.path.relpath(full_path, self.directory)] = full_path
+        return files
+
+    # Returns the counts of 'added', 'updated', 'unchanged' and 'removed' files
+    def scan(self, max_workers: Optional[int] = None, save: bool = True) -> Dict[str, int]:
+        files = self._walk()
+        counts = {'added': 0, 'updated': 0, 'unchanged': 0, 'removed': 0}
+
+        to_parse = []
+        for relative_path, full_path in files.items():
+            existing = self.entries.get(relative_path)
+            if existing is None:
+                to_parse.append((full_path, relative_path))
+                counts['added'] += 1
+                continue
+            stat = os.stat(full_path)
+            if stat.st_mtime_ns == existing['mtime_ns'] and stat.st_size == existing['size']:
+                counts['unchanged'] += 1
+                continue
+            # Touched but maybe not changed (checkout, copy): the hash decides
+            sha1 = _file_sha1(full_path)[0]
+            if sha1 == existing.get('sha1'):
+                existing['mtime_ns'] = stat.st_mtime_ns
+                existing['size'] = stat.st_size
+                counts['unchanged'] += 1
+            else:
+                to_parse.append((full_path, relative_path))
+                counts['updated'] += 1
+
+        for relative_path in list(self.entries.keys()):
+            if relative_path not in files:
+                del self.entries[relative_path]
+                counts['removed'] += 1
+
+        # A pool of processes only pays off past a handful of files
+        if len(to_parse) < 50 or max_workers == 1:
+            parsed = [_index_file(args) for args in to_parse]
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                parsed = list(executor.map(_index_file, to_parse, chunksize=max(1, len(to_parse) // 64)))
+        for entry in parsed:
+            self.entries[entry['path']] = entry
+
+        self.scanned_at = time.time()
+        self._clear_lookups()
+        if save is True:
+            self.save()
+        return counts
+
+    #
+    # Queries
+    #
+    def _clear_lookups(self):
+        self._by_guid = None
+        self._by_name = None
+        self._referenced_by = None
+
+    def _build_lookups(self):
+        if self._by_guid is not None:
+            return
+        self._by_guid = {}
+        self._by_name = {}
+        self._referenced_by = {}
+        for entry in self.entries.values():
+            if entry['guid'] is not None:
+                self._by_guid.setdefault(entry['guid'], []).append(entry)
+            if entry['name'] is not None:
+                self._by_name.setdefault(entry['name'], []).append(entry)
+            for ref in entry['references']:
+                for key in [ref['name'], ref['fqn']]:
+                    if key is not None:
+                        self._referenced_by.setdefault(key, []).append(entry)
+
+    def find_by_guid(self, guid: str) -> List[Dict]:
+        self._build_lookups()
+        return list(self._by_guid.get(guid, []))
+
+    def find_by_name(self, name: str, content_type: Optional[str] = None) -> List[Dict]:
+        self._build_lookups()
+        return [e for e in self._by_name.get(name, []) if content_type is None or e['content_type'] == content_type]
+
+    def find_by_type(self, content_type: str) -> List[Dict]:
+        return [e for e in self.entries.values() if e['content_type'] == content_type]
+
+    # Files that reference the object, by its name or its GUID (fqn)
+    def referencing(self, name_or_guid: str) -> List[Dict]:
+        self._build_lookups()
+        return list(self._referenced_by.get(name_or_guid, []))
+
+    def errors(self) -> List[Dict]:
+        return [e for e in self.entries.values() if e['error'] is not None]
+
+    # name : guid for every object of the type(s), e.g. to build the name_to_guid_map used for FQN remapping
+    def name_to_guid_map(self, content_types: Optional[List[str]] = None) -> Dict[str, str]:
+        name_map = {}
+        for e in self.entries.values():
+            if e['name'] is None or e['guid'] is None:
+                continue
+            if content_types is None or e['content_type'] in content_types:
+                name_map[e['name']] = e['guid']
+        return name_map
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description='Index a directory of TML files and query the index')
+    parser.add_argument("directory", type=str, help="directory of TML files, searched recursively.")
+    parser.add_argument("--index_file", type=str, required=False,
+                        help="index file, default .tml_index.json in the directory.")
+    parser.add_argument("--max_workers", type=int, required=False, help="parsing processes, default CPU count.")
+    parser.add_argument("--guid", type=str, required=False, help="only the object with this GUID.")
+    parser.add_argument("--name", type=str, required=False, help="only objects with this name.")
+    parser.add_argument("--type", type=str, required=False, help="only objects of this type, e.g. worksheet.")
+    parser.add_argument("--referencing", type=str, required=False,
+                        help="only objects referencing this object name or GUID.")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = get_args()
+    index = TMLDirectoryIndex(args.directory, index_file=args.index_file)
+    counts = index.scan(max_workers=args.max_workers)
+    print('{added} added, {updated} updated, {unchanged} unchanged, {removed} removed'.format(**counts),
+          file=sys.stderr)
+
+    if args.guid is not None:
+        entries = index.find_by_guid(args.guid)
+    elif args.name is not None:
+        entries = index.find_by_name(args.name, content_type=args.type)
+    elif args.referencing is not None:
+        entries = index.referencing(args.referencing)
+    elif args.type is not None:
+        entries = index.find_by_type(args.type)
+    else:
+        entries = list(index.entries.values())
+    if args.type is not None:
+        entries = [e for e in entries if e['content_type'] == args.type]
+    for e in sorted(entries, key=lambda e: e['path']):
+        print("{}|{}|{}".format(e['path'], e['name'], e['guid']))
+    for e in index.errors():
+        print('Could not parse {}: {}'.format(e['path'], e['error']), file=sys.stderr)
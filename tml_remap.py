@@ -0,0 +1,199 @@
+from typing import Optional, Dict, List, Tuple
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+import json
+import os
+import re
+
+import yaml
+
+from thoughtspot_tml import TML, YAMLTML
+
+from lazy_tml import load_yaml, tml_content_type
+#
+# Rewrites the references between TML objects (Worksheet / View / Answer tables, Liveboard visualization tables,
+# Table joins_with destinations) to point at new GUIDs, across many documents at once.
+# Replaces calling Worksheet.remap_tables_to_new_fqn, Table.remap_joins_to_new_fqn and
+# Pinboard.remap_worksheets_to_new_fqn on each object in turn, with the same changes to each reference:
+#   Worksheet, View tables          'fqn' set, 'name' kept
+#   Answer, Liveboard tables        'fqn' set, 'name' moved to 'id' (as Answer.change_worksheets_by_fqn)
+#   Table joins_with destinations   'fqn' set, 'name' removed
+# References already remapped (only 'id' or an 'fqn' left) are looked up by 'id' or by their current fqn, so
+# running the remapper twice gives the same result. 'substitutions' counts the references actually changed.
+#
+# The name : GUID map is compiled once per remapper (and once per worker process for remap_files / remap_texts)
+# into a single lookup of names and old GUIDs. Each document gets a report:
+#   {'path', 'guid', 'content_type', 'name', 'substitutions', 'unmatched': [names not in the map]}
+#
+# Usage:
+#   remapper = BulkFQNRemapper(name_to_guid_map)   # e.g. TMLDirectoryIndex(...).name_to_guid_map()
+#   reports = remapper.remap_files(filenames, output_dir='release/')
+#
+
+
+# YAMLTML.dump_tml_object output, using the C LibYAML emitter when PyYAML was built with it (the pure Python
+# Dumper is most of the time spent per document). The quoting fixes after dumping are the same as YAMLTML's
+def _dump_tml(tml_dict: Dict) -> str:
+    if not hasattr(yaml, 'CDumper'):
+        return YAMLTML.dump_tml_object(TML(tml_dict))
+    dumped = yaml.dump(tml_dict, Dumper=yaml.CDumper, width=10000, sort_keys=False)
+
+    def double_quoted(key_format: str):
+        def replace(matchobj):
+            value = matchobj.group(2)
+            if value[0] == "'":
+                value = value[1:-1]
+            return key_format.format(value.replace('"', '\\"'))
+        return replace
+
+    dumped = re.sub("(expr: )(.+)\n", double_quoted('expr: "{}"\n'), dumped)
+    dumped = re.sub("('on': )(.+)\n", double_quoted('"on": "{}"\n'), dumped)
+    dumped = re.sub(": '(.+)'", lambda m: ': "{}"'.format(m.group(1).replace('"', '\\"')), dumped)
+    return dumped.replace("''", '""')
+
+
+# Per worker process, set by the pool initializer so the map is sent to each process only once
+_worker_remapper = None
+
+
+def _init_worker(name_to_guid_map: Dict[str, str], guid_to_guid_map: Optional[Dict[str, str]]):
+    global _worker_remapper
+    _worker_remapper = BulkFQNRemapper(name_to_guid_map, guid_to_guid_map)
+
+
+def _remap_text_in_worker(tml_text: str) -> Tuple[str, Dict]:
+    return _worker_remapper.remap_text(tml_text)
+
+
+def _remap_file_in_worker(args) -> Dict:
+    return _worker_remapper.remap_file(*args)
+
+
+class BulkFQNRemapper:
+    def __init__(self, name_to_guid_map: Dict[str, str], guid_to_guid_map: Optional[Dict[str, str]] = None):
+        # Kept as given, to hand to worker processes
+        self.name_to_guid_map = name_to_guid_map
+        # Optional old GUID : new GUID map (as used by TML.replace_fqns_from_map), for references that only
+        # have an fqn from another environment
+        self.guid_to_guid_map = guid_to_guid_map
+        # Compiled lookup: names first, then old GUIDs, which can't collide with names in practice
+        self._lookup = {}
+        if guid_to_guid_map is not None:
+            self._lookup.update(guid_to_guid_map)
+        self._lookup.update(name_to_guid_map)
+        self._new_guids = set(self._lookup.values())
+
+    def _remap_reference(self, ref: Dict, name_handling: str, report: Dict):
+        # name_handling: 'keep' the name, move it to 'id', or 'remove' it
+        name = ref.get('name', ref.get('id'))
+        new_guid = self._lookup.get(name) if name is not None else None
+        if new_guid is None and ref.get('fqn') is not None:
+            new_guid = self._lookup.get(ref['fqn'])
+            # Already pointing at one of the new GUIDs, with no name left to look up
+            if new_guid is None and ref['fqn'] in self._new_guids:
+                return
+        if new_guid is None:
+            report['unmatched'].append(name if name is not None else ref.get('fqn'))
+            return
+        changed = ref.get('fqn') != new_guid
+        ref['fqn'] = new_guid
+        if 'name' in ref and name_handling != 'keep':
+            if name_handling == 'id':
+                ref['id'] = ref['name']
+            del ref['name']
+            changed = True
+        if changed is True:
+            report['substitutions'] += 1
+
+    # Remaps one document in place: a Dict / OrderedDict of parsed TML, a LazyTMLMapping, or a thoughtspot_tml TML
+    # object over either (e.g. from lazy_tml_object). Values changed in a LazyTMLMapping are kept by the mapping
+    def remap(self, tml_dict_or_object, path: Optional[str] = None) -> Dict:
+        tml_dict = tml_dict_or_object.tml if isinstance(tml_dict_or_object, TML) else tml_dict_or_object
+        content_type = tml_content_type(tml_dict)
+        content = tml_dict.get(content_type) if content_type is not None else None
+        report = {'path': path, 'guid': tml_dict.get('guid', tml_dict.get('id')), 'content_type': content_type,
+                  'name': None, 'substitutions': 0, 'unmatched': []}
+        if not isinstance(content, Mapping):
+            return report
+        report['name'] = content.get('name')
+
+        if content_type in ['worksheet', 'view']:
+            for t in content.get('tables') or []:
+                self._remap_reference(t, 'keep', report)
+        elif content_type == 'answer':
+            for t in content.get('tables') or []:
+                self._remap_reference(t, 'id', report)
+        elif content_type in ['pinboard', 'liveboard']:
+            for viz in content.get('visualizations') or []:
+                for t in (viz.get('answer') or {}).get('tables') or []:
+                    self._remap_reference(t, 'id', report)
+        elif content_type == 'table':
+            for join in content.get('joins_with') or []:
+                if join.get('destination') is not None:
+                    self._remap_reference(join['destination'], 'remove', report)
+        return report
+
+    # Single pass over documents already in memory. Each is only a few dictionary lookups per reference, so
+    # this is faster in process than shipping the documents to worker processes and back
+    def remap_objects(self, tml_dicts_or_objects: List) -> List[Dict]:
+        return [self.remap(t) for t in tml_dicts_or_objects]
+
+    # YAML or JSON TML text in, remapped text (in the same format) and report out
+    def remap_text(self, tml_text: str, path: Optional[str] = None) -> Tuple[str, Dict]:
+        is_json = tml_text.lstrip().startswith('{')
+        tml_dict = json.loads(tml_text) if is_json else load_yaml(tml_text)
+        report = self.remap(tml_dict, path=path)
+        if report['substitutions'] == 0:
+            # Nothing changed, so the original text is returned byte for byte
+            return tml_text, report
+        if is_json:
+            return json.dumps(tml_dict, indent=2), report
+        return _dump_tml(tml_dict), report
+
+    # Rewrites the file in place, or writes it under output_dir with the same filename
+    def remap_file(self, filename: str, output_dir: Optional[str] = None) -> Dict:
+        with open(filename, 'r', encoding='utf-8') as fh:
+            tml_text = fh.read()
+        new_text, report = self.remap_text(tml_text, path=filename)
+        output_file = os.path.join(output_dir, os.path.basename(filename)) if output_dir is not None else filename
+        if new_text is not tml_text or output_file != filename:
+            with open(output_file, 'w', encoding='utf-8') as fh:
+                fh.write(new_text)
+        return report
+
+    def _pool(self, max_workers: Optional[int]) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                   initargs=(self.name_to_guid_map, self.guid_to_guid_map))
+
+    # Parsing and dumping YAML is CPU bound, so many documents are spread over worker processes.
+    # Results are in the order of the inputs
+    def remap_texts(self, tml_texts: List[str], max_workers: Optional[int] = None) -> List[Tuple[str, Dict]]:
+        if len(tml_texts) < 20 or max_workers == 1:
+            return [self.remap_text(t) for t in tml_texts]
+        with self._pool(max_workers) as executor:
+            return list(executor.map(_remap_text_in_worker, tml_texts,
+                                     chunksize=max(1, len(tml_texts) // (4 * (max_workers or os.cpu_count() or 1)))))
+
+    def remap_files(self, filenames: List[str], output_dir: Optional[str] = None,
+                    max_workers: Optional[int] = None) -> List[Dict]:
+        if output_dir is not None:
+            os.makedirs(output_dir, exist_ok=True)
+        args = [(f, output_dir) for f in filenames]
+        if len(args) < 20 or max_workers == 1:
+            return [self.remap_file(*a) for a in args]
+        with self._pool(max_workers) as executor:
+            return list(executor.map(_remap_file_in_worker, args,
+                                     chunksize=max(1, len(args) // (4 * (max_workers or os.cpu_count() or 1)))))
+
+
+# Totals over the reports from one run: documents changed, substitutions, and each unmatched name with the
+# number of documents it was missing from
+def remap_summary(reports: List[Dict]) -> Dict:
+    unmatched = {}
+    for r in reports:
+        for name in set(r['unmatched']):
+            unmatched[name] = unmatched.get(name, 0) + 1
+    return {'documents': len(reports),
+            'documents_changed': len([r for r in reports if r['substitutions'] > 0]),
+            'substitutions': sum(r['substitutions'] for r in reports),
+            'unmatched': unmatched}